@@ -2,7 +2,7 @@
 from PySide6.QtWidgets import (
     QWidget, QTabWidget, QListWidget, QListWidgetItem, QVBoxLayout, QHBoxLayout,
     QPushButton, QInputDialog, QMessageBox, QLineEdit, QDialog, QTextEdit, QLabel,
-    QFileDialog, QMenu, QDialogButtonBox, QCheckBox, QStyle, QFrame, QApplication, QLayout,
+    QFileDialog, QMenu, QDialogButtonBox, QCheckBox, QComboBox, QStyle, QFrame, QApplication, QLayout,
 )
 from PySide6.QtCore import Qt, QUrl, QTimer, QRect, QPropertyAnimation, QEvent, QObject,QMimeData
 from PySide6.QtGui import QBrush, QColor, QFont, QDesktopServices, QIcon, QDrag
@@ -28,8 +28,11 @@ from cods.task_manager import (
     TaskManager, SETTINGS_FOLDER, SETTINGS_FILE, CURRENT_VERSION, _save_json, _load_json
 )
 from cods.dialogs import SortDialog
+from cods.constants import COPY_STRATEGIES, ARCHIVE_LEVELS, ARCHIVE_FORMATS
+from cods.copy_strategies import set_copy_strategy, get_copy_strategy
+from cods.archive_writer import set_archive_level, get_archive_level, set_archive_format, get_archive_format
 
-from .dialogs import FolderSelectionDialog
+from .dialogs import FolderSelectionDialog, BackupBrowserDialog
 from .task_management import TaskManagementMixin
 from .command_management import CommandManagementMixin
 from .google_drive import GoogleDriveMixin
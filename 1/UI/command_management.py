@@ -6,7 +6,7 @@ from PySide6.QtCore import Qt, QUrl
 from PySide6.QtWidgets import (
     QInputDialog, QMessageBox, QDialog, QVBoxLayout, QLineEdit, QTextEdit, QLabel,
     QListWidget, QPushButton, QMenu, QDialogButtonBox, QCheckBox, QFileDialog,
-    QListWidgetItem, QHBoxLayout, QFrame
+    QListWidgetItem, QHBoxLayout, QFrame, QProgressDialog
 )
 from PySide6.QtGui import QDesktopServices, QColor, QFont
 
@@ -51,7 +51,7 @@ class CommandManagementMixin:
     def edit_command_description(self, item):
         if not item or item.text().startswith("[Папка]"): return
 
-        command_manager_idx = item.data(Qt.UserRole + 1)
+        command_manager_idx = self._item_command_index(item)
         if command_manager_idx is None: _show_warning_mixin(self, "Ошибка", "Нет индекса команды."); return
 
         commands_in_folder = self.task_manager.useful_commands.get(self.current_folder, [])
@@ -79,6 +79,17 @@ class CommandManagementMixin:
 
         self._add_attached_files_ui(layout, command_data, command_manager_idx, dialog)
 
+        # Слежение за исходной папкой: изменения проекта сами попадают во вложения
+        sources = command_data.get('source_folders') or {}
+        watch_checkbox = QCheckBox("Следить за исходной папкой (обновлять вложения автоматически)")
+        watch_checkbox.setChecked(bool(command_data.get('watch_source')))
+        watch_checkbox.setEnabled(bool(sources))
+        watch_checkbox.setToolTip("\n".join(path for path in (sources.get('ino_folder'), sources.get('py_folder')) if path)
+                                  or "Сначала прикрепите папку с .ino или .py")
+        watch_checkbox.toggled.connect(
+            lambda checked, command_id=command_data.id: self.task_manager.set_watch_source_by_id(command_id, checked))
+        layout.addWidget(watch_checkbox)
+
         button_box = QDialogButtonBox()
         save_btn = button_box.addButton("Сохранить", QDialogButtonBox.AcceptRole)
         attach_btn = button_box.addButton("Прикрепить/Изменить", QDialogButtonBox.ActionRole)
@@ -155,17 +166,37 @@ class CommandManagementMixin:
         files_list_widget.clear()
         full_paths_map = {}
         subfolder_rel = command_data.get('subfolder')
+        ref_paths = command_data.get('ref_paths') or []
 
-        if not subfolder_rel:
+        if not subfolder_rel and not ref_paths:
             files_list_widget.addItem("Нет прикрепленных ресурсов (нет субфолдера).")
             files_list_widget.setEnabled(False)
             return full_paths_map
 
-        subfolder_abs = self.tasks_file.parent / subfolder_rel
+        subfolder_abs = self.tasks_file.parent / (subfolder_rel or '')
         types_map = {'ino_paths': '[INO]', 'py_paths': '[PY]', 'pdf_paths': '[PDF]', 'img_paths': '[IMG]'}
         has_attachments = False
 
+        # Ссылки: исходный путь, а если его нет (импорт на другой машине) - снимок из архива
+        for ref_path in ref_paths:
+            display_text = f"[REF] {ref_path}"
+            resolved = self.task_manager.resolve_reference(command_data, ref_path)
+            item = QListWidgetItem(display_text)
+            item.setData(Qt.UserRole, str(resolved or ref_path))
+            item.setData(Qt.UserRole + 1, 'ref_paths')
+            full_paths_map[display_text] = str(resolved or ref_path)
+            if resolved is None:
+                item.setForeground(QColor("red"))
+                item.setToolTip(f"НЕ НАЙДЕНО:\n{ref_path}")
+            elif resolved != Path(ref_path):
+                item.setToolTip(f"Исходный путь недоступен, открывается снимок из архива:\n{resolved}")
+            else:
+                item.setToolTip(f"Ссылка (без копирования):\n{ref_path}")
+            files_list_widget.addItem(item)
+            has_attachments = True
+
         for key, prefix in types_map.items():
+            if not subfolder_rel: break
             relative_paths = command_data.get(key, [])
             for rel_path in relative_paths:
                 display_text = f"{prefix} {rel_path}"
@@ -201,6 +232,8 @@ class CommandManagementMixin:
             if full_path_str:
                 full_path = Path(full_path_str)
                 if full_path.exists():
+                    # Правка открытого файла не должна менять одинаковые вложения других команд
+                    self.task_manager.detach_attachment(full_path)
                     if not QDesktopServices.openUrl(QUrl.fromLocalFile(str(full_path))):
                         _show_warning_mixin(self, "Ошибка", f"Не удалось открыть '{full_path.name}'.")
                 else:
@@ -211,7 +244,7 @@ class CommandManagementMixin:
         if not selected: _show_warning_mixin(self, "Нет выбора", "..."); return
         item = selected[0]
         if item.text().startswith("[Папка]"): _show_warning_mixin(self, "Неверный выбор", "..."); return
-        command_manager_idx = item.data(Qt.UserRole + 1)
+        command_manager_idx = self._item_command_index(item)
         if command_manager_idx is None: _show_warning_mixin(self, "Ошибка", "..."); return
         self._open_attach_dialog(command_manager_idx, self.current_folder, parent_dialog=None)
 
@@ -222,11 +255,12 @@ class CommandManagementMixin:
             self._handle_attachment_selection(attach_type, command_manager_idx, folder_key, parent_dialog)
 
     def _get_attachment_options(self):
-        return ["Ничего", "Папку с .ino", "Папку с .py", "PDF файлы", "Изображения (PNG/JPG и др.)"]
+        return ["Ничего", "Папку с .ino", "Папку с .py", "PDF файлы", "Изображения (PNG/JPG и др.)",
+                "Ссылку на папку (без копирования)"]
 
     def _handle_file_selection(self, attach_type, parent=None):
         attachments = {'ino_folder': None, 'py_folder': None, 'additional_folders': None, 'pdf_files': None,
-                       'img_files': None}
+                       'img_files': None, 'ref_paths': None}
         if attach_type == "Папку с .ino":
             folder = QFileDialog.getExistingDirectory(parent, "Выберите папку INO", "")
             if folder: attachments['ino_folder'] = folder
@@ -249,6 +283,9 @@ class CommandManagementMixin:
             files, _ = QFileDialog.getOpenFileNames(parent, "Выберите изображения", "",
                                                     "Images (*.png *.jpg *.jpeg *.gif *.bmp)")
             if files: attachments['img_files'] = files
+        elif attach_type == "Ссылку на папку (без копирования)":
+            folder = QFileDialog.getExistingDirectory(parent, "Выберите папку для ссылки", "")
+            if folder: attachments['ref_paths'] = [folder]
         return attachments
 
     def _handle_attachment_selection(self, attach_type, command_manager_idx, folder_key, parent_dialog=None):
@@ -256,12 +293,79 @@ class CommandManagementMixin:
         attachments = self._handle_file_selection(attach_type, self)
         options.update({k: v for k, v in attachments.items() if v})
 
+        if 'ref_paths' in options:
+            # Ссылка не копируется: прикрепление мгновенное, содержимое попадет только в архив экспорта
+            command_id = self.task_manager.useful_commands[folder_key][command_manager_idx].id
+            if self.task_manager.add_command_references_by_id(command_id, options['ref_paths']):
+                self._on_attachment_import_finished(None, None, command_id, parent_dialog, True, [])
+            return
+
         if not any(k in options for k in ['ino_folder', 'py_folder', 'pdf_files', 'img_files']):
             # Если ничего не выбрано для прикрепления, выходим
             return
 
-        # Вызываем менеджер для копирования и обновления данных (без try)
-        success, copied_files = self.task_manager.update_command_folders(command_manager_idx, **options)
+        # Копирование идет в фоне; пути вложений попадут в команду только по завершении
+        command = self.task_manager.useful_commands[folder_key][command_manager_idx]
+        command_id = command.id
+        if self._attachments_already_attached(command, options):
+            answer = QMessageBox.question(
+                self, "Обновление вложений",
+                "Такие ресурсы уже прикреплены. Обновить их на месте (скопировать только изменения)?\n"
+                "«Нет» - прикрепить рядом новой копией.",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes)
+            if answer == QMessageBox.Cancel: return
+            options['sync'] = answer == QMessageBox.Yes
+        job = self.task_manager.start_attachment_import(command_id, **options)
+        if job is None:
+            _show_warning_mixin(self, "Ошибка", "Ресурсы к этой команде уже прикрепляются.")
+            return
+
+        progress_dialog = QProgressDialog("Подготовка...", "Отмена", 0, 1000, parent_dialog or self)
+        progress_dialog.setWindowTitle("Прикрепление ресурсов")
+        # Модальное окно: команду нельзя переместить или удалить, пока идет копирование
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(300)
+        progress_dialog.setAutoClose(False)
+        progress_dialog.setAutoReset(False)
+        progress_dialog.canceled.connect(job.cancel)
+        job.progress.connect(lambda done, total, files, current:
+                             self._on_attachment_progress(progress_dialog, job, done, total, files, current))
+        job.finished.connect(lambda success, copied_files:
+                             self._on_attachment_import_finished(progress_dialog, job, command_id, parent_dialog,
+                                                                 success, copied_files))
+        job.start()
+
+    def _attachments_already_attached(self, command, options):
+        """Есть ли среди выбранных источников ресурс, уже прикрепленный под тем же именем."""
+        for option_key, paths_key in (('ino_folder', 'ino_paths'), ('py_folder', 'py_paths'),
+                                      ('pdf_files', 'pdf_paths'), ('img_files', 'img_paths')):
+            sources = options.get(option_key) or []
+            if not isinstance(sources, list): sources = [sources]
+            if any(Path(source).name in (command.get(paths_key) or []) for source in sources):
+                return True
+        return False
+
+    def _on_attachment_progress(self, progress_dialog, job, done, total, files, current):
+        """Обновляет окно прогресса прикрепления."""
+        progress_dialog.setValue(int(done * 1000 / total) if total else 0)
+        speed_mb = job.throughput() / (1024 * 1024)
+        progress_dialog.setLabelText(f"Файлов: {files}, {done / (1024 * 1024):.1f} из {total / (1024 * 1024):.1f} МБ"
+                                     f" ({speed_mb:.1f} МБ/с)\n{current}")
+
+    def _on_attachment_import_finished(self, progress_dialog, job, command_id, parent_dialog, success, copied_files):
+        """Завершение фонового прикрепления: обновление списков и сообщение пользователю."""
+        if progress_dialog is not None: progress_dialog.close()
+        # job=None - ссылки: прикрепляются сразу, без фонового задания
+        if job is not None and job.cancelled:
+            QMessageBox.information(self, "Отменено", "Прикрепление отменено, скопированные файлы удалены.")
+            return
+        if job is not None and job.error is not None:
+            _show_critical_mixin(self, "Ошибка", f"Не удалось прикрепить ресурсы: {job.error}")
+            return
+
+        location = self.task_manager.command_location(command_id)
+        if location is None: return
+        folder_key, command_manager_idx = location
 
         if success:
             # Обновляем главный список команд в основном окне
@@ -302,7 +406,13 @@ class CommandManagementMixin:
                      pass # Не нашли виджеты, ничего не делаем
 
             # Сообщаем об успехе пользователю
-            if copied_files:
+            if job is not None and job.sync_report is not None:
+                report = job.sync_report
+                QMessageBox.information(self, "Успех",
+                                        f"Вложения обновлены: новых {len(report['added'])}, "
+                                        f"измененных {len(report['updated'])}, удаленных {len(report['removed'])}, "
+                                        f"без изменений {report['unchanged']}.")
+            elif copied_files:
                 QMessageBox.information(self, "Успех", f"Ресурсы прикреплены ({len(copied_files)} скопировано).")
             else:
                 # Если файлы уже были, копирования могло не быть
@@ -326,6 +436,8 @@ class CommandManagementMixin:
             return
 
         confirm_msg = "Удалить выбранное?\n" + "\n".join([f"- {p} ({k.split('_')[0].upper()})" for p, k in items_to_remove]) + "\n\nФайлы/папки будут удалены с диска!"
+        if any(k == 'ref_paths' for _, k in items_to_remove):
+            confirm_msg += "\n(Кроме ссылок: у них убирается только ссылка, исходные файлы не удаляются.)"
         if QMessageBox.question(self, "Подтверждение", confirm_msg, QMessageBox.Yes | QMessageBox.No, QMessageBox.No) == QMessageBox.Yes:
             commands_list = self.task_manager.useful_commands.get(folder_key)
             # Минимальная проверка
@@ -335,6 +447,16 @@ class CommandManagementMixin:
             command_data = commands_list[command_manager_idx]
             subfolder_rel = command_data.get('subfolder')
 
+            # Ссылки: внешние файлы не трогаются
+            ref_items = [p for p, k in items_to_remove if k == 'ref_paths']
+            for ref_path in ref_items:
+                self.task_manager.remove_command_reference(folder_key, command_manager_idx, ref_path)
+            items_to_remove = [(p, k) for p, k in items_to_remove if k != 'ref_paths']
+            if ref_items and not items_to_remove:
+                self._post_removal_update(command_manager_idx, folder_key, parent_dialog)
+                QMessageBox.information(self, "Удалено", "Выбранные ссылки убраны.")
+                return
+
             if not subfolder_rel:
                 # _show_warning_mixin(self, "Ошибка", "Субфолдер команды не найден.")
                 return
@@ -366,6 +488,7 @@ class CommandManagementMixin:
 
             # Если что-то было удалено из списков команды
             if something_removed:
+                self.task_manager.collect_unused_blobs() # Блобы удаленных вложений
                 # Проверяем, остались ли вообще какие-либо прикрепленные файлы/папки
                 is_subfolder_empty = not any(command_data.get(k) for k in types_map_keys)
 
@@ -381,7 +504,7 @@ class CommandManagementMixin:
                          pass # Не удаляем непустую папку
 
                 # Сохраняем изменения в tasks.json (без try)
-                self.task_manager.save_tasks()
+                self.task_manager.mark_commands_changed(folder_key)
                 # Вызываем функцию для обновления UI (включая скрытие секции, если надо)
                 self._post_removal_update(command_manager_idx, folder_key, parent_dialog)
 
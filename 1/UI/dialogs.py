@@ -1,6 +1,7 @@
 
 # UI/dialogs.py
-from . import QDialog, QVBoxLayout, QLabel, QCheckBox, QDialogButtonBox, os
+from . import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QCheckBox, QDialogButtonBox, QTabWidget, QListWidget,
+               QListWidgetItem, QPushButton, QMessageBox, QStyle, QWidget, Qt, Path, os)
 
 class FolderSelectionDialog(QDialog):
     def __init__(self, folder_path, parent=None):
@@ -27,4 +28,104 @@ class FolderSelectionDialog(QDialog):
         layout.addWidget(button_box)
 
     def get_selected_folders(self):
-        return [folder for folder, checkbox in self.checkboxes.items() if checkbox.isChecked()]
\ No newline at end of file
+        return [folder for folder, checkbox in self.checkboxes.items() if checkbox.isChecked()]
+
+
+class BackupBrowserDialog(QDialog):
+    """Просмотр резервной копии (только чтение): выбранное восстанавливается в текущие данные."""
+
+    def __init__(self, backup, app, parent=None):
+        super().__init__(parent)
+        self.backup = backup
+        self.app = app # TaskApp: оформление списков и текущие данные
+        self.current_folder = 'root'
+        self.setWindowTitle(f"Копия: {backup.path.name} (только чтение)")
+        self.setMinimumSize(600, 500)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        self.tabs = QTabWidget()
+        layout.addWidget(self.tabs)
+
+        self.task_list_widget = self._add_list_tab("Задачи", QListWidget.ExtendedSelection)
+        self.completed_task_list_widget = self._add_list_tab("Выполненные задачи", QListWidget.ExtendedSelection)
+        self.command_list_widget = self._add_list_tab("Команды", QListWidget.SingleSelection)
+        self.command_list_widget.itemDoubleClicked.connect(self.open_folder)
+        self.current_path_label = QLabel()
+        self.back_button = QPushButton("Назад")
+        self.back_button.clicked.connect(self.go_back)
+        nav_layout = QHBoxLayout()
+        nav_layout.addWidget(self.back_button)
+        nav_layout.addWidget(self.current_path_label)
+        nav_layout.addStretch()
+        self.tabs.widget(2).layout().insertLayout(0, nav_layout)
+
+        button_layout = QHBoxLayout()
+        restore_button = QPushButton("Восстановить")
+        restore_button.setToolTip("Добавить выбранные задачи, команду или папку (с вложениями) в текущие данные")
+        restore_button.clicked.connect(self.restore_selected)
+        close_button = QPushButton("Закрыть")
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(restore_button)
+        button_layout.addStretch()
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.app._populate_list(self.task_list_widget, self.backup.pending_tasks)
+        self.app._populate_list(self.completed_task_list_widget, self.backup.completed_tasks)
+        self._update_command_list()
+
+    def _add_list_tab(self, title, selection_mode):
+        tab = QWidget()
+        tab_layout = QVBoxLayout(tab)
+        tab_layout.setContentsMargins(5, 5, 5, 5)
+        list_widget = QListWidget(parent=tab)
+        list_widget.setAlternatingRowColors(True)
+        list_widget.setSelectionMode(selection_mode)
+        tab_layout.addWidget(list_widget)
+        self.tabs.addTab(tab, title)
+        return list_widget
+
+    def _update_command_list(self):
+        """Папки и команды текущей папки копии (как в основном списке команд)."""
+        widget = self.command_list_widget
+        widget.clear()
+        for key in sorted(self.backup.child_command_folders(self.current_folder), key=lambda k: Path(k).name.lower()):
+            item = QListWidgetItem(f"[Папка] {Path(key).name}")
+            item.setIcon(self.style().standardIcon(QStyle.SP_DirIcon))
+            item.setData(Qt.UserRole, key)
+            widget.addItem(item)
+        self.app._populate_list(widget, self.backup.useful_commands.get(self.current_folder, []), append=True)
+        self.back_button.setEnabled(self.current_folder != 'root')
+        self.current_path_label.setText(f"Папка: {self.current_folder.replace('/', ' / ')}")
+
+    def open_folder(self, item):
+        if item.text().startswith("[Папка]"):
+            self.current_folder = item.data(Qt.UserRole)
+            self._update_command_list()
+
+    def go_back(self):
+        self.current_folder = '/'.join(self.current_folder.split('/')[:-1]) or 'root'
+        self._update_command_list()
+
+    def restore_selected(self):
+        widget = self.tabs.currentWidget().findChild(QListWidget)
+        selected = widget.selectedItems()
+        if not selected:
+            QMessageBox.warning(self, "Ничего не выбрано", "Выберите задачи, команду или папку."); return
+        task_manager = self.app.task_manager
+        try:
+            if widget is not self.command_list_widget:
+                restored = task_manager.restore_backup_tasks(self.backup, [item.data(Qt.UserRole) for item in selected])
+            elif selected[0].text().startswith("[Папка]"):
+                restored = task_manager.restore_backup_folder(self.backup, selected[0].data(Qt.UserRole))
+            else:
+                restored = task_manager.restore_backup_command(self.backup, selected[0].data(Qt.UserRole + 1))
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка восстановления", f"Не удалось восстановить из копии:\n{e}"); return
+        if restored:
+            self.app.update_task_lists()
+            QMessageBox.information(self, "Восстановление", "Выбранное восстановлено из копии.")
+        else:
+            QMessageBox.warning(self, "Ошибка восстановления", "Не удалось сохранить восстановленные данные.")
\ No newline at end of file
@@ -1,24 +1,31 @@
 import logging
 from pathlib import Path
 from . import QFileDialog, QMessageBox
+from cods.backup_manifest import next_incremental_path
+from cods.archive_writer import get_archive_format, archive_path_for
+from cods.tar_archive import resolve_archive_format, detect_archive_format
+from cods.backup_browser import BackupArchive
+from .dialogs import BackupBrowserDialog
+
+ARCHIVE_FILTER = "Archives (*.zip *.tar.zst *.tar.gz);;All Files (*)"
 
 class ExportImportMixin:
     def export_tasks(self):
         """
-        Обрабатывает экспорт задач в ZIP-архив.
+        Обрабатывает экспорт задач в архив (формат - из настроек).
         Запрашивает у пользователя имя файла для сохранения.
         """
-        default_filename = "tasks_backup.zip"
+        archive_format = resolve_archive_format(get_archive_format())
+        default_filename = f"tasks_backup.{archive_format}"
         archive_path, _ = QFileDialog.getSaveFileName(
             self,
-            "Экспорт задач в ZIP-архив",
+            "Экспорт задач в архив",
             default_filename,
-            "ZIP Archives (*.zip);;All Files (*)"
+            ARCHIVE_FILTER
         )
 
         if archive_path:
-            if not archive_path.lower().endswith(".zip"):
-                archive_path += ".zip"
+            archive_path = archive_path_for(archive_path, archive_format)
             success = self.task_manager.export_tasks(archive_path)
             if success:
                 QMessageBox.information(self, "Успех", f"Задачи успешно экспортированы в:\n{archive_path}")
@@ -26,28 +33,68 @@ class ExportImportMixin:
                 QMessageBox.warning(self, "Ошибка экспорта", "Не удалось экспортировать задачи. Проверьте лог для деталей.")
         self._hide_settings_panel()
 
+    def export_tasks_incremental(self):
+        """
+        Инкрементальная копия: в архив попадают только файлы, изменившиеся после выбранной копии.
+        Новый архив создается рядом с ней; для восстановления нужны все архивы цепочки.
+        """
+        base_archive, _ = QFileDialog.getOpenFileName(
+            self,
+            "Инкрементальная копия: выберите последнюю копию цепочки",
+            "",
+            "ZIP Archives (*.zip);;All Files (*)"
+        )
+
+        if base_archive:
+            archive_path = next_incremental_path(base_archive)
+            success = self.task_manager.export_tasks(archive_path, base_archive=base_archive)
+            if success:
+                QMessageBox.information(self, "Успех", f"Изменения сохранены в:\n{archive_path}")
+            else:
+                QMessageBox.warning(self, "Ошибка экспорта", "Не удалось создать инкрементальную копию.")
+        self._hide_settings_panel()
+
     def import_tasks(self):
         """
-        Обрабатывает импорт задач из папки или ZIP-архива.
-        Позволяет пользователю выбрать папку или ZIP-файл.
+        Обрабатывает импорт задач из папки или архива (ZIP, tar.zst, tar.gz).
+        Позволяет пользователю выбрать папку или файл архива.
         """
-        filters = "ZIP Archives (*.zip);;All Files (*)"
         selected_path_str, _ = QFileDialog.getOpenFileName(
             self,
-            "Импорт задач: Выберите папку или ZIP-архив",
+            "Импорт задач: Выберите папку или архив",
             "",
-            filters
+            ARCHIVE_FILTER
         )
 
         if selected_path_str:
             selected_path = Path(selected_path_str)
-            if selected_path.exists() and (selected_path.is_dir() or selected_path.suffix.lower() == '.zip'):
+            if selected_path.is_dir() or (selected_path.is_file() and detect_archive_format(selected_path) is not None):
                 success = self.task_manager.import_tasks(selected_path)
                 if success and hasattr(self, 'update_task_lists'):
                     self.update_task_lists()
             else:
-                QMessageBox.warning(self, "Неверный выбор", f"Выбранный путь не является папкой или .zip архивом:\n{selected_path}")
+                QMessageBox.warning(self, "Неверный выбор", f"Выбранный путь не является папкой или архивом:\n{selected_path}")
+        self._hide_settings_panel()
+
+    def open_backup(self):
+        """
+        Открывает резервную копию только для просмотра: архив не распаковывается,
+        восстанавливаются лишь выбранные задачи, команда или папка.
+        """
+        archive_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "Просмотр резервной копии",
+            "",
+            "ZIP Archives (*.zip);;All Files (*)"
+        )
         self._hide_settings_panel()
+        if not archive_path: return
+        try:
+            backup = BackupArchive(archive_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка открытия копии", f"Не удалось прочитать копию:\n{e}")
+            return
+        BackupBrowserDialog(backup, self, self).exec()
 
     def _hide_settings_panel(self):
         """Скрывает панель настроек, если она открыта."""
@@ -2,8 +2,6 @@
 
 import datetime
 import pickle
-import io
-import time
 import webbrowser
 import zipfile
 import shutil
@@ -18,6 +16,10 @@ from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 
 from .utils import _show_warning_mixin, _show_critical_mixin
+from cods.constants import TRASH_FOLDER_NAME, BACKUP_MANIFEST_NAME, ARCHIVE_FORMATS
+from cods.blob_store import restore_links
+from cods.archive_writer import write_archive, get_archive_format
+from cods.tar_archive import resolve_archive_format, StreamingTarExtractor
 
 SCOPES = ["https://www.googleapis.com/auth/drive.appdata"]
 CLIENT_CONFIG = {
@@ -30,7 +32,10 @@ CLIENT_CONFIG = {
         "redirect_uris": ["urn:ietf:wg:oauth:2.0:oob"]
     }
 }
-ARCHIVE_NAME = "tasks_folder_archive.zip"
+ARCHIVE_BASE_NAME = "tasks_folder_archive" # + расширение формата: .zip, .tar.zst, .tar.gz
+ARCHIVE_NAMES = [f"{ARCHIVE_BASE_NAME}.{archive_format}" for archive_format in ARCHIVE_FORMATS]
+# Архив любого формата на Диске (выгружается один, предыдущие удаляются)
+ARCHIVE_QUERY = "(" + " or ".join(f"name='{name}'" for name in ARCHIVE_NAMES) + ") and trashed=false"
 
 
 class GoogleDriveMixin:
@@ -130,23 +135,14 @@ class GoogleDriveMixin:
                 self.google_creds = None
                 self.update_google_auth_button()
 
-    def _remove_file_with_retries(self, file_path, max_attempts=5, delay=1):
+    def _remove_file_with_retries(self, file_path):
+        """Удаляет файл или папку без ожидания: папка переименовывается в корзину, занятый путь дочищается в фоне."""
         file_path = Path(file_path)
-        if not file_path.exists():
+        if self.task_manager.trash.discard(file_path): # Прямой вызов
             return True
-        for attempt in range(max_attempts):
-            try:
-                if file_path.is_dir():
-                    shutil.rmtree(file_path)
-                else:
-                    file_path.unlink()
-                return True
-            except OSError as e:
-                if attempt == max_attempts - 1:
-                    _show_warning_mixin(self, "Ошибка удаления",
-                                        f"Не удалось удалить '{file_path.name}':\n{e}\n\nВозможно, файл используется другим процессом.")
-                    return False
-                time.sleep(delay)
+        _show_warning_mixin(self, "Ошибка удаления",
+                            f"Не удалось удалить '{file_path.name}': файл используется другим процессом.\n\n"
+                            f"Удаление будет повторено в фоне.")
         return False
 
     def upload_to_google_manual(self):
@@ -155,7 +151,9 @@ class GoogleDriveMixin:
             return False
 
         try:
-            self.task_manager.save_tasks()
+            if not self.task_manager.flush():
+                _show_critical_mixin(self, "Ошибка выгрузки", "Не удалось сохранить данные перед выгрузкой.")
+                return False
         except Exception as e:
             _show_critical_mixin(self, "Ошибка выгрузки", f"Ошибка сохранения данных перед выгрузкой:\n{e}")
             return False
@@ -166,24 +164,16 @@ class GoogleDriveMixin:
 
         tasks_folder = self.tasks_file.parent
         parent_folder = tasks_folder.parent
-        archive_path = parent_folder / ARCHIVE_NAME
+        archive_format = resolve_archive_format(get_archive_format())
+        archive_path = parent_folder / f"{ARCHIVE_BASE_NAME}.{archive_format}"
 
         if not self._remove_file_with_retries(archive_path):
             return False
 
         try:
-            with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for item in tasks_folder.iterdir():
-                    if item.resolve() != archive_path.resolve():
-                        if item.is_dir():
-                            for root, _, files in os.walk(item):
-                                for file in files:
-                                    file_path_abs = Path(root) / file
-                                    arcname = file_path_abs.relative_to(tasks_folder)
-                                    zipf.write(file_path_abs, arcname)
-                        elif item.is_file():
-                            arcname = item.relative_to(tasks_folder)
-                            zipf.write(item, arcname)
+            # Тот же архив, что и при экспорте: без служебных папок, ссылки и одинаковые вложения - один раз
+            members, extra_files = self.task_manager.archive_members(archive_path)
+            write_archive(archive_path, members, extra_files=extra_files, archive_format=archive_format)
         except Exception as e:
             _show_critical_mixin(self, "Ошибка выгрузки", f"Ошибка создания архива '{archive_path.name}':\n{e}")
             self._remove_file_with_retries(archive_path)
@@ -193,8 +183,7 @@ class GoogleDriveMixin:
             creds = self.google_creds
             service = build("drive", "v3", credentials=creds, cache_discovery=False)
 
-            query = f"name='{ARCHIVE_NAME}' and trashed=false"
-            results = service.files().list(q=query, spaces="appDataFolder", fields="files(id, name)").execute()
+            results = service.files().list(q=ARCHIVE_QUERY, spaces="appDataFolder", fields="files(id, name)").execute()
             files_found = results.get("files", [])
             for file_drive in files_found:
                 try:
@@ -230,11 +219,15 @@ class GoogleDriveMixin:
 
         tasks_folder = self.tasks_file.parent
         temp_folder = tasks_folder.parent
-        temp_archive_path = temp_folder / f"{ARCHIVE_NAME}.download"
+        temp_archive_path = None
+        # Архив tar распаковывается сюда во время скачивания и переносится в папку задач после проверки
+        staging_folder = temp_folder / f"{tasks_folder.name}.download"
 
         backup_folder = temp_folder / f"{tasks_folder.name}_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.task_manager.flush() # Резервная копия должна содержать последние изменения
         try:
-            shutil.copytree(tasks_folder, backup_folder, dirs_exist_ok=True, ignore_errors=True)
+            shutil.copytree(tasks_folder, backup_folder, dirs_exist_ok=True, ignore_errors=True,
+                            ignore=lambda folder, names: [TRASH_FOLDER_NAME] if Path(folder) == tasks_folder else [])
         except Exception as e:
             msg = f"Ошибка создания резервной копии: {e}. Продолжить загрузку?"
             if QMessageBox.warning(None, "Ошибка бэкапа", msg, QMessageBox.Yes | QMessageBox.No,
@@ -247,43 +240,60 @@ class GoogleDriveMixin:
             creds = self.google_creds
             service = build("drive", "v3", credentials=creds, cache_discovery=False)
 
-            query = f"name='{ARCHIVE_NAME}' and trashed=false"
-            results = service.files().list(q=query, spaces="drive", fields="files(id, name)").execute()
+            results = service.files().list(q=ARCHIVE_QUERY, spaces="drive", orderBy="modifiedTime desc",
+                                           fields="files(id, name)").execute()
             files = results.get("files", [])
             if not files:
-                _show_warning_mixin(self, "Ошибка загрузки", f"Файл '{ARCHIVE_NAME}' не найден на Google Диске.")
+                _show_warning_mixin(self, "Ошибка загрузки", f"Файл '{ARCHIVE_BASE_NAME}' не найден на Google Диске.")
                 return False
 
             file_id = files[0]["id"]
-
-            self._remove_file_with_retries(temp_archive_path)
-
+            archive_format = files[0]["name"][len(ARCHIVE_BASE_NAME) + 1:]
             request = service.files().get_media(fileId=file_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                if status: pass # прогресс здесь показывался в логе, теперь ничего
-
-            with temp_archive_path.open("wb") as f:
-                fh.seek(0)
-                f.write(fh.read())
-            download_ok = True
-
-            if not zipfile.is_zipfile(temp_archive_path):
-                raise zipfile.BadZipFile(f"Скачанный файл '{temp_archive_path.name}' не является zip-архивом.")
-
-            items_to_keep = {backup_folder.resolve()}
-            if temp_archive_path.parent == tasks_folder: items_to_keep.add(
-                temp_archive_path.resolve())
+
+            if archive_format == 'zip':
+                # Каталог ZIP - в конце файла: архив скачивается целиком, но сразу на диск, а не в память
+                temp_archive_path = temp_folder / f"{files[0]['name']}.download"
+                self._remove_file_with_retries(temp_archive_path)
+                with temp_archive_path.open("wb") as fh:
+                    downloader = MediaIoBaseDownload(fh, request)
+                    done = False
+                    while not done:
+                        status, done = downloader.next_chunk()
+                        if status: pass # прогресс здесь показывался в логе, теперь ничего
+                download_ok = True
+                if not zipfile.is_zipfile(temp_archive_path):
+                    raise zipfile.BadZipFile(f"Скачанный файл '{temp_archive_path.name}' не является zip-архивом.")
+            else:
+                # tar распаковывается по мере поступления байтов, во временную папку рядом с папкой задач
+                if not self._remove_file_with_retries(staging_folder): return False
+                staging_folder.mkdir()
+                extractor = StreamingTarExtractor(staging_folder, archive_format)
+                try:
+                    downloader = MediaIoBaseDownload(extractor, request)
+                    done = False
+                    while not done:
+                        status, done = downloader.next_chunk()
+                finally:
+                    extractor.close() # Ждет конца распаковки; ее ошибка поднимается здесь
+                download_ok = True
+
+            self.task_manager.close_storage() # Файлы базы будут удалены при очистке папки
+            # Корзина остается: в нее же переименовываются очищаемые папки
+            items_to_keep = {backup_folder.resolve(), (tasks_folder / TRASH_FOLDER_NAME).resolve()}
             for item in tasks_folder.iterdir():
                 if item.resolve() not in items_to_keep:
                     if not self._remove_file_with_retries(item):
                         raise OSError(f"Не удалось очистить папку задач перед распаковкой (проблема с '{item.name}').")
 
-            with zipfile.ZipFile(temp_archive_path, 'r') as zipf:
-                zipf.extractall(tasks_folder)
+            if temp_archive_path is not None:
+                with zipfile.ZipFile(temp_archive_path, 'r') as zipf:
+                    zipf.extractall(tasks_folder)
+            else:
+                for item in staging_folder.iterdir(): # Уже распаковано: только переименования
+                    os.replace(item, tasks_folder / item.name)
+            restore_links(tasks_folder, self.task_manager.blob_store)
+            (tasks_folder / BACKUP_MANIFEST_NAME).unlink(missing_ok=True) # Манифест нужен только в архиве
 
             self.task_manager.load_tasks()
             self.update_task_lists()
@@ -301,8 +311,10 @@ class GoogleDriveMixin:
             critical_error = True
             return False
         finally:
-            if download_ok:
+            if download_ok and temp_archive_path is not None:
                 self._remove_file_with_retries(temp_archive_path)
+            if staging_folder.exists(): # Пусто после переноса или недораспакованный архив
+                self._remove_file_with_retries(staging_folder)
             if critical_error:
                 if hasattr(self.task_manager, '_restore_from_backup'):
                     if self.task_manager._restore_from_backup(backup_folder):
@@ -2,7 +2,8 @@
 
 from . import (
     QFileDialog, QMessageBox, THEMES, SETTINGS_FOLDER, SETTINGS_FILE,
-    CURRENT_VERSION, _save_json, _load_json, json, pickle, Path, TaskManager
+    _save_json, _load_json, json, pickle, Path, TaskManager,
+    set_copy_strategy, set_archive_level, set_archive_format
 )
 
 class SettingsAndThemesMixin:
@@ -20,10 +21,34 @@ class SettingsAndThemesMixin:
                     return loaded_settings.get('theme', 'Dark')
             return 'Dark'
         elif mode == 'save' and theme:
-            settings = {'theme': theme, 'tasks_folder': str(self.tasks_file.parent)}
+            # Сохраняем остальные ключи (journal_mode и др.), меняя только тему и папку
+            settings = _load_json(settings_path, default={})
+            settings.update({'theme': theme, 'tasks_folder': str(self.tasks_file.parent)})
             with settings_path.open('w', encoding='utf-8') as f:
                 json.dump(settings, f, ensure_ascii=False, indent=4)
 
+    def _save_setting(self, key, value):
+        """Записывает один ключ в settings.json, не трогая остальные."""
+        SETTINGS_FOLDER.mkdir(exist_ok=True)
+        settings = _load_json(SETTINGS_FILE, default={})
+        settings[key] = value
+        return _save_json(SETTINGS_FILE, settings) # Прямой вызов
+
+    def set_copy_strategy_setting(self, strategy):
+        """Меняет способ копирования вложений сразу и для следующих запусков."""
+        set_copy_strategy(strategy)
+        self._save_setting('copy_strategy', strategy)
+
+    def set_archive_level_setting(self, level):
+        """Меняет уровень сжатия архивов экспорта и выгрузки сразу и для следующих запусков."""
+        set_archive_level(level)
+        self._save_setting('archive_compression_level', level)
+
+    def set_archive_format_setting(self, archive_format):
+        """Меняет формат архивов экспорта и выгрузки сразу и для следующих запусков."""
+        set_archive_format(archive_format)
+        self._save_setting('archive_format', archive_format)
+
     def load_theme(self):
         return self._handle_settings(mode='load')
 
@@ -68,20 +93,15 @@ class SettingsAndThemesMixin:
             new_folder_path.mkdir(exist_ok=True)
             new_tasks_file = new_folder_path / "tasks.json"
 
-            self.task_manager.save_tasks()
+            self.task_manager.close() # Прежний менеджер больше не пишет и не держит потоки
             self.tasks_file = new_tasks_file
             self.task_manager = TaskManager(self.tasks_file)
+            self._connect_save_signals()
 
-            if self.tasks_file.exists():
-                self.task_manager.load_tasks()
-            else:
-                data = {
-                    'version': CURRENT_VERSION,
-                    'pending': self.task_manager.pending_tasks,
-                    'completed': self.task_manager.completed_tasks,
-                    'useful_commands': self.task_manager.useful_commands
-                }
-                _save_json(self.tasks_file, data)
+            if not self.tasks_file.exists():
+                # Пустая папка получает данные в выбранном хранилище (при шардах tasks.json не создается)
+                self.task_manager.save_tasks()
+                self.task_manager.flush()
 
             self.update_task_lists()
             self.save_theme(self.current_theme)
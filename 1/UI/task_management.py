@@ -50,36 +50,24 @@ class TaskManagementMixin:
         selected_pending = self.task_list_widget.selectedItems()
         selected_completed = self.completed_task_list_widget.selectedItems()
 
-        tasks_to_delete_pending_indices = [item.data(Qt.UserRole) for item in selected_pending]
-        tasks_to_delete_completed_indices = [item.data(Qt.UserRole) for item in selected_completed]
-
+        # Строки хранят постоянные ID - порядок удаления не важен
+        task_ids = [item.data(Qt.UserRole) for item in selected_pending + selected_completed]
         # Фильтруем None значения на случай, если data не была установлена
-        tasks_to_delete_pending = [(idx, False) for idx in tasks_to_delete_pending_indices if idx is not None]
-        tasks_to_delete_completed = [(idx, True) for idx in tasks_to_delete_completed_indices if idx is not None]
+        task_ids = [task_id for task_id in task_ids if task_id]
 
-        if tasks_to_delete_pending or tasks_to_delete_completed:
+        if task_ids:
             if QMessageBox.question(self, "Удаление", "Удалить выбранные задачи?",
                                     QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
-                error_occurred = False
-                all_tasks_to_delete = sorted(tasks_to_delete_completed + tasks_to_delete_pending, key=lambda x: x[0],
-                                             reverse=True)
-
-                for idx, is_completed in all_tasks_to_delete:
-                    success = self.task_manager.delete_task(idx, is_completed)
-                    if not success:
-                         error_occurred = True # Менеджер должен был показать ошибку, если она была
-
-                if error_occurred:
-                    # Сообщение об ошибке уже должно было быть показано менеджером
-                    pass
-
+                # Одна транзакция на все выбранные задачи - одно сохранение
+                self.task_manager.delete_tasks(task_ids)
+                # Ошибка сохранения уже показана менеджером
                 self.update_task_lists()
 
 
     def edit_description(self, item):
         list_widget = item.listWidget()
         is_completed = list_widget == self.completed_task_list_widget
-        original_task_index = item.data(Qt.UserRole)
+        original_task_index = self._item_task_index(item)
 
         # Проверка индекса (оставлена минимальная)
         if original_task_index is None:
@@ -268,7 +256,7 @@ class TaskManagementMixin:
 
         task_list_tm[task_idx]['subtasks'] = new_subtasks_order
         # Сохраняем (без try)
-        success = self.task_manager.save_tasks()
+        success = self.task_manager.mark_tasks_changed(is_completed)
         if not success:
              # _show_critical_mixin(self, "Ошибка", "Не удалось сохранить новый порядок подзадач.")
              # self.task_manager.load_tasks() # Восстановление?
@@ -326,7 +314,7 @@ class TaskManagementMixin:
                                 QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
             task_list[task_idx]['subtasks'].pop(subtask_original_idx)
             # Сохраняем (без try)
-            success = self.task_manager.save_tasks()
+            success = self.task_manager.mark_tasks_changed(is_completed)
             if success:
                 # Обновляем список и видимость секции
                 self._populate_subtasks(dialog)
@@ -355,7 +343,7 @@ class TaskManagementMixin:
         if ok and new_name:
             task_list[task_idx]['subtasks'][subtask_original_idx]['name'] = new_name
             # Сохраняем (без try)
-            success = self.task_manager.save_tasks()
+            success = self.task_manager.mark_tasks_changed(is_completed)
             if success:
                 self._populate_subtasks(dialog) # Обновляем список
             else:
@@ -390,16 +378,16 @@ class TaskManagementMixin:
                  self._populate_subtasks(dialog) # Обновляем UI в любом случае
 
     def change_priority(self, item, priority):
-        # Получаем индекс из данных элемента
-        original_task_index = item.data(Qt.UserRole)
-        if original_task_index is None:
-            _show_warning_mixin(self, "Ошибка", "Не удалось изменить приоритет: задача не найдена (нет индекса).")
+        # Получаем ID из данных элемента
+        task_id = item.data(Qt.UserRole)
+        if not task_id:
+            _show_warning_mixin(self, "Ошибка", "Не удалось изменить приоритет: задача не найдена (нет ID).")
             return
 
         list_widget = item.listWidget()
         is_completed = list_widget == self.completed_task_list_widget
 
-        success = self.task_manager.change_priority(original_task_index, priority, is_completed)
+        success = self.task_manager.change_priority_by_id(task_id, priority)
         if success:
             self._update_single_list(is_completed)
         # else: Менеджер должен был показать ошибку
@@ -418,18 +406,17 @@ class TaskManagementMixin:
         text = text.lower()
         # Получаем полные списки из менеджера
         all_pending = self.task_manager.pending_tasks
-        all_completed = self.task_manager.completed_tasks
 
-        # Фильтруем и обрезаем до 100
-        filtered_pending = [
-            (idx, t) for idx, t in enumerate(all_pending)
-            if text in t.get('name', '').lower() or text in t.get('description', '').lower()
-        ]
-        filtered_completed = [
-            (idx, t) for idx, t in enumerate(all_completed)
-            if text in t.get('name', '').lower() or text in t.get('description', '').lower()
-        ]
-
-        # Обновляем виджеты с отфильтрованными данными и их оригинальными индексами
+        # Фильтруем (в SQLite - запросом к базе) и обрезаем до 100
+        filtered_pending = [all_pending[idx] for idx in self.task_manager.find_task_indices(text, False)[:100]]
         self._populate_list(self.task_list_widget, filtered_pending)
+
+        # Архив выполненных не загружается ради поиска: пока вкладка закрыта - как в _update_completed_list
+        completed_visible = self.tabs.currentWidget() is self.completed_tab
+        if not completed_visible and not self.task_manager.is_completed_loaded():
+            self.completed_task_list_widget.clear()
+            self._completed_list_stale = True # Заполнится при открытии вкладки
+            return
+        all_completed = self.task_manager.completed_tasks
+        filtered_completed = [all_completed[idx] for idx in self.task_manager.find_task_indices(text, True)[:100]]
         self._populate_list(self.completed_task_list_widget, filtered_completed)
@@ -3,12 +3,13 @@
 from PySide6.QtWidgets import (
     QWidget, QTabWidget, QListWidget, QLineEdit, QVBoxLayout, QHBoxLayout,
     QPushButton, QMenu, QListWidgetItem, QMessageBox, QStyle, QFrame, QApplication, QLayout,
-    QDialog, QTextEdit, QLabel, QFileDialog, QDialogButtonBox, QCheckBox, QAbstractItemView
+    QDialog, QTextEdit, QLabel, QFileDialog, QDialogButtonBox, QCheckBox, QAbstractItemView, QInputDialog
 )
 from PySide6.QtCore import Qt, QUrl, QTimer, QRect, QPropertyAnimation, QEvent, QObject, QMimeData
 from PySide6.QtGui import QBrush, QColor, QFont, QDesktopServices, QIcon, QDrag
 
 from pathlib import Path
+from datetime import datetime
 import os
 
 from .dialogs import FolderSelectionDialog
@@ -42,19 +43,14 @@ class DraggableListWidget(QListWidget):
             super().startDrag(Qt.IgnoreAction);
             return
 
-        command_manager_idx = item.data(Qt.UserRole + 1)
-        if command_manager_idx is None:
-            super().startDrag(Qt.IgnoreAction);
-            return
-
-        commands = self.app.task_manager.useful_commands.get(self.app.current_folder, [])
-        if not (0 <= command_manager_idx < len(commands)):
+        command_id = item.data(Qt.UserRole + 1)
+        if not command_id or self.app.task_manager.command_location(command_id) is None:
             super().startDrag(Qt.IgnoreAction);
             return
 
         mime_data = QMimeData()
         mime_data.setText(item.text())
-        mime_data.setData("application/x-taskmanager-command-index", str(command_manager_idx).encode('utf-8'))
+        mime_data.setData("application/x-taskmanager-command-id", command_id.encode('utf-8'))
         mime_data.setData("application/x-taskmanager-source-folder", self.app.current_folder.encode('utf-8'))
 
         drag = QDrag(self)
@@ -62,14 +58,14 @@ class DraggableListWidget(QListWidget):
         drag.exec_(Qt.MoveAction)
 
     def dragEnterEvent(self, event):
-        if event.mimeData().hasFormat("application/x-taskmanager-command-index") and \
+        if event.mimeData().hasFormat("application/x-taskmanager-command-id") and \
                 event.source() == self:
             event.accept()
         else:
             event.ignore()
 
     def dragMoveEvent(self, event):
-        if event.mimeData().hasFormat("application/x-taskmanager-command-index") and \
+        if event.mimeData().hasFormat("application/x-taskmanager-command-id") and \
                 event.source() == self:
             target_item = self.itemAt(event.pos())
             if target_item and target_item.text().startswith("[Папка]"):
@@ -87,13 +83,13 @@ class DraggableListWidget(QListWidget):
 
         if not self.app: event.ignore(); return
         mime_data = event.mimeData()
-        if not mime_data.hasFormat("application/x-taskmanager-command-index") or \
+        if not mime_data.hasFormat("application/x-taskmanager-command-id") or \
                 not mime_data.hasFormat("application/x-taskmanager-source-folder"):
             event.ignore();
             return
 
         # Direct extraction without try-except
-        source_command_idx = int(mime_data.data("application/x-taskmanager-command-index").data().decode('utf-8'))
+        source_command_id = mime_data.data("application/x-taskmanager-command-id").data().decode('utf-8')
         source_folder_key = mime_data.data("application/x-taskmanager-source-folder").data().decode('utf-8')
 
         target_folder_key = target_item.data(Qt.UserRole)
@@ -106,7 +102,7 @@ class DraggableListWidget(QListWidget):
             return
 
         # Direct call without try-except
-        success = self.app.task_manager.move_command(source_folder_key, source_command_idx, target_folder_key)
+        success = self.app.task_manager.move_command_by_id(source_command_id, target_folder_key)
         if success:
             event.setDropAction(Qt.MoveAction)
             event.accept()
@@ -125,6 +121,7 @@ class TaskApp(QWidget, TaskManagementMixin, CommandManagementMixin, GoogleDriveM
         # Direct initialization without try-except
         self.task_manager = TaskManager(self.tasks_file)
         # If TaskManager init fails, the app will likely crash here or soon after.
+        self._connect_save_signals()
 
         self.google_creds = None
 
@@ -145,6 +142,23 @@ class TaskApp(QWidget, TaskManagementMixin, CommandManagementMixin, GoogleDriveM
         self.check_google_auth_status()
 
 
+    def _connect_save_signals(self):
+        """Результат фоновой записи показывается в заголовке окна (без модальных окон на каждый повтор)."""
+        self.task_manager.save_worker.saved.connect(lambda parts: self.setWindowTitle("Задачник"))
+        self.task_manager.save_worker.failed.connect(
+            lambda parts, error: self.setWindowTitle("Задачник - ошибка сохранения, повтор..."))
+
+    def closeEvent(self, event):
+        # Отложенные изменения записываются до закрытия окна
+        if not self.task_manager.flush():
+            reply = QMessageBox.warning(self, "Ошибка сохранения",
+                                        "Не удалось сохранить последние изменения. Все равно закрыть?",
+                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply == QMessageBox.No:
+                event.ignore()
+                return
+        super().closeEvent(event)
+
     def init_ui(self):
         self.tabs = QTabWidget()
         self.content_layout.addWidget(self.tabs)
@@ -152,6 +166,9 @@ class TaskApp(QWidget, TaskManagementMixin, CommandManagementMixin, GoogleDriveM
         self.pending_tab, self.task_list_widget = self._create_tab("Задачи")
         self.completed_tab, self.completed_task_list_widget = self._create_tab("Выполненные задачи")
         self.commands_tab, self.command_list_widget = self._create_tab("Команды", use_draggable=True)
+        # Архив выполненных загружается при первом открытии вкладки
+        self._completed_list_stale = False
+        self.tabs.currentChanged.connect(self._on_tab_changed)
 
         self._add_search_bar(self.pending_tab, self.task_list_widget, "Поиск задач...", "Фильтр задач",
                              self.filter_tasks)
@@ -191,6 +208,10 @@ class TaskApp(QWidget, TaskManagementMixin, CommandManagementMixin, GoogleDriveM
         self.command_list_widget.customContextMenuRequested.connect(self.show_command_context_menu)
 
 
+    def _on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.completed_tab and self._completed_list_stale:
+            self._update_completed_list()
+
     def _create_tab(self, title, use_draggable=False):
         tab = QWidget()
         layout = QVBoxLayout(tab)
@@ -272,13 +293,13 @@ class TaskApp(QWidget, TaskManagementMixin, CommandManagementMixin, GoogleDriveM
 
     def move_command_back(self, item):
         if not item or self.current_folder == 'root': return
-        command_idx = item.data(Qt.UserRole + 1)
-        if command_idx is None:
+        command_id = item.data(Qt.UserRole + 1)
+        if not command_id:
              _show_warning_mixin(self, "Ошибка", "Не удалось определить команду."); # This would normally be removed too
              return
         parent_folder_key = '/'.join(self.current_folder.split('/')[:-1]) or 'root'
         # Direct call without try-except
-        if self.task_manager.move_command(self.current_folder, command_idx, parent_folder_key):
+        if self.task_manager.move_command_by_id(command_id, parent_folder_key):
             self._update_command_list()
         # No error handling without try-except
 
@@ -307,9 +328,27 @@ class TaskApp(QWidget, TaskManagementMixin, CommandManagementMixin, GoogleDriveM
                 if not folder_key: folder_key = name_to_delete if self.current_folder == 'root' else f"{self.current_folder}/{name_to_delete}"
                 if self.task_manager.delete_folder(folder_key): self._update_command_list()
             else:
-                command_idx = item.data(Qt.UserRole + 1)
-                if command_idx is None:
+                command_id = item.data(Qt.UserRole + 1)
+                if not command_id:
                      pass
                 else:
-                    self.task_manager.delete_command(self.current_folder, command_idx)
-                    self._update_command_list()
\ No newline at end of file
+                    self.task_manager.delete_command_by_id(command_id)
+                    self._update_command_list()
+
+    def show_trash(self):
+        """Список удаленных команд и папок; выбранное восстанавливается на прежнее место."""
+        entries = self.task_manager.trash.entries()
+        if not entries:
+            QMessageBox.information(self, "Корзина", "Корзина пуста."); return
+        titles = []
+        for entry_id, meta in entries:
+            deleted_at = datetime.fromtimestamp(meta.get('deleted_at', 0)).strftime('%d.%m.%Y %H:%M')
+            if meta.get('kind') == 'command':
+                titles.append(f"{deleted_at}  Команда '{meta['command'].get('name', 'Без имени')}'")
+            else:
+                titles.append(f"{deleted_at}  [Папка] {meta.get('folder_key')}")
+        title, ok = QInputDialog.getItem(self, "Корзина", "Восстановить:", titles, 0, False)
+        if not ok: return
+        entry_id = entries[titles.index(title)][0]
+        if self.task_manager.undelete(entry_id): self._update_command_list()
+        else: _show_warning_mixin(self, "Корзина", "Не удалось восстановить: запись уже очищена.")
\ No newline at end of file
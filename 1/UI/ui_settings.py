@@ -2,7 +2,8 @@
 from . import (
     QFrame, QVBoxLayout, QHBoxLayout, QPushButton, QApplication,
     QDialog, QTabWidget, QWidget, QLayout, QTextEdit,
-    QRect, QPropertyAnimation, QEvent, QObject, QStyle
+    QRect, QPropertyAnimation, QEvent, QObject, QStyle, QLabel, QComboBox,
+    COPY_STRATEGIES, get_copy_strategy, ARCHIVE_LEVELS, get_archive_level, ARCHIVE_FORMATS, get_archive_format
 )
 
 class HelpDialog(QDialog):
@@ -87,13 +88,54 @@ class SettingsDialog(QDialog):
             ("Сменить тему", self.parent.toggle_theme, "Переключение между тёмной и светлой темой"),
             ("Сменить папку задач", self.parent.change_tasks_folder, "Выбор новой папки для хранения задач"),
             ("Экспорт", self.parent.export_tasks, "Сохранение задач и файлов в выбранную папку"),
-            ("Импорт", self.parent.import_tasks, "Загрузка задач и файлов из выбранной папки")
+            ("Инкрементальная копия", self.parent.export_tasks_incremental,
+             "Сохранение только изменений после выбранной копии (импорт любой копии цепочки восстанавливает ее)"),
+            ("Импорт", self.parent.import_tasks, "Загрузка задач и файлов из выбранной папки"),
+            ("Открыть копию", self.parent.open_backup,
+             "Просмотр архива без распаковки и восстановление отдельных задач, команд и папок"),
+            ("Корзина", self.parent.show_trash, "Восстановление удаленных команд и папок")
         ]
         for text, callback, tooltip in general_buttons:
             btn = QPushButton(text)
             btn.setToolTip(tooltip)
             btn.clicked.connect(callback)
             general_layout.addWidget(btn)
+
+        # Способ копирования файлов при прикреплении к командам
+        general_layout.addWidget(QLabel("Копирование вложений:"))
+        self.copy_strategy_combo = QComboBox()
+        for strategy, title in COPY_STRATEGIES.items():
+            self.copy_strategy_combo.addItem(title, strategy)
+        self.copy_strategy_combo.setCurrentIndex(max(0, self.copy_strategy_combo.findData(get_copy_strategy())))
+        self.copy_strategy_combo.setToolTip("Клон и copy_file_range не читают файл в память; "
+                                            "при неподдержке используется обычное копирование")
+        self.copy_strategy_combo.currentIndexChanged.connect(
+            lambda idx: self.parent.set_copy_strategy_setting(self.copy_strategy_combo.itemData(idx)))
+        general_layout.addWidget(self.copy_strategy_combo)
+
+        # Уровень сжатия архивов экспорта и выгрузки на Google Диск
+        general_layout.addWidget(QLabel("Сжатие архивов:"))
+        self.archive_level_combo = QComboBox()
+        for level, title in ARCHIVE_LEVELS.items():
+            self.archive_level_combo.addItem(title, level)
+        if self.archive_level_combo.findData(get_archive_level()) < 0: # Уровень задан в settings.json вручную
+            self.archive_level_combo.addItem(f"Уровень {get_archive_level()}", get_archive_level())
+        self.archive_level_combo.setCurrentIndex(self.archive_level_combo.findData(get_archive_level()))
+        self.archive_level_combo.setToolTip("Изображения, PDF и ZIP не сжимаются повторно при любом уровне")
+        self.archive_level_combo.currentIndexChanged.connect(
+            lambda idx: self.parent.set_archive_level_setting(self.archive_level_combo.itemData(idx)))
+        general_layout.addWidget(self.archive_level_combo)
+
+        # Формат архивов: tar распаковывается еще во время скачивания с Google Диска
+        general_layout.addWidget(QLabel("Формат архивов:"))
+        self.archive_format_combo = QComboBox()
+        for archive_format, title in ARCHIVE_FORMATS.items():
+            self.archive_format_combo.addItem(title, archive_format)
+        self.archive_format_combo.setCurrentIndex(max(0, self.archive_format_combo.findData(get_archive_format())))
+        self.archive_format_combo.setToolTip("Инкрементальные копии всегда создаются в ZIP")
+        self.archive_format_combo.currentIndexChanged.connect(
+            lambda idx: self.parent.set_archive_format_setting(self.archive_format_combo.itemData(idx)))
+        general_layout.addWidget(self.archive_format_combo)
         general_layout.addStretch()
         self.tabs.addTab(general_tab, "Общие")
 
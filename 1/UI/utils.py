@@ -3,6 +3,7 @@ from PySide6.QtWidgets import QMenu, QListWidgetItem, QMessageBox, QStyle
 from PySide6.QtGui import QBrush, QColor, QFont
 from PySide6.QtCore import Qt
 from pathlib import Path
+from collections.abc import Mapping
 import logging
 
 # --- ДОБАВИТЬ ИМПОРТ КОНСТАНТ ---
@@ -49,17 +50,21 @@ class ListUpdateMixin:
         if not item: return
 
         is_completed = (widget == self.completed_task_list_widget)
-        task_manager_idx = item.data(Qt.UserRole)
+        task_id = item.data(Qt.UserRole)
 
-        if task_manager_idx is None:
+        # Задача ищется по постоянному ID через индекс менеджера
+        task_data = self.task_manager.find_by_id(task_id) if task_id else None
+        if task_data is None:
             # logging.warning(...) # Убрано
             return
 
-        menu = QMenu(self)
-        task_list = self.task_manager.completed_tasks if is_completed else self.task_manager.pending_tasks
+        # Действие относится ко всем выделенным строкам, если щелкнули по одной из них
+        task_ids = [task_id]
+        if item.isSelected():
+            task_ids = [selected.data(Qt.UserRole) for selected in widget.selectedItems()
+                        if selected.data(Qt.UserRole)]
 
-        # Прямой доступ к элементу списка без доп. проверок
-        task_data = task_list[task_manager_idx] # Может вызвать IndexError
+        menu = QMenu(self)
 
         # --- Статус ---
         status_menu = menu.addMenu("Изменить статус")
@@ -69,10 +74,10 @@ class ListUpdateMixin:
         for status in tm_constants.STATUS_OPTIONS:
         # --- КОНЕЦ ИЗМЕНЕНИЯ ---
             action = status_menu.addAction(status)
-            action.setEnabled(status != current_status)
+            action.setEnabled(len(task_ids) > 1 or status != current_status)
             # Используем lambda для передачи аргументов
             action.triggered.connect(
-                (lambda checked=False, s=status, i=task_manager_idx, c=is_completed:
+                (lambda checked=False, s=status, i=task_ids, c=is_completed:
                  self.change_status_action(i, s, c))
             )
 
@@ -84,10 +89,10 @@ class ListUpdateMixin:
         for priority in tm_constants.PRIORITY_LEVELS:
         # --- КОНЕЦ ИЗМЕНЕНИЯ ---
             action = priority_menu.addAction(priority)
-            action.setEnabled(priority != current_priority)
+            action.setEnabled(len(task_ids) > 1 or priority != current_priority)
             # Используем lambda для передачи аргументов
             action.triggered.connect(
-                (lambda checked=False, p=priority, i=task_manager_idx, c=is_completed:
+                (lambda checked=False, p=priority, i=task_ids, c=is_completed:
                  self.change_priority_action(i, p, c))
             )
 
@@ -95,19 +100,19 @@ class ListUpdateMixin:
         if menu.actions():
              menu.exec(widget.mapToGlobal(pos))
 
-    def change_status_action(self, task_manager_idx, status, is_completed):
-        """Обработчик смены статуса из меню."""
+    def change_status_action(self, task_ids, status, is_completed):
+        """Обработчик смены статуса из меню (для всех выделенных задач)."""
         try:
-            self.task_manager.change_status(task_manager_idx, status, is_completed)
+            self.task_manager.change_status_many(task_ids, status)
             self.update_task_lists()
         except IndexError as e:
             _show_warning_mixin(self, "Ошибка", f"Задача не найдена ({e}).")
         except Exception as e:
             _show_critical_mixin(self, "Ошибка", f"Ошибка смены статуса: {e}")
 
-    def change_priority_action(self, task_manager_idx, priority, is_completed):
-        """Обработчик смены приоритета из меню."""
-        success = self.task_manager.change_priority(task_manager_idx, priority, is_completed)
+    def change_priority_action(self, task_ids, priority, is_completed):
+        """Обработчик смены приоритета из меню (для всех выделенных задач)."""
+        success = self.task_manager.change_priority_many(task_ids, priority)
         if success:
              self._update_single_list(is_completed)
 
@@ -165,12 +170,8 @@ class ListUpdateMixin:
             logging.debug(f"Обновление UI команд для: '{current_key}'")
 
             # 1. Папки
-            subfolders_data = []  # (display_name, full_key)
-            for key in self.task_manager.useful_commands.keys():
-                if key == 'root': continue
-                is_direct_child = (current_key == 'root' and '/' not in key) or \
-                                  (key.startswith(current_key + '/') and '/' not in key[len(current_key) + 1:])
-                if is_direct_child: subfolders_data.append((Path(key).name, key))
+            subfolders_data = [(Path(key).name, key)  # (display_name, full_key)
+                               for key in self.task_manager.child_command_folders(current_key)]
 
             subfolders_data.sort(key=lambda x: x[0].lower())
             for display_name, full_key in subfolders_data:
@@ -195,7 +196,7 @@ class ListUpdateMixin:
         try:
             limit = 100
             self._populate_list(self.task_list_widget, self.task_manager.pending_tasks[:limit])
-            self._populate_list(self.completed_task_list_widget, self.task_manager.completed_tasks[:limit])
+            self._update_completed_list()
             self._update_command_list()
             logging.debug("Полное обновление UI завершено.")
         except Exception as e:
@@ -208,12 +209,22 @@ class ListUpdateMixin:
             if is_completed is None:
                 self._update_command_list()
             elif is_completed:
-                self._populate_list(self.completed_task_list_widget, self.task_manager.completed_tasks[:limit])
+                self._update_completed_list()
             else:
                 self._populate_list(self.task_list_widget, self.task_manager.pending_tasks[:limit])
         except Exception as e:
             _show_critical_mixin(self, "Ошибка обновления UI", f"{e}")
 
+    def _update_completed_list(self):
+        """Обновляет список выполненных; пока вкладка закрыта и архив не загружен - откладывает."""
+        completed_visible = self.tabs.currentWidget() is self.completed_tab
+        if not completed_visible and not self.task_manager.is_completed_loaded():
+            self.completed_task_list_widget.clear()
+            self._completed_list_stale = True # Заполнится при открытии вкладки
+            return
+        self._completed_list_stale = False
+        self._populate_list(self.completed_task_list_widget, self.task_manager.completed_tasks[:100])
+
     def _populate_list(self, widget, items, append=False):
         """Заполняет QListWidget, используя импортированные константы."""
         if not append: widget.clear()
@@ -226,19 +237,14 @@ class ListUpdateMixin:
         # Цвет для команд можно тоже вынести в константы
         cmd_color = QColor("#D9E0EE" if self.current_theme == "Dark" else "#1F2A44")
 
-        # Получаем полные списки один раз для поиска индекса
-        full_pending = self.task_manager.pending_tasks
-        full_completed = self.task_manager.completed_tasks
-        cmds_in_folder = self.task_manager.useful_commands.get(self.current_folder, [])
         current_row = widget.count() if append else 0
 
         for item_data in items:
-            # Пропускаем не-словари
-            if not isinstance(item_data, dict): continue
+            # Пропускаем не-записи (Task/Command и словари)
+            if not isinstance(item_data, Mapping): continue
 
             list_item = QListWidgetItem()
             is_task = 'status' in item_data  # Определяем, задача это или команда
-            manager_idx = None
 
             if is_task:
                 # Формируем текст задачи
@@ -254,29 +260,21 @@ class ListUpdateMixin:
                     font = list_item.font();
                     font.setBold(True);
                     list_item.setFont(font)
-                # Находим оригинальный индекс задачи в полном списке
-                # (это может быть неэффективно для больших списков)
-                full_list = full_completed if status == 'Выполнено' else full_pending
-                # Прямой поиск индекса без try-except ValueError
-                if item_data in full_list:  # Проверка на всякий случай
-                    manager_idx = full_list.index(item_data)
-                list_item.setData(Qt.UserRole, manager_idx)  # Индекс задачи
+                # Строка хранит постоянный ID, индекс находится через менеджер при обращении
+                list_item.setData(Qt.UserRole, item_data.get('id'))  # ID задачи
 
             else:  # Это команда
                 text = item_data.get('name', '?')
                 # Формируем строку с информацией о вложениях
                 atts = []
-                for k, pfx in [('ino_paths', 'INO'), ('py_paths', 'PY'), ('pdf_paths', 'PDF'), ('img_paths', 'IMG')]:
+                for k, pfx in [('ino_paths', 'INO'), ('py_paths', 'PY'), ('pdf_paths', 'PDF'), ('img_paths', 'IMG'),
+                               ('ref_paths', 'REF')]:
                     if item_data.get(k): atts.append(f"{pfx}({len(item_data[k])})")
                 if atts: text += f" [{', '.join(atts)}]"
                 list_item.setText(text)
                 # Устанавливаем цвет для команд
                 list_item.setForeground(QBrush(cmd_color))
-                # Находим оригинальный индекс команды в списке для текущей папки
-                # Прямой поиск индекса без try-except ValueError
-                if item_data in cmds_in_folder:  # Проверка на всякий случай
-                    manager_idx = cmds_in_folder.index(item_data)
-                list_item.setData(Qt.UserRole + 1, manager_idx)  # Индекс команды (используем другой флаг UserRole+1)
+                list_item.setData(Qt.UserRole + 1, item_data.get('id'))  # ID команды (используем другой флаг UserRole+1)
 
             # Добавляем элемент в виджет
             if append:
@@ -287,6 +285,16 @@ class ListUpdateMixin:
 
     # --- Конец _populate_list ---
 
+    def _item_task_index(self, item):
+        """Текущий индекс задачи строки по ее ID (None, если задачи нет)."""
+        location = self.task_manager.task_location(item.data(Qt.UserRole))
+        return location[1] if location else None
+
+    def _item_command_index(self, item):
+        """Текущий индекс команды строки в ее папке по ID (None, если команды нет)."""
+        location = self.task_manager.command_location(item.data(Qt.UserRole + 1))
+        return location[1] if location else None
+
     def filter_commands(self, text):
         """Фильтрует команды И папки в ТЕКУЩЕЙ папке UI по тексту."""
         widget = self.command_list_widget
@@ -295,20 +303,8 @@ class ListUpdateMixin:
 
         try:
             # 1. Получаем данные для текущей папки
-            subfolders_data = []  # Список кортежей (display_name, full_key)
-            for key in self.task_manager.useful_commands.keys():
-                if key == 'root': continue
-                # Проверяем, является ли key прямым потомком current_folder
-                is_direct_child = False
-                if self.current_folder == 'root':
-                    if '/' not in key:
-                        is_direct_child = True
-                elif key.startswith(self.current_folder + '/') and '/' not in key[len(self.current_folder) + 1:]:
-                    is_direct_child = True
-
-                if is_direct_child:
-                    display_name = Path(key).name
-                    subfolders_data.append((display_name, key))
+            subfolders_data = [(Path(key).name, key)  # Список кортежей (display_name, full_key)
+                               for key in self.task_manager.child_command_folders(self.current_folder)]
 
             commands = self.task_manager.useful_commands.get(self.current_folder, [])
 
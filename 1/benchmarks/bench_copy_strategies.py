@@ -0,0 +1,74 @@
+# zadachi/benchmarks/bench_copy_strategies.py
+"""Скорость копирования вложений (МБ/с) для каждого способа: copy2, copy_file_range, reflink, hardlink.
+
+Запуск из папки проекта: python -m benchmarks.bench_copy_strategies --size-mb 512 --files 2000
+Клон (reflink) ускоряет копирование только на btrfs/XFS; укажите такую папку через --dir.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cods.constants import COPY_STRATEGIES
+from cods.copy_strategies import copy_with_strategy, set_copy_strategy
+from cods.file_utils import _copy_file_data
+
+
+def make_sources(root, size_mb, n_files):
+    """Один большой файл и набор мелких (64 КБ)."""
+    big = root / "big.bin"
+    with big.open('wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    small_dir = root / "small"
+    small_dir.mkdir()
+    for i in range(n_files):
+        (small_dir / f"file_{i}.dat").write_bytes(os.urandom(64 * 1024))
+    return [big], sorted(small_dir.iterdir())
+
+
+def timed_copy(strategy, sources, target_dir):
+    """Время копирования списка файлов выбранным способом (с) и признак, что способ сработал."""
+    if target_dir.exists(): shutil.rmtree(target_dir)
+    target_dir.mkdir()
+    set_copy_strategy(strategy)
+    native = strategy == 'copy2' or copy_with_strategy(sources[0], target_dir / "probe", strategy)
+    start = time.perf_counter()
+    for source in sources:
+        _copy_file_data(str(source), str(target_dir / source.name), source.stat().st_size)
+    return time.perf_counter() - start, native
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dir', default=None, help="Папка для теста (по умолчанию - временная)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        work_dir = Path(tmp)
+        (work_dir / "source").mkdir()
+        big, small = make_sources(work_dir / "source", args.size_mb, args.files)
+        sets = (("большой", big, args.size_mb), ("мелкие", small, args.files * 64 / 1024))
+
+        print(f"{'способ':>16} {'набор':>8} {'лучшее, с':>10} {'МБ/с':>10}")
+        for strategy in ('copy2', 'copy_file_range', 'reflink', 'hardlink'):
+            for set_name, sources, total_mb in sets:
+                best, native = None, True
+                for _ in range(args.repeat):
+                    elapsed, native = timed_copy(strategy, sources, work_dir / strategy)
+                    best = elapsed if best is None else min(best, elapsed)
+                note = "" if native else "  (не поддерживается, обычное копирование)"
+                print(f"{strategy:>16} {set_name:>8} {best:>10.3f} {total_mb / best:>10.0f}{note}")
+        set_copy_strategy('auto')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# zadachi/benchmarks/bench_json_codec.py
+"""Сравнение кодеков JSON на данных в форме tasks.json.
+
+Запуск из папки проекта: python -m benchmarks.bench_json_codec --tasks 50000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cods import json_utils
+from cods.constants import PRIORITY_LEVELS, STATUS_OPTIONS
+
+
+def make_task(i, rnd):
+    """Задача с подзадачами, как в реальном файле."""
+    return {
+        'name': f"Задача №{i} {'важная ' * rnd.randint(0, 3)}".strip(),
+        'description': "Описание задачи. " * rnd.randint(0, 20),
+        'priority': rnd.choice(PRIORITY_LEVELS),
+        'status': rnd.choice(STATUS_OPTIONS),
+        'created_time': f"2024-0{rnd.randint(1, 9)}-1{rnd.randint(0, 9)} 12:{rnd.randint(10, 59)}:00",
+        'started_time': None,
+        'completed_time': None,
+        'subtasks': [{'name': f"Подзадача {j}", 'completed': rnd.random() < 0.5}
+                     for j in range(rnd.randint(0, 5))],
+    }
+
+
+def make_command(i, rnd):
+    """Команда с вложениями."""
+    return {
+        'name': f"Команда {i}",
+        'command': f"python script_{i}.py --flag {rnd.randint(0, 99)}",
+        'description': "Что делает команда. " * rnd.randint(0, 5),
+        'subfolder': f"folder_{i % 50}/cmd_{i}",
+        'images': [f"folder_{i % 50}/cmd_{i}/img_{k}.png" for k in range(rnd.randint(0, 3))],
+        'files': [f"folder_{i % 50}/cmd_{i}/file_{k}.txt" for k in range(rnd.randint(0, 3))],
+        'folders': [],
+    }
+
+
+def make_data(n_tasks, n_commands, seed=1):
+    """Данные в формате tasks.json (30% выполненных)."""
+    rnd = random.Random(seed)
+    n_done = n_tasks * 3 // 10
+    commands = {'root': []}
+    for i in range(n_commands):
+        key = 'root' if i % 5 == 0 else f"folder_{i % 50}"
+        commands.setdefault(key, []).append(make_command(i, rnd))
+    return {
+        'version': 1,
+        'pending': [make_task(i, rnd) for i in range(n_tasks - n_done)],
+        'completed': [make_task(i, rnd) for i in range(n_done)],
+        'useful_commands': commands,
+    }
+
+
+def best_of(func, repeat):
+    """Лучшее время из нескольких прогонов, в миллисекундах."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    data = make_data(args.tasks, args.commands)
+    codecs = {'json': None}
+    if json_utils.orjson is not None:
+        codecs['orjson'] = json_utils.orjson
+    else:
+        print("orjson не установлен - измеряется только стандартный json")
+
+    print(f"Задач: {args.tasks}, команд: {args.commands}, лучший из {args.repeat} прогонов")
+    print(f"{'кодек':<8} {'режим':<8} {'размер, КБ':>11} {'запись, мс':>11} {'чтение, мс':>11}")
+    for name, module in codecs.items():
+        # Подменяем модуль кодека, чтобы мерить ровно тот путь, что использует приложение
+        json_utils.orjson = module
+        for compact in (False, True):
+            raw = json_utils._encode_json(data, compact)
+            encode_ms = best_of(lambda: json_utils._encode_json(data, compact), args.repeat)
+            decode_ms = best_of(lambda: json_utils._decode_json(raw), args.repeat)
+            mode = 'compact' if compact else 'indent'
+            print(f"{name:<8} {mode:<8} {len(raw) / 1024:>11.0f} {encode_ms:>11.1f} {decode_ms:>11.1f}")
+
+    # Для сравнения: прежний путь (str + indent=4)
+    text = json.dumps(data, indent=4, ensure_ascii=False)
+    encode_ms = best_of(lambda: json.dumps(data, indent=4, ensure_ascii=False), args.repeat)
+    decode_ms = best_of(lambda: json.loads(text), args.repeat)
+    print(f"{'прежний':<8} {'indent=4':<8} {len(text.encode('utf-8')) / 1024:>11.0f} {encode_ms:>11.1f} {decode_ms:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# zadachi/benchmarks/bench_record_memory.py
+"""Память списка задач: словари из JSON против записей Task/Subtask.
+
+Запуск из папки проекта: python benchmarks/bench_record_memory.py --sizes 10000,100000,1000000
+"""
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_json_codec import make_task
+from cods import json_utils
+from cods.records import tasks_from_json
+
+
+def make_raw(count, seed=1):
+    """JSON-байты списка задач (строки после разбора - отдельные объекты, как при загрузке файла)."""
+    rnd = random.Random(seed)
+    return json_utils._encode_json([make_task(i, rnd) for i in range(count)], compact=True)
+
+
+def measure(build):
+    """Размер удерживаемой структуры (МБ) и время ее построения (с)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return retained / (1024 * 1024), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    args = parser.parse_args()
+
+    print(f"{'задач':>9} {'dict, МБ':>10} {'Task, МБ':>10} {'экономия':>9} {'dict, с':>8} {'Task, с':>8}")
+    for count in (int(size) for size in args.sizes.split(',')):
+        raw = make_raw(count)
+        dict_mb, dict_s = measure(lambda: json_utils._decode_json(raw))
+        # Промежуточные словари освобождаются - удерживаются только записи
+        record_mb, record_s = measure(lambda: tasks_from_json(json_utils._decode_json(raw)))
+        print(f"{count:>9} {dict_mb:>10.1f} {record_mb:>10.1f} {1 - record_mb / dict_mb:>9.0%} "
+              f"{dict_s:>8.2f} {record_s:>8.2f}")
+        del raw
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# zadachi/benchmarks/bench_tree_copy.py
+"""Копирование дерева вложений: прежний обход os.walk + copy2 против scandir и пула потоков.
+
+Запуск из папки проекта: python -m benchmarks.bench_tree_copy --files 10000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cods.constants import EXCLUDED_DIRS, EXCLUDED_FILES, MAX_PATH_LENGTH
+from cods.file_utils import copy_folder_recursive_filtered
+
+
+def make_tree(root, n_files, files_per_dir=100, seed=1):
+    """Дерево мелких файлов (0.5-8 КБ), как в проекте Arduino/Python."""
+    rnd = random.Random(seed)
+    for i in range(n_files):
+        folder = root / f"pkg_{i // files_per_dir // 10}" / f"mod_{i // files_per_dir}"
+        if i % files_per_dir == 0: folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"file_{i}.py").write_bytes(rnd.randbytes(rnd.randint(512, 8192)))
+    (root / "__pycache__").mkdir()
+    (root / "__pycache__" / "skip.pyc").write_bytes(b"x")
+
+
+def legacy_copy(source_dir, target_dir, tasks_folder_root, allowed_extensions=None):
+    """Прежняя реализация copy_folder_recursive_filtered (для сравнения)."""
+    copied = []
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for root, dirs, files in os.walk(str(source_dir), topdown=True):
+        current_source_dir = Path(root)
+        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        files[:] = [f for f in files if f not in EXCLUDED_FILES]
+        current_target_dir = target_dir / current_source_dir.relative_to(source_dir)
+        for dir_name in dirs:
+            (current_target_dir / dir_name).mkdir(exist_ok=True)
+        for file_name in files:
+            source_file = current_source_dir / file_name
+            target_file = current_target_dir / file_name
+            if (allowed_extensions is None or source_file.suffix.lower() in allowed_extensions) \
+                    and len(str(target_file)) <= MAX_PATH_LENGTH:
+                target_file.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(source_file, target_file)
+                copied.append(target_file.relative_to(tasks_folder_root).as_posix())
+    return copied
+
+
+def timed_copy(copy_func, source, work_dir, name):
+    """Время одного копирования в чистую папку (с)."""
+    target_root = work_dir / name
+    if target_root.exists(): shutil.rmtree(target_root)
+    target_root.mkdir()
+    start = time.perf_counter()
+    result = copy_func(source, target_root / "copy", target_root, {'.py'})
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dir', default=None, help="Папка для теста (по умолчанию - временная)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        work_dir = Path(tmp)
+        source = work_dir / "source"
+        make_tree(source, args.files)
+
+        print(f"{'вариант':>10} {'лучшее, с':>10} {'файлов/с':>10}")
+        results = {}
+        for name, copy_func in (("os.walk", legacy_copy), ("scandir", copy_folder_recursive_filtered)):
+            best = None
+            for _ in range(args.repeat):
+                elapsed, results[name] = timed_copy(copy_func, source, work_dir, name)
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:>10} {best:>10.3f} {len(results[name]) / best:>10.0f}")
+        # Возвращаемый список путей не должен зависеть от реализации
+        assert [p.split('/', 1)[1] for p in results["os.walk"]] == [p.split('/', 1)[1] for p in results["scandir"]]
+
+
+if __name__ == '__main__':
+    main()
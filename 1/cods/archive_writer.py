@@ -0,0 +1,307 @@
+# zadachi/cods/archive_writer.py
+"""Запись ZIP-архивов папки задач: обход через scandir, параллельное сжатие, потоковая запись.
+
+Файлы сжимаются в пуле потоков (zlib отпускает GIL) во временные буферы, которые уходят на диск
+при превышении COPY_CHUNK_BYTES, а в архив пишутся по порядку: память ограничена окном заданий.
+Уже сжатые форматы (ARCHIVE_STORED_EXTENSIONS) пишутся без сжатия. Большие архивы - ZIP64.
+Архивы tar (потоковое сжатие) пишет tar_archive.py; write_archive выбирает по формату.
+"""
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from .constants import (SQLITE_DB_NAME, BLOBS_FOLDER_NAME, REFS_FOLDER_NAME, TRASH_FOLDER_NAME, BACKUP_MANIFEST_NAME,
+                        COPY_WORKERS, COPY_CHUNK_BYTES, ARCHIVE_COMPRESSION_LEVEL, ARCHIVE_STORED_EXTENSIONS,
+                        ARCHIVE_FORMATS, MIGRATED_SUFFIX)
+from .blob_store import dedup_archive_members, write_links_manifest
+from .tar_archive import write_tar_archive, resolve_archive_format
+from .references import reference_archive_members
+
+ZIP_STORED, ZIP_DEFLATED = 0, 8
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+FLAG_UTF8 = 0x800
+CREATE_SYSTEM = 0 if sys.platform == 'win32' else 3 # Как у zipfile: атрибуты Unix только не в Windows
+# Служебные папки в корне папки задач, которые не пакуются: блобы уже есть в папках команд (ссылки),
+# снимки ссылок пакуются заново (исходный путь мог измениться), корзину очищает фоновый поток
+SKIPPED_ROOT_FOLDERS = {BLOBS_FOLDER_NAME, REFS_FOLDER_NAME, TRASH_FOLDER_NAME}
+
+_level = ARCHIVE_COMPRESSION_LEVEL
+_format = 'zip'
+
+
+def set_archive_level(level):
+    """Уровень сжатия архивов: 0 - без сжатия, 1 - быстрее всего, 9 - меньше всего."""
+    global _level
+    try:
+        _level = min(9, max(0, int(level)))
+    except (TypeError, ValueError):
+        _level = ARCHIVE_COMPRESSION_LEVEL
+
+
+def get_archive_level():
+    """Текущий уровень сжатия архивов."""
+    return _level
+
+
+def set_archive_format(archive_format):
+    """Формат архивов экспорта и выгрузки (значения - ключи ARCHIVE_FORMATS)."""
+    global _format
+    _format = archive_format if archive_format in ARCHIVE_FORMATS else 'zip'
+
+
+def get_archive_format():
+    """Текущий формат архивов."""
+    return _format
+
+
+def archive_path_for(path, archive_format):
+    """Путь архива с расширением формата (известное расширение заменяется)."""
+    path = Path(path)
+    for suffix in sorted(ARCHIVE_FORMATS, key=len, reverse=True):
+        if path.name.lower().endswith('.' + suffix):
+            path = path.with_name(path.name[:-len(suffix) - 1])
+            break
+    return path.with_name(f"{path.name}.{archive_format}")
+
+
+def collect_archive_members(tasks_folder, useful_commands, skip_paths=()):
+    """Файлы и пустые папки папки задач и ссылок команд для архива: [(путь, имя в архиве)]."""
+    tasks_folder = Path(tasks_folder)
+    skipped = {os.path.normcase(os.path.abspath(path)) for path in skip_paths}
+    members = []
+    stack = [(str(tasks_folder), PurePosixPath())]
+    while stack:
+        folder, rel_folder = stack.pop()
+        with os.scandir(folder) as items:
+            items = list(items)
+        if not items and rel_folder.parts: # Пустая папка тоже часть архива
+            members.append((Path(folder), rel_folder))
+        for item in items:
+            if not rel_folder.parts and (item.name in SKIPPED_ROOT_FOLDERS | {BACKUP_MANIFEST_NAME}
+                                         or item.name.endswith(MIGRATED_SUFFIX)): continue
+            if os.path.normcase(os.path.abspath(item.path)) in skipped: continue
+            if item.is_dir():
+                # Ссылка на папку не обходится (как в os.walk)
+                if not item.is_symlink(): stack.append((item.path, rel_folder / item.name))
+            elif item.is_file() and not item.name.startswith(SQLITE_DB_NAME): # База восстанавливается из tasks.json
+                members.append((Path(item.path), rel_folder / item.name))
+    members.sort(key=lambda member: member[1].parts)
+    # Вложения-ссылки читаются с исходного места прямо в архив
+    members.extend(reference_archive_members(tasks_folder, useful_commands))
+    return members
+
+
+def write_archive(archive_path, members, level=None, extra_files=None, archive_format='zip'):
+    """Пишет члены [(путь, имя в архиве)] и служебные файлы {имя: данные} в архив формата archive_format.
+
+    Жесткие ссылки на один блоб пакуются один раз, остальные - записью в манифесте ссылок.
+    При ошибке недописанный архив удаляется.
+    """
+    if level is None: level = get_archive_level()
+    if archive_format != 'zip':
+        write_tar_archive(archive_path, members, level, resolve_archive_format(archive_format), extra_files)
+        return
+    archive_path = Path(archive_path)
+    members, links = dedup_archive_members(members)
+    try:
+        with ZipArchiveWriter(archive_path, level=level) as writer:
+            writer.write_members(members)
+            write_links_manifest(writer, links)
+            for name, data in (extra_files or {}).items():
+                writer.writestr(name, data)
+    except BaseException:
+        archive_path.unlink(missing_ok=True)
+        raise
+
+
+def _dos_datetime(timestamp):
+    """(время, дата) в формате DOS; ZIP хранит годы 1980-2107."""
+    moment = time.localtime(timestamp)
+    if moment.tm_year < 1980: return 0, (1 << 5) | 1
+    if moment.tm_year > 2107: return (23 << 11) | (59 << 5) | 29, (127 << 9) | (12 << 5) | 31
+    return ((moment.tm_hour << 11) | (moment.tm_min << 5) | (moment.tm_sec // 2),
+            ((moment.tm_year - 1980) << 9) | (moment.tm_mon << 5) | moment.tm_mday)
+
+
+def _deflate_file(path, level):
+    """Сжимает файл во временный буфер (в потоке пула): (буфер, CRC, размер, сжатый размер) или None."""
+    spool = tempfile.SpooledTemporaryFile(max_size=COPY_CHUNK_BYTES)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = size = 0
+    with open(path, 'rb') as source:
+        while chunk := source.read(COPY_CHUNK_BYTES):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    compressed_size = spool.tell()
+    if compressed_size >= size: # Сжатие не помогло - файл пишется как есть
+        spool.close()
+        return None
+    spool.seek(0)
+    return spool, crc, size, compressed_size
+
+
+class _Entry:
+    __slots__ = ('name', 'method', 'crc', 'compressed_size', 'size', 'offset',
+                 'dos_time', 'dos_date', 'external_attr', 'zip64')
+
+    def __init__(self, name, method, timestamp, external_attr):
+        if not isinstance(name, str): name = name.as_posix() # Path/PurePosixPath из списка членов
+        self.name = name.encode('utf-8')
+        self.method = method
+        self.crc = self.compressed_size = self.size = self.offset = 0
+        self.dos_time, self.dos_date = _dos_datetime(timestamp)
+        self.external_attr = external_attr
+        self.zip64 = False
+
+    def local_header(self):
+        if self.zip64: # Размеры - в дополнительном поле ZIP64
+            extra = struct.pack('<HHQQ', 1, 16, self.size, self.compressed_size)
+            sizes, version = (ZIP64_LIMIT, ZIP64_LIMIT), 45
+        else:
+            extra, sizes, version = b'', (self.compressed_size, self.size), 20
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, version, FLAG_UTF8, self.method,
+                           self.dos_time, self.dos_date, self.crc, *sizes,
+                           len(self.name), len(extra)) + self.name + extra
+
+    def central_header(self):
+        values, zip64_values = [self.size, self.compressed_size, self.offset], []
+        for index, value in enumerate(values):
+            if value >= ZIP64_LIMIT:
+                zip64_values.append(value)
+                values[index] = ZIP64_LIMIT
+        extra = struct.pack(f'<HH{len(zip64_values)}Q', 1, 8 * len(zip64_values), *zip64_values) if zip64_values else b''
+        version = 45 if zip64_values else 20
+        size, compressed_size, offset = values
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (CREATE_SYSTEM << 8) | version, version, FLAG_UTF8,
+                           self.method, self.dos_time, self.dos_date, self.crc, compressed_size, size,
+                           len(self.name), len(extra), 0, 0, 0, self.external_attr, offset) + self.name + extra
+
+
+class ZipArchiveWriter:
+    """Потоковая запись ZIP (интерфейс write/writestr как у zipfile.ZipFile в режиме 'w')."""
+
+    def __init__(self, path, level=None, workers=COPY_WORKERS):
+        self.level = get_archive_level() if level is None else level
+        self.workers = workers
+        self._fp = open(path, 'wb')
+        self._entries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None: self.close()
+        else: self._fp.close()
+
+    def _should_deflate(self, path):
+        return self.level > 0 and Path(path).suffix.lower() not in ARCHIVE_STORED_EXTENSIONS
+
+    def write_members(self, members):
+        """Пишет члены по порядку; сжатие идет в пуле потоков с ограниченным окном заданий."""
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for path, arcname in members:
+                future = None
+                if os.path.isfile(path) and self._should_deflate(path):
+                    future = pool.submit(_deflate_file, path, self.level)
+                pending.append((path, arcname, future))
+                if len(pending) > self.workers * 2: self._write_pending(pending.popleft())
+            while pending: self._write_pending(pending.popleft())
+
+    def _write_pending(self, item):
+        path, arcname, future = item
+        if future is None: self.write(path, arcname, compress=False)
+        else: self._write_deflated(path, arcname, future.result())
+
+    def write(self, path, arcname, compress=None):
+        """Добавляет файл или пустую папку."""
+        stat = os.stat(path)
+        if os.path.isdir(path):
+            arcname = arcname if isinstance(arcname, str) else arcname.as_posix()
+            entry = _Entry(arcname + '/', ZIP_STORED, stat.st_mtime, ((0o40000 | 0o775) << 16) | 0x10)
+            self._write_entry(entry, b'')
+            return
+        if compress is None: compress = self._should_deflate(path)
+        if compress:
+            self._write_deflated(path, arcname, _deflate_file(path, self.level))
+            return
+        # Без сжатия: CRC считается при копировании, заголовок дописывается после
+        entry = _Entry(arcname, ZIP_STORED, stat.st_mtime, (stat.st_mode & 0xFFFF) << 16)
+        entry.zip64 = stat.st_size >= ZIP64_LIMIT
+        entry.offset = self._fp.tell()
+        self._fp.write(entry.local_header())
+        crc = size = 0
+        with open(path, 'rb') as source:
+            while chunk := source.read(COPY_CHUNK_BYTES):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                self._fp.write(chunk)
+        if size >= ZIP64_LIMIT and not entry.zip64:
+            raise OSError(f"Файл '{path}' вырос во время записи архива")
+        entry.crc, entry.size, entry.compressed_size = crc, size, size
+        end = self._fp.tell()
+        self._fp.seek(entry.offset)
+        self._fp.write(entry.local_header())
+        self._fp.seek(end)
+        self._entries.append(entry)
+
+    def _write_deflated(self, path, arcname, result):
+        if result is None: # Несжимаемый файл
+            self.write(path, arcname, compress=False)
+            return
+        spool, crc, size, compressed_size = result
+        stat = os.stat(path)
+        entry = _Entry(arcname, ZIP_DEFLATED, stat.st_mtime, (stat.st_mode & 0xFFFF) << 16)
+        entry.crc, entry.size, entry.compressed_size = crc, size, compressed_size
+        with spool:
+            self._write_entry(entry, spool)
+
+    def writestr(self, arcname, data):
+        """Добавляет данные из памяти (манифесты)."""
+        if isinstance(data, str): data = data.encode('utf-8')
+        entry = _Entry(arcname, ZIP_DEFLATED if self.level > 0 else ZIP_STORED, time.time(), 0o600 << 16)
+        entry.crc, entry.size = zlib.crc32(data), len(data)
+        if entry.method == ZIP_DEFLATED:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+            data = compressor.compress(data) + compressor.flush()
+        entry.compressed_size = len(data)
+        self._write_entry(entry, data)
+
+    def _write_entry(self, entry, data):
+        """Пишет заголовок и данные (bytes или файл) члена с известными размерами."""
+        entry.zip64 = entry.size >= ZIP64_LIMIT or entry.compressed_size >= ZIP64_LIMIT
+        entry.offset = self._fp.tell()
+        self._fp.write(entry.local_header())
+        if isinstance(data, bytes):
+            self._fp.write(data)
+        else:
+            while chunk := data.read(COPY_CHUNK_BYTES):
+                self._fp.write(chunk)
+        self._entries.append(entry)
+
+    def close(self):
+        """Пишет центральный каталог (при необходимости - ZIP64) и закрывает файл."""
+        if self._fp.closed: return
+        directory_offset = self._fp.tell()
+        for entry in self._entries:
+            self._fp.write(entry.central_header())
+        directory_size = self._fp.tell() - directory_offset
+        count = len(self._entries)
+        if count >= ZIP64_COUNT_LIMIT or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+            zip64_end_offset = self._fp.tell()
+            self._fp.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0,
+                                       count, count, directory_size, directory_offset))
+            self._fp.write(struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1))
+        self._fp.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, ZIP64_COUNT_LIMIT),
+                                   min(count, ZIP64_COUNT_LIMIT), min(directory_size, ZIP64_LIMIT),
+                                   min(directory_offset, ZIP64_LIMIT), 0))
+        self._fp.close()
@@ -0,0 +1,121 @@
+# zadachi/cods/attachment_import.py
+
+import logging
+import os
+import shutil
+import threading
+import time
+
+from PySide6.QtCore import QCoreApplication, QObject, Signal
+
+from .file_utils import CopyCancelled, estimate_copy_size
+
+PROGRESS_INTERVAL_S = 0.1 # Не чаще: иначе тысячи мелких файлов завалят очередь событий Qt
+
+
+class AttachmentImportJob(QObject):
+    """Фоновое прикрепление ресурсов к команде: прогресс, отмена и откат частично скопированного.
+
+    Пути вложений команды меняются только после успешного завершения (в потоке интерфейса).
+    """
+    progress = Signal(object, object, int, str) # байт скопировано, байт всего, файлов, текущий файл
+    finished = Signal(bool, list)               # успех, скопированные файлы
+    _done = Signal()                            # Поток копирования -> поток интерфейса
+
+    def __init__(self, manager, command_id, subfolder_rel, target_subfolder_abs, options):
+        super().__init__()
+        self._manager = manager
+        self.command_id = command_id
+        self.subfolder_rel = subfolder_rel
+        self.target_subfolder_abs = target_subfolder_abs
+        self.options = {key: value for key, value in options.items() if key != 'folder_key'}
+        # Подпапку создало это задание - при откате она удаляется целиком
+        command = manager.find_by_id(command_id)
+        self._created_subfolder = command is None or command.get('subfolder') != subfolder_rel
+        self._existing_names = set(os.listdir(target_subfolder_abs)) if target_subfolder_abs.is_dir() else set()
+
+        self.added = {}          # {ключ путей: новые имена} - результат для команды
+        self.copied_files = []
+        self.sync_report = None  # Отчет об обновлении (режим sync), см. file_utils.new_sync_report
+        self.success = False
+        self.cancelled = False
+        self.error = None
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.files_done = 0
+        self._started = None
+        self._last_report = 0.0
+        self._cancel_event = threading.Event()
+        self._thread = None
+        self._done.connect(self._on_done)
+
+    def start(self):
+        """Запускает копирование; без цикла событий Qt выполняет его сразу."""
+        self._started = time.monotonic()
+        if QCoreApplication.instance() is None:
+            self._run()
+            return
+        self._thread = threading.Thread(target=self._run, name="AttachmentImport", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Просит прервать копирование (срабатывает на следующем файле)."""
+        self._cancel_event.set()
+
+    def throughput(self):
+        """Скорость копирования, байт/с."""
+        elapsed = time.monotonic() - self._started if self._started else 0
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+    def _report(self, path, nbytes):
+        """Обратный вызов копирования (в потоке копирования)."""
+        if self._cancel_event.is_set():
+            raise CopyCancelled()
+        self.bytes_done += nbytes
+        self.files_done += 1
+        now = time.monotonic()
+        if now - self._last_report >= PROGRESS_INTERVAL_S:
+            self._last_report = now
+            self.progress.emit(self.bytes_done, max(self.bytes_total, self.bytes_done), self.files_done, path.name)
+
+    def _run(self):
+        """Копирование в фоновом потоке; итог передается в поток интерфейса сигналом _done."""
+        try:
+            self.bytes_total = estimate_copy_size(self._manager._attachment_sources(self.options))
+            self.progress.emit(0, self.bytes_total, 0, "")
+            self.success, self.added, self.copied_files, self.sync_report = self._manager._copy_attachments(
+                self.target_subfolder_abs, self.options, self._report)
+        except CopyCancelled:
+            self.cancelled = True
+        except Exception as e: # В фоновом потоке исключение некому поймать
+            logging.exception("Ошибка прикрепления ресурсов")
+            self.error = str(e)
+        if self.cancelled or self.error is not None:
+            self._rollback()
+        self._done.emit()
+
+    def _rollback(self):
+        """Удаляет частично скопированное: новые элементы подпапки (или ее саму, если ее создало задание)."""
+        # Файлы, уже обновленные на месте (режим sync), остаются новыми: каждый скопирован целиком
+        self.added, self.copied_files, self.success, self.sync_report = {}, [], False, None
+        target = self.target_subfolder_abs
+        if not target.is_dir(): return
+        if self._created_subfolder:
+            shutil.rmtree(target, ignore_errors=True)
+            return
+        with os.scandir(target) as entries:
+            for entry in entries:
+                if entry.name in self._existing_names: continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.unlink(entry.path)
+
+    def _on_done(self):
+        """Завершение в потоке интерфейса: фиксация путей в команде и сигнал finished."""
+        if not self.cancelled and self.error is None:
+            # Частичная неудача (часть источников не найдена) фиксирует то, что скопировалось
+            if not self._manager._finish_attachment_import(self):
+                self.success = False
+        self.progress.emit(self.bytes_done, max(self.bytes_total, self.bytes_done), self.files_done, "")
+        self.finished.emit(self.success, self.copied_files)
@@ -0,0 +1,131 @@
+# zadachi/cods/backup_browser.py
+"""Просмотр резервной копии без распаковки: данные читаются из tasks.json прямо в ZIP-архиве.
+
+При восстановлении команды или папки распаковываются только файлы их подпапок (и снимки ссылок).
+Инкрементальная копия открывается вместе с цепочкой: неизменные файлы берутся из предыдущих архивов.
+"""
+import json
+import shutil
+import zipfile
+from pathlib import Path
+
+from .constants import LINKS_MANIFEST_NAME, COPY_CHUNK_BYTES
+from .records import Task, Command
+from .tar_archive import detect_archive_format
+from .backup_manifest import read_archive_manifest, backup_chain
+
+
+class BackupArchive:
+    """Резервная копия, открытая только для чтения (интерфейс чтения - как у TaskManager)."""
+
+    def __init__(self, archive_path):
+        self.path = Path(archive_path)
+        if detect_archive_format(self.path) != 'zip':
+            # tar читается только подряд: выборочный доступ без распаковки всего архива невозможен
+            raise ValueError(f"Просмотр доступен только для ZIP-архивов; '{self.path.name}' можно только импортировать.")
+        manifest = read_archive_manifest(self.path)
+        incremental = manifest is not None and manifest['kind'] == 'incremental'
+        self._chain = [path for path, _ in backup_chain(self.path)] if incremental else [self.path]
+        # Для каждого архива цепочки: имена в каталоге и манифест ссылок {имя: оригинал}
+        self._members = []
+        for path in self._chain:
+            with zipfile.ZipFile(path, 'r') as archive:
+                names = set(archive.namelist())
+                links = json.loads(archive.read(LINKS_MANIFEST_NAME).decode('utf-8')) \
+                    if LINKS_MANIFEST_NAME in names else {}
+            self._members.append((names, links))
+        # Файлы копии: по манифесту цепочки (удаленные после родителя не видны) или по каталогу архива
+        names, links = self._members[0]
+        self._files = set(manifest['files']) if incremental else names | set(links)
+
+        # Архив может хранить данные во вложенной папке (как при импорте)
+        self.prefix = ''
+        if 'tasks.json' not in self._files:
+            nested = sorted(name for name in self._files if name.count('/') == 1 and name.endswith('/tasks.json'))
+            if not nested: raise FileNotFoundError(f"Файл 'tasks.json' не найден в архиве {self.path}")
+            self.prefix = nested[0][:-len('tasks.json')]
+        data = json.loads(self.read(self.prefix + 'tasks.json').decode('utf-8'))
+        if not isinstance(data, dict): raise ValueError("Файл 'tasks.json' не содержит данных задачника")
+
+        self.pending_tasks = [Task(item) for item in data.get('pending', []) if isinstance(item, dict)]
+        self.completed_tasks = [Task(item) for item in data.get('completed', []) if isinstance(item, dict)]
+        commands_by_folder = data.get('useful_commands', {})
+        if not isinstance(commands_by_folder, dict): commands_by_folder = {}
+        self.useful_commands = {key: [Command(item) for item in commands if isinstance(item, dict)]
+                                for key, commands in commands_by_folder.items() if isinstance(commands, list)}
+        self.useful_commands.setdefault('root', [])
+
+    def _source(self, name):
+        """(путь архива, имя в нем) с содержимым файла name: самый новый архив цепочки, где он есть."""
+        for path, (names, links) in zip(self._chain, self._members):
+            if name in names: return path, name
+            if name in links: return path, links[name] # Одинаковые файлы упакованы один раз
+        raise FileNotFoundError(f"В цепочке копий нет файла '{name}'")
+
+    def read(self, name):
+        """Содержимое одного файла копии (распаковывается только он)."""
+        path, member = self._source(name)
+        with zipfile.ZipFile(path, 'r') as archive:
+            return archive.read(member)
+
+    def extract(self, prefixes, target_folder):
+        """Распаковывает в target_folder только файлы под префиксами {префикс в архиве: префикс на диске}."""
+        target_folder = Path(target_folder)
+        root = target_folder.resolve()
+
+        def target_for(target_rel):
+            target = target_folder / target_rel
+            # Имена из архива: только внутри папки
+            if not target.resolve().is_relative_to(root): raise ValueError(f"Недопустимое имя в архиве: {target_rel}")
+            return target
+
+        wanted = {} # Имя в копии -> путь относительно target_folder
+        for name in self._files:
+            for archive_prefix, target_prefix in prefixes.items():
+                if name.startswith(archive_prefix):
+                    wanted[name] = target_prefix + name[len(archive_prefix):]
+                    break
+        by_archive = {}
+        for name, target_rel in wanted.items():
+            if name.endswith('/'): # Пустая папка
+                target_for(target_rel).mkdir(parents=True, exist_ok=True)
+                continue
+            path, member = self._source(name)
+            by_archive.setdefault(path, []).append((member, target_rel))
+
+        count = 0
+        for path, items in by_archive.items(): # Каждый архив цепочки открывается один раз
+            with zipfile.ZipFile(path, 'r') as archive:
+                for member, target_rel in items:
+                    target = target_for(target_rel)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    target.unlink(missing_ok=True) # Ссылка на блоб заменяется, а не переписывается на месте
+                    with archive.open(member) as source, open(target, 'wb') as output:
+                        shutil.copyfileobj(source, output, COPY_CHUNK_BYTES)
+                    count += 1
+        return count
+
+    # --- Чтение (как у TaskManager: используется списками UI) ---
+
+    def is_completed_loaded(self):
+        return True
+
+    def task_location(self, task_id):
+        """(is_completed, индекс) задачи копии по ID или None."""
+        for is_completed, tasks in ((False, self.pending_tasks), (True, self.completed_tasks)):
+            for idx, task in enumerate(tasks):
+                if task.id == task_id: return is_completed, idx
+        return None
+
+    def command_location(self, command_id):
+        """(ключ папки, индекс) команды копии по ID или None."""
+        for folder_key, commands in self.useful_commands.items():
+            for idx, command in enumerate(commands):
+                if command.id == command_id: return folder_key, idx
+        return None
+
+    def child_command_folders(self, folder_key):
+        """Ключи прямых подпапок логической папки."""
+        prefix = '' if folder_key == 'root' else folder_key + '/'
+        return [key for key in self.useful_commands
+                if key != 'root' and key.startswith(prefix) and '/' not in key[len(prefix):]]
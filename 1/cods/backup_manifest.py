@@ -0,0 +1,156 @@
+# zadachi/cods/backup_manifest.py
+"""Инкрементальные резервные копии: манифест файлов в архиве и цепочка архивов до полной копии.
+
+Каждый архив экспорта содержит BACKUP_MANIFEST_NAME: все файлы папки задач на момент копии
+({имя в архиве: [размер, время изменения (нс), хеш]}), удаленные с прошлой копии имена и имя
+родительского архива. Инкрементальный архив хранит только новые и измененные файлы; остальные
+берутся из предыдущих архивов цепочки при восстановлении.
+"""
+import json
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .constants import BACKUP_MANIFEST_NAME, LINKS_MANIFEST_NAME, COPY_WORKERS
+from .blob_store import _hash_file
+from .file_utils import find_unique_path
+
+MANIFEST_FORMAT = 1
+
+
+def read_archive_manifest(archive_path):
+    """Манифест копии из ZIP-архива; None - архив без манифеста (старый экспорт или tar)."""
+    if not zipfile.is_zipfile(archive_path): return None
+    with zipfile.ZipFile(archive_path, 'r') as archive:
+        if BACKUP_MANIFEST_NAME not in archive.namelist(): return None
+        return json.loads(archive.read(BACKUP_MANIFEST_NAME).decode('utf-8'))
+
+
+def build_manifest(members, previous_files=None):
+    """Записи манифеста для членов [(путь, имя в архиве)].
+
+    Без previous_files (полная копия) файлы не читаются: хеш None, записываются только размер и время.
+    Для инкрементальной копии хеш считается лишь у файлов, чей размер или время отличаются от родителя.
+    """
+    hash_files = previous_files is not None
+    previous_files = previous_files or {}
+    files, to_hash = {}, []
+    for path, arcname in members:
+        name = Path(arcname).as_posix()
+        stat = os.stat(path)
+        if os.path.isdir(path): # Пустая папка
+            files[name + '/'] = [0, 0, None]
+            continue
+        previous = previous_files.get(name)
+        if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+            files[name] = previous
+        else:
+            files[name] = [stat.st_size, stat.st_mtime_ns, None]
+            if hash_files: to_hash.append((name, path))
+    # Хеширование читает файлы целиком: параллельно (hashlib отпускает GIL)
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+        for (name, _), digest in zip(to_hash, pool.map(lambda item: _hash_file(item[1]), to_hash)):
+            files[name][2] = digest
+    return files
+
+
+def new_manifest(files, parent_manifest=None, parent_name=None):
+    """Манифест копии; с parent_manifest - инкрементальной (с именами, удаленными после родителя)."""
+    removed = sorted(set(parent_manifest['files']) - set(files)) if parent_manifest else []
+    return {'format': MANIFEST_FORMAT, 'kind': 'incremental' if parent_manifest else 'full',
+            'created': time.time(), 'parent': parent_name, 'files': files, 'removed': removed}
+
+
+def changed_members(members, files, parent_files):
+    """Члены, содержимое которых отличается от родительской копии (новые или с другим хешем)."""
+    changed = []
+    for path, arcname in members:
+        name = Path(arcname).as_posix()
+        if name not in files: name += '/'
+        previous = parent_files.get(name)
+        if previous is None or previous[2] != files[name][2]:
+            changed.append((path, arcname))
+    return changed
+
+
+def parent_reference(base_archive, archive_path):
+    """Имя родителя в манифесте: путь base_archive относительно папки новой копии."""
+    return Path(os.path.relpath(base_archive, Path(archive_path).parent)).as_posix()
+
+
+def next_incremental_path(previous_archive):
+    """Имя следующей копии рядом с предыдущей: <имя полной копии>.<время>.inc.zip."""
+    previous_archive = Path(previous_archive)
+    base_stem = previous_archive.name.split('.')[0]
+    return find_unique_path(previous_archive.with_name(f"{base_stem}.{time.strftime('%Y%m%d-%H%M%S')}.inc.zip"))
+
+
+def backup_chain(archive_path):
+    """Архивы цепочки от archive_path до полной копии: [(путь, манифест)]."""
+    chain, seen = [], set()
+    path = Path(archive_path)
+    while True:
+        if path.resolve() in seen: raise ValueError(f"Цепочка резервных копий зациклена на '{path.name}'")
+        seen.add(path.resolve())
+        if not path.is_file():
+            raise FileNotFoundError(f"Не найдена копия цепочки '{path.name}' (нужна для восстановления)")
+        manifest = read_archive_manifest(path)
+        if manifest is None: raise ValueError(f"Архив '{path.name}' не содержит манифеста копии")
+        chain.append((path, manifest))
+        if manifest['kind'] == 'full' or not manifest.get('parent'): return chain
+        path = path.parent / manifest['parent']
+
+
+def materialize_backup(archive_path, target_folder):
+    """Восстанавливает в target_folder состояние папки задач на момент копии archive_path.
+
+    Каждый файл берется из самого нового архива цепочки, где он есть. Одинаковые файлы одного архива
+    записываются в манифест ссылок (как при обычном экспорте), чтобы импорт восстановил их через блобы.
+    """
+    target_folder = Path(target_folder)
+    root = target_folder.resolve()
+    chain = backup_chain(archive_path)
+    files = chain[0][1]['files']
+
+    def target_for(name):
+        target = target_folder / name
+        # Имена из архива: только внутри папки
+        if not target.resolve().is_relative_to(root): raise ValueError(f"Недопустимое имя в архиве: {name}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        return target
+
+    needed = set()
+    for name in files:
+        if name.endswith('/'): target_for(name).mkdir(exist_ok=True)
+        else: needed.add(name)
+
+    restored_links = {}
+    for path, _ in chain:
+        if not needed: break
+        with zipfile.ZipFile(path, 'r') as archive:
+            names = set(archive.namelist())
+            archive_links = {}
+            if LINKS_MANIFEST_NAME in names:
+                archive_links = json.loads(archive.read(LINKS_MANIFEST_NAME).decode('utf-8'))
+            stored = needed & names
+            linked = needed.intersection(archive_links)
+            for name in stored:
+                with archive.open(name) as source, open(target_for(name), 'wb') as target:
+                    shutil.copyfileobj(source, target)
+            for name in linked:
+                original = archive_links[name]
+                if original in stored: # Оригинал тоже восстановлен из этого архива
+                    restored_links[name] = original
+                    continue
+                with archive.open(original) as source, open(target_for(name), 'wb') as target:
+                    shutil.copyfileobj(source, target)
+            needed -= stored | linked
+    if needed:
+        raise FileNotFoundError(f"В цепочке копий нет {len(needed)} файлов, например '{sorted(needed)[0]}'")
+    if restored_links:
+        (target_folder / LINKS_MANIFEST_NAME).write_text(json.dumps(restored_links, ensure_ascii=False, indent=1),
+                                                        encoding='utf-8')
+    return len(files)
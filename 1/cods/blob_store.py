@@ -0,0 +1,177 @@
+# zadachi/cods/blob_store.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from .constants import LINKS_MANIFEST_NAME
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def _hash_file(path):
+    """Хеш содержимого файла (blake2b, читается блоками)."""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Хранилище вложений по хешу содержимого: файлы команд - жесткие ссылки на блобы.
+
+    Счетчик ссылок - число жестких ссылок блоба (st_nlink), поэтому отдельный учет не нужен:
+    блоб с единственной ссылкой (своей) больше никем не используется.
+    Ссылки делят содержимое: перед правкой файл отделяется копией (detach), а блоб, измененный
+    на месте в обход этого, проверяется по хешу и не выдается новым ссылкам.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.enabled = True # Выключается, если файловая система не умеет жесткие ссылки
+
+    def _blob_path(self, digest):
+        return self.root / digest[:2] / digest
+
+    def store_file(self, source_file, target_file):
+        """Кладет содержимое source_file в target_file ссылкой на блоб; False - копировать обычным образом."""
+        if not self.enabled: return False
+        digest = _hash_file(source_file)
+        blob = self._blob_path(digest)
+        try:
+            if not self._is_intact(blob, digest):
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                # Копия под временным именем и os.link: одновременная вставка того же блоба не портит его
+                fd, tmp_name = tempfile.mkstemp(dir=blob.parent, prefix='.tmp-')
+                os.close(fd)
+                try:
+                    shutil.copy2(source_file, tmp_name)
+                    os.link(tmp_name, blob)
+                except FileExistsError:
+                    pass # Блоб успели добавить параллельно
+                finally:
+                    os.unlink(tmp_name)
+            self._link(blob, target_file)
+        except OSError as e:
+            # Нет жестких ссылок (FAT, часть сетевых дисков) или превышен их предел
+            logging.warning(f"Хранилище вложений недоступно, обычное копирование: {e}")
+            self.enabled = False
+            return False
+        return True
+
+    def adopt(self, path):
+        """Заменяет уже лежащий в папке задач файл ссылкой на блоб (или делает его блобом)."""
+        if not self.enabled: return False
+        digest = _hash_file(path)
+        blob = self._blob_path(digest)
+        try:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            if not self._is_intact(blob, digest):
+                os.link(path, blob) # Файл сам становится блобом - копирование не нужно
+                return True
+            self._link(blob, path)
+        except OSError as e:
+            logging.warning(f"Хранилище вложений недоступно: {e}")
+            self.enabled = False
+            return False
+        return True
+
+    @staticmethod
+    def _is_intact(blob, digest):
+        """Есть ли блоб с содержимым digest; измененный через одну из ссылок выводится из хранилища."""
+        if not blob.exists(): return False
+        if _hash_file(blob) == digest: return True
+        # Прежние ссылки остаются файлами с измененным содержимым, новые получат свежий блоб
+        logging.warning(f"Блоб '{blob.name}' изменен на месте через ссылку, заменяется новым")
+        blob.unlink()
+        return False
+
+    @staticmethod
+    def detach(path):
+        """Делает файл-ссылку отдельной копией (копирование при записи); True - ссылка разорвана."""
+        path = Path(path)
+        if os.stat(path).st_nlink <= 1: return False
+        tmp_path = path.with_name(f".{path.name}.blobtmp")
+        shutil.copy2(path, tmp_path)
+        os.replace(tmp_path, path)
+        return True
+
+    @staticmethod
+    def _link(blob, target_file):
+        """Жесткая ссылка на блоб вместо target_file (существующий файл заменяется атомарно)."""
+        target_file = Path(target_file)
+        tmp_target = target_file.with_name(f".{target_file.name}.blobtmp")
+        tmp_target.unlink(missing_ok=True)
+        os.link(blob, tmp_target)
+        os.replace(tmp_target, target_file)
+
+    def collect(self):
+        """Удаляет блобы без ссылок из папок команд: (число блобов, освобождено байт)."""
+        removed, freed = 0, 0
+        if not self.root.is_dir(): return removed, freed
+        with os.scandir(self.root) as buckets:
+            for bucket in buckets:
+                if not bucket.is_dir(follow_symlinks=False): continue
+                with os.scandir(bucket.path) as blobs:
+                    for blob in blobs:
+                        # os.stat, а не DirEntry.stat: в Windows у DirEntry нет st_nlink
+                        stat = os.stat(blob.path)
+                        if stat.st_nlink <= 1:
+                            os.unlink(blob.path)
+                            removed += 1
+                            freed += stat.st_size
+        return removed, freed
+
+
+def dedup_archive_members(members):
+    """Убирает повторы жестких ссылок из файлов архива.
+
+    members - [(путь, имя в архиве)]; возвращает (уникальные члены, {имя-ссылка: имя-оригинал}).
+    """
+    unique, links, seen = [], {}, {}
+    for path, arcname in members:
+        stat = os.stat(path)
+        if stat.st_nlink > 1 and os.path.isfile(path):
+            key = (stat.st_dev, stat.st_ino)
+            if key in seen:
+                links[Path(arcname).as_posix()] = seen[key]
+                continue
+            seen[key] = Path(arcname).as_posix()
+        unique.append((path, arcname))
+    return unique, links
+
+
+def write_links_manifest(zipf, links):
+    """Пишет в архив список ссылок (если есть)."""
+    if links:
+        zipf.writestr(LINKS_MANIFEST_NAME, json.dumps(links, ensure_ascii=False, indent=1))
+
+
+def restore_links(folder, blob_store=None):
+    """Восстанавливает файлы-ссылки после распаковки архива (через хранилище блобов или копированием)."""
+    folder = Path(folder)
+    manifest_path = folder / LINKS_MANIFEST_NAME
+    if not manifest_path.is_file(): return 0
+    links = json.loads(manifest_path.read_text(encoding='utf-8'))
+    adopted = set()
+    root = folder.resolve()
+    for link_name, original_name in links.items():
+        original = folder / original_name
+        target = folder / link_name
+        # Имена из архива: только внутри папки
+        if not target.resolve().is_relative_to(root) or not original.resolve().is_relative_to(root): continue
+        if not original.is_file(): continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if blob_store is not None and blob_store.enabled:
+            if original_name not in adopted:
+                blob_store.adopt(original)
+                adopted.add(original_name)
+            if blob_store.store_file(original, target): continue
+        shutil.copy2(original, target)
+    manifest_path.unlink()
+    return len(links)
@@ -7,13 +7,17 @@ from typing import Dict, Any, Optional, List, Tuple
 
 # Импортируем константы
 from .constants import (PDF_EXTENSIONS, IMG_EXTENSIONS, PY_EXTENSIONS, WEB_EXTENSIONS,
-                        DEFAULT_COMMAND_FIELDS, MAX_PATH_LENGTH)
+                        MAX_PATH_LENGTH, FOLDERS_PART, REFS_FOLDER_NAME)
+from .shard_store import command_part
+from .records import Command
 
 # Импортируем утилиты для работы с файлами
 from .file_utils import (
-    prepare_subfolder, copy_resource, copy_folder_recursive_filtered,
-    find_unique_path, generate_safe_foldername
+    prepare_subfolder, copy_resource, copy_folder_recursive_filtered, sync_folder, new_sync_report,
+    find_unique_path, note_created, generate_safe_foldername, ProgressCallback
 )
+from .attachment_import import AttachmentImportJob
+from .references import resolve_reference, reference_snapshot_rel
 
 # Импортируем UI для критических сообщений
 from PySide6.QtWidgets import QMessageBox
@@ -22,32 +26,26 @@ from PySide6.QtWidgets import QMessageBox
 class CommandMixin:
     """Миксин для управления командами."""
 
-    def _get_command_and_subfolder(self, command_idx: int, folder_key: str) -> Tuple[Dict[str, Any], Optional[Path]]:
-        """Получает команду и абсолютный путь к подпапке."""
-        commands_list = self.useful_commands[folder_key] # Прямой доступ
-        command = commands_list[command_idx] # Прямой доступ
+    def _prepare_command_subfolder(self, command: Command, folder_key: str) -> Tuple[Optional[str], Optional[Path]]:
+        """Создает (находит) подпапку команды, не меняя саму команду: (относительный путь, абсолютный путь)."""
         command_name = command.get('name', 'unnamed_command')
-        existing_subfolder_rel = command.get('subfolder')
-
         subfolder_rel = prepare_subfolder( # Прямой вызов file_utils
-            self.tasks_folder, command_name, existing_subfolder_rel, base_folder_key=folder_key
+            self.tasks_folder, command_name, command.get('subfolder'), base_folder_key=folder_key
         )
 
         if subfolder_rel is None:
-            command['subfolder'] = None
             QMessageBox.critical(None, "Ошибка папки", f"Не удалось создать/найти подпапку для '{command_name}'.")
-            return command, None
-
-        command['subfolder'] = subfolder_rel
-        target_subfolder_abs = self.tasks_folder / subfolder_rel.replace('/', os.sep)
-        return command, target_subfolder_abs
+            return None, None
+        return subfolder_rel, self.tasks_folder / subfolder_rel.replace('/', os.sep)
 
     def _process_simple_resource(self,
-                                 command: Dict[str, Any], target_subfolder_abs: Path,
+                                 added: Dict[str, List[str]], target_subfolder_abs: Path,
                                  all_copied_files_paths: List[str], kwargs: Dict[str, Any],
                                  kwarg_key: str, command_key: str, is_list: bool = False,
-                                 copy_args: Optional[Dict[str, Any]] = None) -> bool:
-        """Обрабатывает копирование простых ресурсов."""
+                                 copy_args: Optional[Dict[str, Any]] = None,
+                                 progress: Optional[ProgressCallback] = None,
+                                 sync_report: Optional[Dict[str, Any]] = None) -> bool:
+        """Обрабатывает копирование простых ресурсов (имена копий - в added[command_key])."""
         source_value = kwargs.get(kwarg_key)
         if source_value is None: return True
 
@@ -61,12 +59,12 @@ class CommandMixin:
             if not source or not isinstance(source, (str, Path)): continue
 
             result_name, copied_paths = copy_resource( # Прямой вызов file_utils
-                str(source), target_subfolder_abs, self.tasks_folder, **copy_args
+                str(source), target_subfolder_abs, self.tasks_folder, progress=progress,
+                sync_report=sync_report, use_hash=bool(kwargs.get('use_hash')), **copy_args
             )
 
             if result_name:
-                if result_name not in command[command_key]:
-                    command[command_key].append(result_name)
+                added.setdefault(command_key, []).append(result_name)
                 all_copied_files_paths.extend(copied_paths)
             else:
                 operation_succeeded = False # Ошибка при копировании хотя бы одного
@@ -74,8 +72,10 @@ class CommandMixin:
         return operation_succeeded
 
     def _process_py_folder(self,
-                           command: Dict[str, Any], target_subfolder_abs: Path,
-                           all_copied_files_paths: List[str], kwargs: Dict[str, Any]) -> bool:
+                           added: Dict[str, List[str]], target_subfolder_abs: Path,
+                           all_copied_files_paths: List[str], kwargs: Dict[str, Any],
+                           progress: Optional[ProgressCallback] = None,
+                           sync_report: Optional[Dict[str, Any]] = None) -> bool:
         """Обрабатывает копирование Python папки."""
         py_folder_str = kwargs.get('py_folder')
         if not py_folder_str: return True
@@ -85,24 +85,41 @@ class CommandMixin:
 
         original_py_container_name = py_folder_path.name
         base_target_py_container_abs = target_subfolder_abs / original_py_container_name
-        final_target_py_container_abs = find_unique_path(base_target_py_container_abs) # Прямой вызов file_utils
-
-        if final_target_py_container_abs is None: return False # Не нашли имя
+        use_hash = bool(kwargs.get('use_hash'))
+        # Обновление: уже прикрепленная папка с тем же именем обновляется на месте
+        syncing = sync_report is not None and base_target_py_container_abs.is_dir()
+        if syncing:
+            final_target_py_container_abs = base_target_py_container_abs
+        else:
+            final_target_py_container_abs = find_unique_path(base_target_py_container_abs) # Прямой вызов file_utils
 
         final_py_container_name = final_target_py_container_abs.name
         final_target_py_container_abs.mkdir(parents=True, exist_ok=True) # Прямой вызов
+        note_created(final_target_py_container_abs)
 
         py_root_copy_success = True
         allowed_root_exts = PY_EXTENSIONS.union({'.json'})
+        source_root_names = set()
         for item in py_folder_path.iterdir():
             if item.is_file() and item.suffix.lower() in allowed_root_exts:
+                 source_root_names.add(item.name)
                  # Прямой вызов file_utils.copy_resource
                  _, copied_paths = copy_resource(
                      str(item), final_target_py_container_abs, self.tasks_folder,
-                     allowed_extensions=allowed_root_exts
+                     allowed_extensions=allowed_root_exts, progress=progress,
+                     sync_report=sync_report, use_hash=use_hash
                  )
                  if copied_paths: all_copied_files_paths.extend(copied_paths)
                  # Игнорируем неуспех копирования отдельного файла для общего статуса
+        if syncing:
+            # Корневые файлы, удаленные из источника, удаляются и из копии
+            with os.scandir(final_target_py_container_abs) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False) and entry.name not in source_root_names \
+                            and os.path.splitext(entry.name)[1].lower() in allowed_root_exts:
+                        os.unlink(entry.path)
+                        sync_report['removed'].append(
+                            Path(entry.path).relative_to(self.tasks_folder).as_posix())
 
         additional_folders = kwargs.get('additional_folders', [])
         py_filter_exts = PY_EXTENSIONS.union(WEB_EXTENSIONS)
@@ -110,21 +127,87 @@ class CommandMixin:
             for add_folder_name in additional_folders:
                 source_add_abs = py_folder_path / add_folder_name
                 target_add_abs = final_target_py_container_abs / add_folder_name
-                if source_add_abs.is_dir():
+                if source_add_abs.is_dir() and syncing:
+                    changed_before = len(sync_report['added']), len(sync_report['updated'])
+                    sync_folder(source_add_abs, target_add_abs, self.tasks_folder, py_filter_exts, # Прямой вызов
+                                use_hash, progress, sync_report)
+                    all_copied_files_paths.extend(sync_report['added'][changed_before[0]:])
+                    all_copied_files_paths.extend(sync_report['updated'][changed_before[1]:])
+                elif source_add_abs.is_dir():
                     # Прямой вызов file_utils.copy_folder_recursive_filtered
                     copied_add = copy_folder_recursive_filtered(
-                        source_add_abs, target_add_abs, self.tasks_folder, py_filter_exts
+                        source_add_abs, target_add_abs, self.tasks_folder, py_filter_exts, progress
                     )
                     all_copied_files_paths.extend(copied_add)
+                    if sync_report is not None: sync_report['added'].extend(copied_add)
 
         if any(final_target_py_container_abs.iterdir()):
-            if final_py_container_name not in command['py_paths']:
-                command['py_paths'].append(final_py_container_name)
+            added.setdefault('py_paths', []).append(final_py_container_name)
         else:
              final_target_py_container_abs.rmdir() # Прямой вызов (может вызвать OSError)
 
         return py_root_copy_success # Считаем успехом, если не было ошибок ОС при копировании корневых
 
+    def _copy_attachments(self, target_subfolder_abs: Path, kwargs: Dict[str, Any],
+                          progress: Optional[ProgressCallback] = None
+                          ) -> Tuple[bool, Dict[str, List[str]], List[str], Optional[Dict[str, Any]]]:
+        """Копирует ресурсы в подпапку команды, не трогая данные команды (можно вызывать в фоновом потоке).
+
+        Возвращает (успех, {ключ путей: новые имена}, скопированные файлы, отчет об обновлении).
+        С kwargs['sync'] уже прикрепленные ресурсы обновляются на месте, отчет - new_sync_report(), иначе None.
+        """
+        all_copied_files_paths = []
+        added = {}
+        sync_report = new_sync_report() if kwargs.get('sync') else None
+        overall_success = True
+        overall_success &= self._process_simple_resource(
+            added, target_subfolder_abs, all_copied_files_paths, kwargs,
+            'ino_folder', 'ino_paths', copy_args={'is_folder': True, 'include_subdirs': True}, progress=progress,
+            sync_report=sync_report)
+        overall_success &= self._process_py_folder(
+            added, target_subfolder_abs, all_copied_files_paths, kwargs, progress=progress, sync_report=sync_report)
+        overall_success &= self._process_simple_resource(
+            added, target_subfolder_abs, all_copied_files_paths, kwargs,
+            'pdf_files', 'pdf_paths', is_list=True, copy_args={'allowed_extensions': PDF_EXTENSIONS},
+            progress=progress, sync_report=sync_report)
+        overall_success &= self._process_simple_resource(
+            added, target_subfolder_abs, all_copied_files_paths, kwargs,
+            'img_files', 'img_paths', is_list=True, copy_args={'allowed_extensions': IMG_EXTENSIONS},
+            progress=progress, sync_report=sync_report)
+        return overall_success, added, all_copied_files_paths, sync_report
+
+    def _attachment_sources(self, kwargs: Dict[str, Any]) -> List[Path]:
+        """Источники, которые скопирует _copy_attachments (для оценки объема)."""
+        sources = []
+        if kwargs.get('ino_folder'): sources.append(Path(kwargs['ino_folder']))
+        py_folder_str = kwargs.get('py_folder')
+        if py_folder_str and Path(py_folder_str).is_dir():
+            py_folder_path = Path(py_folder_str)
+            allowed_root_exts = PY_EXTENSIONS.union({'.json'})
+            sources.extend(item for item in py_folder_path.iterdir()
+                           if item.is_file() and item.suffix.lower() in allowed_root_exts)
+            sources.extend(py_folder_path / name for name in kwargs.get('additional_folders') or [])
+        for key in ('pdf_files', 'img_files'):
+            sources.extend(Path(path) for path in kwargs.get(key) or [] if path)
+        return [path for path in sources if path.exists()]
+
+    def _commit_attachments(self, command: Command, folder_key: str, subfolder_rel: Optional[str],
+                            target_subfolder_abs: Path, added: Dict[str, List[str]],
+                            sources: Optional[Dict[str, Any]] = None) -> bool:
+        """Записывает скопированные ресурсы в команду и сохраняет ее папку."""
+        command['subfolder'] = subfolder_rel
+        for key in ['ino_paths', 'py_paths', 'pdf_paths', 'img_paths']: command.setdefault(key, [])
+        for key, names in added.items():
+            for name in names:
+                if name not in command[key]: command[key].append(name)
+        if sources: self._remember_sources(command, sources, added)
+
+        if target_subfolder_abs.exists() and not any(target_subfolder_abs.iterdir()):
+            target_subfolder_abs.rmdir() # Прямой вызов
+            command['subfolder'] = None
+
+        return self.save_tasks(parts={command_part(folder_key)}) # Прямой вызов
+
     def add_command(self, name, folder_key='root', **kwargs):
         """Добавляет команду."""
         if not name or not isinstance(folder_key, str) or not folder_key: return False, []
@@ -137,8 +220,7 @@ class CommandMixin:
                      return False, []
              else: self.useful_commands['root'] = []
 
-        new_command = DEFAULT_COMMAND_FIELDS.copy()
-        new_command['name'] = name
+        new_command = Command({'name': name}) # Остальные поля - значения по умолчанию
         self.useful_commands.setdefault(folder_key, []).append(new_command)
         command_idx = len(self.useful_commands[folder_key]) - 1
 
@@ -146,7 +228,7 @@ class CommandMixin:
         success, copied_files = self.update_command_folders(command_idx, folder_key, **kwargs)
 
         # Прямой вызов save_tasks
-        if not self.save_tasks():
+        if not self.save_tasks(parts={command_part(folder_key)}):
             success = False
             # Простейший откат без try-except
             if folder_key in self.useful_commands and 0 <= command_idx < len(self.useful_commands[folder_key]):
@@ -156,35 +238,107 @@ class CommandMixin:
         return success, copied_files
 
     def update_command_folders(self, command_idx: int, folder_key: str, **kwargs: Any) -> Tuple[bool, List[str]]:
-        """Обновляет ресурсы команды."""
-        all_copied_files_paths = []
-        overall_success = True
-
-        # Прямой вызов без try-except (может выбросить IndexError/KeyError)
-        command, target_subfolder_abs = self._get_command_and_subfolder(command_idx, folder_key)
-
-        if target_subfolder_abs is None: return False, [] # Ошибка подготовки папки
+        """Обновляет ресурсы команды (синхронно; из интерфейса - start_attachment_import).
 
-        for key in ['ino_paths', 'py_paths', 'pdf_paths', 'img_paths']: command.setdefault(key, [])
+        sync=True - режим обновления: копируются только новые и измененные файлы (use_hash=True -
+        сравнение по содержимому), исчезнувшие из источника удаляются.
+        """
+        success, copied_files, _ = self._update_command_folders(command_idx, folder_key, kwargs)
+        return success, copied_files
 
-        overall_success &= self._process_simple_resource(
-            command, target_subfolder_abs, all_copied_files_paths, kwargs,
-            'ino_folder', 'ino_paths', copy_args={'is_folder': True, 'include_subdirs': True})
-        overall_success &= self._process_py_folder(
-            command, target_subfolder_abs, all_copied_files_paths, kwargs)
-        overall_success &= self._process_simple_resource(
-            command, target_subfolder_abs, all_copied_files_paths, kwargs,
-            'pdf_files', 'pdf_paths', is_list=True, copy_args={'allowed_extensions': PDF_EXTENSIONS})
-        overall_success &= self._process_simple_resource(
-            command, target_subfolder_abs, all_copied_files_paths, kwargs,
-            'img_files', 'img_paths', is_list=True, copy_args={'allowed_extensions': IMG_EXTENSIONS})
+    def sync_command_folders(self, command_idx: int, folder_key: str, use_hash: bool = False,
+                             **kwargs: Any) -> Tuple[bool, Dict[str, Any]]:
+        """Обновляет уже прикрепленные ресурсы на месте: (успех, отчет {added, updated, removed, unchanged})."""
+        kwargs.update(sync=True, use_hash=use_hash)
+        success, _, sync_report = self._update_command_folders(command_idx, folder_key, kwargs)
+        return success, sync_report or new_sync_report()
 
-        if target_subfolder_abs.exists() and not any(target_subfolder_abs.iterdir()):
-            target_subfolder_abs.rmdir() # Прямой вызов
+    def _update_command_folders(self, command_idx: int, folder_key: str, kwargs: Dict[str, Any]
+                                ) -> Tuple[bool, List[str], Optional[Dict[str, Any]]]:
+        # Прямой доступ без try-except (может выбросить IndexError/KeyError)
+        command = self.useful_commands[folder_key][command_idx]
+        subfolder_rel, target_subfolder_abs = self._prepare_command_subfolder(command, folder_key)
+        if target_subfolder_abs is None:
             command['subfolder'] = None
-
-        if not self.save_tasks(): overall_success = False # Прямой вызов
-        return overall_success, all_copied_files_paths
+            return False, [], None # Ошибка подготовки папки
+
+        overall_success, added, all_copied_files_paths, sync_report = self._copy_attachments(
+            target_subfolder_abs, kwargs)
+        if not self._commit_attachments(command, folder_key, subfolder_rel, target_subfolder_abs, added, kwargs):
+            overall_success = False
+        return overall_success, all_copied_files_paths, sync_report
+
+    def start_attachment_import(self, command_id: str, **kwargs: Any) -> Optional[AttachmentImportJob]:
+        """Запускает фоновое прикрепление ресурсов к команде с данным ID (None - не удалось начать)."""
+        location = self.command_location(command_id)
+        if location is None or command_id in self._attachment_jobs: return None
+        folder_key, command_idx = location
+        command = self.useful_commands[folder_key][command_idx]
+        subfolder_rel, target_subfolder_abs = self._prepare_command_subfolder(command, folder_key)
+        if target_subfolder_abs is None: return None
+
+        job = AttachmentImportJob(self, command_id, subfolder_rel, target_subfolder_abs, kwargs)
+        self._attachment_jobs[command_id] = job
+        job.finished.connect(lambda *args: self._attachment_jobs.pop(command_id, None))
+        return job
+
+    def _finish_attachment_import(self, job: AttachmentImportJob) -> bool:
+        """Фиксирует результат завершенного задания в команде (в потоке интерфейса)."""
+        location = self.command_location(job.command_id)
+        if location is None: return False # Команду удалили во время копирования
+        folder_key, command_idx = location
+        command = self.useful_commands[folder_key][command_idx]
+        return self._commit_attachments(command, folder_key, job.subfolder_rel, job.target_subfolder_abs,
+                                        job.added, job.options)
+
+    def _remember_sources(self, command: Command, kwargs: Dict[str, Any], added: Dict[str, List[str]]):
+        """Запоминает исходные папки прикрепленных .ino/.py (для слежения за источником)."""
+        sources = dict(command.get('source_folders') or {})
+        if 'ino_paths' in added and kwargs.get('ino_folder'):
+            sources['ino_folder'] = str(Path(kwargs['ino_folder']).resolve())
+        if 'py_paths' in added and kwargs.get('py_folder'):
+            sources['py_folder'] = str(Path(kwargs['py_folder']).resolve())
+            sources['additional_folders'] = list(kwargs.get('additional_folders') or [])
+        if sources != command.get('source_folders'):
+            command['source_folders'] = sources # Новый словарь: снимок фоновой записи не разделяет старый
+            if command.get('watch_source'): self.source_watcher.refresh()
+
+    # --- Вложения-ссылки (без копирования) ---
+
+    def add_command_references(self, folder_key, command_idx, paths):
+        """Прикрепляет внешние файлы/папки ссылками: мгновенно, независимо от размера."""
+        # Прямой доступ (может вызвать IndexError/KeyError)
+        command = self.useful_commands[folder_key][command_idx]
+        ref_paths = list(command.get('ref_paths') or [])
+        for path in paths:
+            if not path or not Path(path).exists(): continue
+            resolved = str(Path(path).resolve())
+            if resolved not in ref_paths: ref_paths.append(resolved)
+        if ref_paths == command.get('ref_paths'): return False # Нечего добавлять
+        command['ref_paths'] = ref_paths
+        return self.save_tasks(parts={command_part(folder_key)}) # Прямой вызов
+
+    def remove_command_reference(self, folder_key, command_idx, ref_path):
+        """Убирает ссылку из команды; внешний путь не трогается, удаляется только снимок из архива."""
+        command = self.useful_commands[folder_key][command_idx]
+        if ref_path not in (command.get('ref_paths') or []): return False
+        command['ref_paths'] = [path for path in command['ref_paths'] if path != ref_path]
+        snapshot_dir = self.tasks_folder / reference_snapshot_rel(command.id, ref_path).parent
+        if snapshot_dir.exists(): shutil.rmtree(snapshot_dir) # Прямой вызов
+        return self.save_tasks(parts={command_part(folder_key)}) # Прямой вызов
+
+    def resolve_reference(self, command, ref_path):
+        """Путь, по которому сейчас доступна ссылка команды (исходный или снимок из архива), или None."""
+        return resolve_reference(self.tasks_folder, command.id, ref_path)
+
+    def set_watch_source(self, folder_key, command_idx, enabled):
+        """Включает (выключает) перенос изменений исходных папок команды в ее вложения."""
+        # Прямой доступ (может вызвать IndexError/KeyError)
+        command = self.useful_commands[folder_key][command_idx]
+        if enabled and not command.get('source_folders'): return False # Нечего наблюдать
+        command['watch_source'] = bool(enabled)
+        self.source_watcher.refresh()
+        return self.save_tasks(parts={command_part(folder_key)}) # Прямой вызов
 
     def add_command_folder(self, folder_name, base_folder_key='root'):
         """Добавляет логическую папку."""
@@ -197,7 +351,7 @@ class CommandMixin:
         folder_path_abs.mkdir(parents=True, exist_ok=True) # Прямой вызов
         self.useful_commands[full_folder_key] = []
 
-        if self.save_tasks(): # Прямой вызов
+        if self.save_tasks(parts={FOLDERS_PART, command_part(full_folder_key)}): # Прямой вызов
             return True
         else: # Откат без try-except
             if full_folder_key in self.useful_commands: del self.useful_commands[full_folder_key]
@@ -212,32 +366,32 @@ class CommandMixin:
 
         folders_to_delete_keys = [k for k in self.useful_commands if
                                   k == folder_key_to_delete or k.startswith(f"{folder_key_to_delete}/")]
-        errors_occurred = False
-        subfolders_to_delete_abs = set()
+        paths_to_trash = []
+        deleted_folders = {}
         for key in folders_to_delete_keys:
-            for command in self.useful_commands.get(key, []):
+            commands = self.useful_commands.get(key, [])
+            deleted_folders[key] = [command.snapshot() for command in commands]
+            for command in commands:
                 if subfolder_rel := command.get('subfolder'):
-                    subfolders_to_delete_abs.add(self.tasks_folder / subfolder_rel.replace('/', os.sep))
-
-        for path_abs in subfolders_to_delete_abs:
-            if path_abs.exists():
-                 # Прямые вызовы без try-except
-                 if path_abs.is_dir(): shutil.rmtree(path_abs)
-                 else: path_abs.unlink()
-                 # Если нет ошибки - считаем удаленным
-
-        for key in folders_to_delete_keys:
-            if key == 'root': continue
-            folder_path_abs = self.tasks_folder / key.replace('/', os.sep)
-            if folder_path_abs.is_dir():
-                shutil.rmtree(folder_path_abs) # Прямой вызов
-
-        for key in folders_to_delete_keys:
-            if key in self.useful_commands: del self.useful_commands[key] # Прямой вызов
-
-        if not self.save_tasks(): errors_occurred = True # Прямой вызов
-        if errors_occurred: QMessageBox.warning(None, "Ошибка удаления", "Не удалось удалить папку или сохранить изменения.")
-        return not errors_occurred
+                    paths_to_trash.append(self.tasks_folder / subfolder_rel.replace('/', os.sep))
+                paths_to_trash.append(self.tasks_folder / REFS_FOLDER_NAME / command.id)
+            if key != 'root': paths_to_trash.append(self.tasks_folder / key.replace('/', os.sep))
+
+        # Переименование в корзину вместо рекурсивного удаления: интерфейс не ждет диска
+        entry_id = self.trash.move_to_trash(paths_to_trash, {'kind': 'folder', 'folder_key': folder_key_to_delete,
+                                                             'folders': deleted_folders})
+        removed = {key: self.useful_commands.pop(key) for key in folders_to_delete_keys if key in self.useful_commands}
+
+        deleted_parts = {FOLDERS_PART} | {command_part(key) for key in folders_to_delete_keys}
+        if not self.save_tasks(parts=deleted_parts): # Прямой вызов
+            # Откат: записи на место, файлы из корзины
+            self.useful_commands.update(removed)
+            self.trash.restore(entry_id)
+            QMessageBox.warning(None, "Ошибка удаления", "Не удалось удалить папку или сохранить изменения.")
+            return False
+        if any(command.get('watch_source') for commands in deleted_folders.values() for command in commands):
+            self.source_watcher.refresh()
+        return True
 
     def move_command(self, from_folder_key, command_idx, to_folder_key):
         """Перемещает команду."""
@@ -262,51 +416,114 @@ class CommandMixin:
                 dest_parent_abs.mkdir(parents=True, exist_ok=True) # Прямой вызов
                 final_dest_abs = find_unique_path(dest_parent_abs / source_abs.name) # Прямой вызов
 
-                if final_dest_abs and len(str(final_dest_abs)) <= MAX_PATH_LENGTH:
+                if len(str(final_dest_abs)) <= MAX_PATH_LENGTH:
                     shutil.move(str(source_abs), str(final_dest_abs)) # Прямой вызов
+                    note_created(final_dest_abs)
                     new_subfolder_rel_for_meta = str(final_dest_abs.relative_to(self.tasks_folder).as_posix())
-                else: physical_move_error = True # Ошибка поиска имени или длины пути
+                else: physical_move_error = True # Слишком длинный путь
             # Игнорируем ошибки OS при move
 
         # Обновляем метаданные напрямую
-        command_popped = self.useful_commands[from_folder_key].pop(command_idx) # Прямой pop
-        command_popped['subfolder'] = new_subfolder_rel_for_meta
-        self.useful_commands.setdefault(to_folder_key, []).append(command_popped)
-        if not self.useful_commands[from_folder_key] and from_folder_key != 'root':
-            del self.useful_commands[from_folder_key] # Прямой del
+        self._move_command_entry(from_folder_key, command_idx, to_folder_key, new_subfolder_rel_for_meta)
 
-        if not self.save_tasks(): return False # Прямой вызов
+        moved_parts = {FOLDERS_PART, command_part(from_folder_key), command_part(to_folder_key)}
+        if not self._record_change('move_command', parts=moved_parts, source=from_folder_key, index=command_idx,
+                                   target=to_folder_key, subfolder=new_subfolder_rel_for_meta):
+            return False
 
         if physical_move_error: QMessageBox.warning(None, "Перемещение", "Команда перемещена, но папка с файлами не была перемещена физически.")
         return True
 
 
+    def _move_command_entry(self, from_folder_key, command_idx, to_folder_key, new_subfolder_rel):
+        """Переносит запись команды между папками (только метаданные)."""
+        command_popped = self.useful_commands[from_folder_key].pop(command_idx) # Прямой pop
+        command_popped['subfolder'] = new_subfolder_rel
+        self.useful_commands.setdefault(to_folder_key, []).append(command_popped)
+        if not self.useful_commands[from_folder_key] and from_folder_key != 'root':
+            del self.useful_commands[from_folder_key] # Прямой del
+
+    def _replay_move_command(self, record):
+        """Накат перемещения команды из журнала (папка на диске уже перемещена)."""
+        self._move_command_entry(record['source'], record['index'], record['target'], record['subfolder'])
+
     def delete_command(self, folder_key, command_idx):
         """Удаляет команду и ее подпапку."""
         # Прямой доступ и удаление из списка
         command = self.useful_commands[folder_key].pop(command_idx)
         subfolder_rel = command.get('subfolder')
-        command_name = command.get('name', 'Без имени')
 
-        if subfolder_rel:
-            path_abs = self.tasks_folder / subfolder_rel.replace('/', os.sep)
-            if path_abs.exists():
-                # Прямое удаление без try-except
-                if path_abs.is_dir(): shutil.rmtree(path_abs)
-                else: path_abs.unlink()
+        # Подпапка и снимки ссылок уходят в корзину; блобы освободятся после ее очистки
+        paths_to_trash = [self.tasks_folder / REFS_FOLDER_NAME / command.id]
+        if subfolder_rel: paths_to_trash.append(self.tasks_folder / subfolder_rel.replace('/', os.sep))
+        entry_id = self.trash.move_to_trash(paths_to_trash, {'kind': 'command', 'folder_key': folder_key,
+                                                             'index': command_idx, 'command': command.snapshot()})
 
-        if not self.save_tasks(): # Прямой вызов
-            # Простейший откат без try-except
+        if not self.save_tasks(parts={command_part(folder_key)}): # Прямой вызов
+            # Откат: запись на место, файлы из корзины
             self.useful_commands.setdefault(folder_key, []).insert(command_idx, command)
+            self.trash.restore(entry_id)
             QMessageBox.critical(None, "Ошибка", "Не удалось сохранить изменения после удаления команды.")
             return False
+        if command.get('watch_source'): self.source_watcher.refresh() # Источники удаленной команды не нужны
+        return True
+
+    def undelete(self, entry_id):
+        """Восстанавливает удаленную команду или папку из корзины."""
+        meta = self.trash.restore(entry_id)
+        if meta is None: return False
+        # Занятое после удаления место восстановлено рядом: пути подпапок сдвигаются вслед
+        moved = {item['original']: item['restored'] for item in meta['paths'] if item['original'] != item['restored']}
+
+        def restored_subfolder(snapshot):
+            command = Command(snapshot)
+            subfolder_rel = command.get('subfolder')
+            for original, restored in moved.items():
+                if subfolder_rel and (subfolder_rel == original or subfolder_rel.startswith(original + '/')):
+                    command['subfolder'] = restored + subfolder_rel[len(original):]
+                    break
+            return command
+
+        if meta['kind'] == 'command':
+            folder_key = meta['folder_key']
+            parts = {command_part(folder_key)}
+            if folder_key not in self.useful_commands:
+                self.useful_commands[folder_key] = []
+                parts.add(FOLDERS_PART)
+            commands = self.useful_commands[folder_key]
+            restored = [restored_subfolder(meta['command'])]
+            commands.insert(min(meta['index'], len(commands)), restored[0])
+        else:
+            parts = {FOLDERS_PART}
+            restored = []
+            for key, snapshots in meta['folders'].items():
+                commands = [restored_subfolder(snapshot) for snapshot in snapshots]
+                self.useful_commands.setdefault(key, []).extend(commands) # Папку могли создать заново
+                parts.add(command_part(key))
+                restored.extend(commands)
+
+        if not self.save_tasks(parts=parts): return False # Прямой вызов
+        if any(command.get('watch_source') for command in restored): self.source_watcher.refresh()
         return True
 
+    def child_command_folders(self, folder_key):
+        """Ключи прямых подпапок логической папки (для навигации в UI)."""
+        store = self._query_store()
+        if store is not None:
+            return store.child_folder_keys(folder_key) # Запрос по индексу ключей папок
+        children = []
+        for key in self.useful_commands.keys():
+            if key == 'root': continue
+            is_direct_child = (folder_key == 'root' and '/' not in key) or \
+                              (key.startswith(folder_key + '/') and '/' not in key[len(folder_key) + 1:])
+            if is_direct_child: children.append(key)
+        return children
+
     def sort_commands(self, folder_key):
         """Сортирует команды в папке по имени."""
         if folder_key in self.useful_commands and isinstance(self.useful_commands[folder_key], list):
             self.useful_commands[folder_key].sort(key=lambda x: x.get('name', '').lower()) # Прямой вызов
-            return self.save_tasks() # Прямой вызов
+            return self.save_tasks(parts={command_part(folder_key)}) # Прямой вызов
         return False
 
 
@@ -329,13 +546,14 @@ class CommandMixin:
             potential_new_name_base = generate_safe_foldername(new_name) # Прямой вызов
             new_subfolder_abs = find_unique_path(physical_parent_abs / potential_new_name_base) # Прямой вызов
 
-            if new_subfolder_abs and len(str(new_subfolder_abs)) <= MAX_PATH_LENGTH:
+            if len(str(new_subfolder_abs)) <= MAX_PATH_LENGTH:
                 final_new_subfolder_rel = str(new_subfolder_abs.relative_to(self.tasks_folder).as_posix())
                 # Переименовываем, только если папка существует и пути разные
                 if old_subfolder_abs.exists() and new_subfolder_abs != old_subfolder_abs:
                     old_subfolder_abs.rename(new_subfolder_abs) # Прямой вызов
+                    note_created(new_subfolder_abs)
             else:
-                # Не удалось найти имя или путь слишком длинный - отменяем переименование папки
+                # Путь слишком длинный - отменяем переименование папки
                 final_new_subfolder_rel = old_subfolder_rel # Оставляем старый путь в JSON
                 QMessageBox.warning(None,"Ошибка имени папки", f"Не удалось переименовать папку для команды '{new_name}'. Проверьте конфликты имен или длину пути.")
                 # Не возвращаем False, так как имя команды УЖЕ изменено
@@ -343,4 +561,62 @@ class CommandMixin:
         # Обновляем subfolder в JSON, если он изменился (или остался старым)
         command['subfolder'] = final_new_subfolder_rel
 
-        return self.save_tasks() # Прямой вызов save_tasks
\ No newline at end of file
+        return self.save_tasks(parts={command_part(folder_key)}) # Прямой вызов save_tasks
+
+    # --- Варианты по постоянному ID (не зависят от сортировки списков) ---
+
+    def sync_command_folders_by_id(self, command_id, use_hash=False, **kwargs):
+        """Обновляет на месте ресурсы команды с данным ID."""
+        location = self.command_location(command_id)
+        if location is None: return False, new_sync_report()
+        folder_key, command_idx = location
+        return self.sync_command_folders(command_idx, folder_key, use_hash, **kwargs)
+
+    def add_command_references_by_id(self, command_id, paths):
+        """Прикрепляет ссылки к команде с данным ID."""
+        location = self.command_location(command_id)
+        if location is None: return False
+        folder_key, command_idx = location
+        return self.add_command_references(folder_key, command_idx, paths)
+
+    def remove_command_reference_by_id(self, command_id, ref_path):
+        """Убирает ссылку из команды с данным ID."""
+        location = self.command_location(command_id)
+        if location is None: return False
+        folder_key, command_idx = location
+        return self.remove_command_reference(folder_key, command_idx, ref_path)
+
+    def set_watch_source_by_id(self, command_id, enabled):
+        """Включает (выключает) слежение за источниками команды с данным ID."""
+        location = self.command_location(command_id)
+        if location is None: return False
+        folder_key, command_idx = location
+        return self.set_watch_source(folder_key, command_idx, enabled)
+
+    def update_command_folders_by_id(self, command_id, **kwargs):
+        """Обновляет ресурсы команды с данным ID."""
+        location = self.command_location(command_id)
+        if location is None: return False, []
+        folder_key, command_idx = location
+        return self.update_command_folders(command_idx, folder_key, **kwargs)
+
+    def move_command_by_id(self, command_id, to_folder_key):
+        """Перемещает команду с данным ID в папку to_folder_key."""
+        location = self.command_location(command_id)
+        if location is None: return False
+        from_folder_key, command_idx = location
+        return self.move_command(from_folder_key, command_idx, to_folder_key)
+
+    def delete_command_by_id(self, command_id):
+        """Удаляет команду с данным ID и ее подпапку."""
+        location = self.command_location(command_id)
+        if location is None: return False
+        folder_key, command_idx = location
+        return self.delete_command(folder_key, command_idx)
+
+    def rename_command_subfolder_by_id(self, command_id, new_name):
+        """Переименовывает команду с данным ID и ее подпапку."""
+        location = self.command_location(command_id)
+        if location is None: return False
+        folder_key, command_idx = location
+        return self.rename_command_subfolder(folder_key, command_idx, new_name)
\ No newline at end of file
@@ -5,6 +5,25 @@ from pathlib import Path
 SETTINGS_FOLDER = Path("C:/TaskManagerSettings")
 SETTINGS_FILE = SETTINGS_FOLDER / "settings.json"
 CURRENT_VERSION = "1.1"
+SCHEMA_VERSION = 2   # Формат записей; при совпадении с файлом нормализация при загрузке не нужна
+
+# --- Сохранение ---
+SAVE_DEBOUNCE_MS = 500     # Пауза без изменений перед записью tasks.json
+SAVE_MAX_DELAY_MS = 3000   # Максимальная задержка записи при непрерывных изменениях
+SAVE_RETRY_LIMIT = 5       # Повторов неудавшейся фоновой записи до сообщения пользователю
+SAVE_RETRY_MAX_MS = 60000  # Предел паузы между повторами (пауза удваивается с каждой неудачей)
+JOURNAL_SUFFIX = ".journal"             # tasks.json -> tasks.journal
+FINGERPRINT_SUFFIX = ".fingerprint"     # tasks.json -> tasks.fingerprint (схема и отпечаток снимка)
+JOURNAL_COMPACT_BYTES = 1024 * 1024     # Размер журнала, после которого пишется новый снимок
+STORAGE_BACKENDS = ("json", "sqlite", "sharded")  # Значения ключа storage_backend в settings.json
+SQLITE_DB_NAME = "tasks.sqlite3"        # База SQLite рядом с tasks.json
+SHARDS_FOLDER_NAME = ".taskdata"        # Раздельная раскладка: pending/completed/команды по папкам
+MIGRATED_SUFFIX = ".migrated"           # tasks.json -> tasks.json.migrated после переноса в шарды
+# Части данных для выборочной записи (шарды)
+PENDING_PART = "pending"
+COMPLETED_PART = "completed"
+FOLDERS_PART = "folders"                # Список логических папок команд
+COMMANDS_PART_PREFIX = "commands:"      # + ключ папки команд
 
 # --- Задачи ---
 STATUS_COLORS_DARK = {"Не выполнено": "#FF4C4C", "Выполняется": "#FFD700", "Выполнено": "#32CD32"}
@@ -12,16 +31,21 @@ STATUS_COLORS_LIGHT = {"Не выполнено": "#DC143C", "Выполняет
 PRIORITY_LEVELS = ["Высокий", "Средний", "Низкий"]
 STATUS_OPTIONS = ["Не выполнено", "Выполняется", "Выполнено"]
 
+# id: None - запись получает новый постоянный ID при создании
 DEFAULT_TASK_FIELDS = {
-    'name': 'Без имени', 'status': 'Не выполнено', 'priority': "Средний",
+    'id': None, 'name': 'Без имени', 'status': 'Не выполнено', 'priority': "Средний",
     'description': '', 'created_time': 'N/A', 'started_time': None,
     'completed_time': None, 'subtasks': []
 }
 
 # --- Команды ---
 DEFAULT_COMMAND_FIELDS = {
-    'name': 'Без имени', 'description': '', 'subfolder': None,
-    'ino_paths': [], 'py_paths': [], 'pdf_paths': [], 'img_paths': []
+    'id': None, 'name': 'Без имени', 'description': '', 'subfolder': None,
+    'ino_paths': [], 'py_paths': [], 'pdf_paths': [], 'img_paths': [],
+    # Ссылки на внешние файлы и папки (без копирования; содержимое попадает только в архив экспорта)
+    'ref_paths': [],
+    # Исходные папки вложений {'ino_folder', 'py_folder', 'additional_folders'} и слежение за ними
+    'source_folders': {}, 'watch_source': False
 }
 
 # --- Файлы ---
@@ -32,4 +56,42 @@ PDF_EXTENSIONS = {'.pdf'}
 IMG_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.webp'}
 EXCLUDED_DIRS = {'.git', '__pycache__', '.vscode', 'build', 'dist', 'node_modules', '.venv', 'venv'}
 EXCLUDED_FILES = {'.gitignore', '.env'}
-MAX_PATH_LENGTH = 260
\ No newline at end of file
+MAX_PATH_LENGTH = 260
+BLOBS_FOLDER_NAME = ".blobs"              # Хранилище вложений по хешу (ключ dedupe_attachments в settings.json)
+LINKS_MANIFEST_NAME = ".blob_links.json"  # В архиве: одинаковые файлы хранятся один раз, остальные - ссылки
+BACKUP_MANIFEST_NAME = ".backup_manifest.json"  # В архиве: файлы копии (размер, время, хеш) и родитель в цепочке
+REFS_FOLDER_NAME = ".refs"                # Снимки внешних ссылок команд, пришедшие из архива
+TRASH_FOLDER_NAME = ".trash"              # Корзина: удаленные команды и папки до фоновой очистки
+TRASH_RETENTION_HOURS = 24                # Сколько удаленное можно восстановить (ключ trash_retention_hours)
+TRASH_PURGE_INTERVAL_S = 600              # Период проверки корзины фоновым потоком
+# Импорт собирается рядом с папкой задач (та же ФС) и подменяет ее переименованием
+IMPORT_STAGING_SUFFIX = ".import"         # <папка задач>.import - распаковка и проверка импорта
+IMPORT_PREVIOUS_SUFFIX = ".previous"      # <папка задач>.previous - прежние данные до загрузки новых (откат)
+
+# --- Копирование деревьев ---
+COPY_WORKERS = 8                          # Потоков копирования файлов (ввод-вывод отпускает GIL)
+COPY_CHUNK_BYTES = 1024 * 1024            # Размер блока при потоковом копировании
+COPY_STREAM_MIN_BYTES = 16 * 1024 * 1024  # Файлы от этого размера копируются блоками
+WATCH_DEBOUNCE_MS = 1000     # Пауза без изменений в исходной папке перед обновлением вложений
+WATCH_MAX_DELAY_MS = 10000   # Максимальная задержка обновления при непрерывных изменениях
+WATCH_MAX_PATHS = 4000       # Лимит наблюдаемых путей на все команды (дальше - только папки)
+# Архивы экспорта: уровень сжатия (ключ archive_compression_level) и уже сжатые форматы (пишутся как есть)
+ARCHIVE_COMPRESSION_LEVEL = 6
+ARCHIVE_STORED_EXTENSIONS = (IMG_EXTENSIONS - {'.svg', '.bmp'}) | PDF_EXTENSIONS | {'.zip'}
+ARCHIVE_LEVELS = {0: "Без сжатия", 1: "Быстрое", 6: "Обычное", 9: "Максимальное"}
+# Формат архивов (ключ archive_format): ZIP читается выборочно (нужно цепочкам копий),
+# tar распаковывается потоком - уже во время скачивания с Google Диска
+ARCHIVE_FORMATS = {
+    'zip': "ZIP",
+    'tar.zst': "tar + Zstandard (без пакета zstandard - tar + gzip)",
+    'tar.gz': "tar + gzip",
+}
+SYNC_MTIME_WINDOW_S = 2  # Допуск сравнения времени изменения при обновлении вложений (FAT хранит его с точностью 2 с)
+# Способ копирования файлов вложений (ключ copy_strategy в settings.json)
+COPY_STRATEGIES = {
+    'auto': "Автоматически (клон, затем copy_file_range)",
+    'reflink': "Клон блоков (reflink)",
+    'copy_file_range': "Копирование в ядре (copy_file_range/sendfile)",
+    'hardlink': "Жесткие ссылки (изменения источника видны в копии)",
+    'copy2': "Обычное копирование",
+}
\ No newline at end of file
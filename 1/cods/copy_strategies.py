@@ -0,0 +1,118 @@
+# zadachi/cods/copy_strategies.py
+"""Копирование файла без прокачки байтов через Python: reflink, copy_file_range/sendfile, жесткая ссылка.
+
+Каждый способ возвращает False, если он недоступен (платформа, файловая система, разные диски),
+и тогда пробуется следующий; ошибки самих файлов (нет источника, нет места) поднимаются как обычно.
+"""
+import errno
+import os
+import shutil
+import sys
+
+from .constants import COPY_STRATEGIES
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+FICLONE = 0x40049409 # ioctl Linux: клон блоков файла (btrfs, XFS, bcachefs, overlay поверх них)
+# Ошибки "способ не поддерживается здесь" - не повод прерывать копирование
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY,
+                       errno.EPERM, errno.EBADF, errno.EMLINK}
+if hasattr(errno, 'ENOTSUP'): _UNSUPPORTED_ERRNOS.add(errno.ENOTSUP)
+
+_strategy = 'auto'
+# (способ, устройство источника, устройство цели) - уже известно, что не работает.
+# Пара устройств, а не только цель: между разными ФС (EXDEV) способ не работает, а внутри одной - работает
+_unsupported = set()
+
+
+def set_copy_strategy(strategy):
+    """Выбирает способ копирования вложений (значения - ключи COPY_STRATEGIES)."""
+    global _strategy
+    _strategy = strategy if strategy in COPY_STRATEGIES else 'auto'
+
+
+def get_copy_strategy():
+    """Текущий способ копирования вложений."""
+    return _strategy
+
+
+def _target_device(target_file):
+    return os.stat(os.path.dirname(os.path.abspath(target_file))).st_dev
+
+
+def _copy_reflink(source_file, target_file):
+    """Клон блоков: копия мгновенная и не занимает места до первого изменения."""
+    if fcntl is None or not sys.platform.startswith('linux'): return False
+    with open(source_file, 'rb') as src, open(target_file, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError as e:
+            if e.errno in _UNSUPPORTED_ERRNOS: return False
+            raise
+    return True
+
+
+def _copy_in_kernel(source_file, target_file):
+    """copy_file_range (или sendfile): байты копирует ядро, без буферов Python."""
+    copy_range = getattr(os, 'copy_file_range', None)
+    send_file = getattr(os, 'sendfile', None) if sys.platform.startswith('linux') else None
+    if copy_range is None and send_file is None: return False
+    with open(source_file, 'rb') as src, open(target_file, 'wb') as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        in_fd, out_fd = src.fileno(), dst.fileno()
+        offset = 0
+        while remaining > 0:
+            try:
+                if copy_range is not None:
+                    copied = copy_range(in_fd, out_fd, remaining)
+                else:
+                    copied = send_file(out_fd, in_fd, offset, remaining)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS: raise
+                if copy_range is not None and send_file is not None and offset == 0:
+                    copy_range = None # Старое ядро или разные ФС - пробуем sendfile
+                    continue
+                return False
+            if copied == 0: break # Файл укоротился во время копирования
+            offset += copied
+            remaining -= copied
+    return True
+
+
+def _copy_hardlink(source_file, target_file):
+    """Жесткая ссылка: копия не занимает места, но изменения источника видны в ней."""
+    if os.path.lexists(target_file): os.unlink(target_file)
+    try:
+        os.link(source_file, target_file)
+    except OSError as e:
+        if e.errno in _UNSUPPORTED_ERRNOS: return False
+        raise
+    return True
+
+
+_METHODS = {'reflink': _copy_reflink, 'copy_file_range': _copy_in_kernel, 'hardlink': _copy_hardlink}
+_CHAINS = {
+    'auto': ('reflink', 'copy_file_range'),
+    'reflink': ('reflink', 'copy_file_range'),
+    'copy_file_range': ('copy_file_range',),
+    'hardlink': ('hardlink', 'reflink', 'copy_file_range'),
+    'copy2': (),
+}
+
+
+def copy_with_strategy(source_file, target_file, strategy=None):
+    """Копирует файл выбранным способом; False - ни один не подошел, копировать обычным образом."""
+    chain = _CHAINS.get(strategy or _strategy, _CHAINS['auto'])
+    if not chain: return False
+    devices = (os.stat(source_file).st_dev, _target_device(target_file))
+    for method in chain:
+        if (method, *devices) in _unsupported: continue
+        if _METHODS[method](source_file, target_file):
+            if method != 'hardlink':
+                shutil.copystat(source_file, target_file) # Метаданные как у copy2
+            return True
+        _unsupported.add((method, *devices))
+    return False
@@ -2,11 +2,83 @@
 import os
 import shutil
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import Optional, List, Set, Tuple
+from typing import Optional, List, Set, Tuple, Callable, Iterable
 
 # Импортируем необходимые константы
-from .constants import EXCLUDED_DIRS, EXCLUDED_FILES, MAX_PATH_LENGTH
+from .constants import (EXCLUDED_DIRS, EXCLUDED_FILES, MAX_PATH_LENGTH,
+                        COPY_WORKERS, COPY_CHUNK_BYTES, COPY_STREAM_MIN_BYTES, SYNC_MTIME_WINDOW_S)
+from .copy_strategies import copy_with_strategy
+from .blob_store import _hash_file
+
+# Обратный вызов прогресса копирования: progress(путь скопированного файла, байт)
+ProgressCallback = Callable[[Path, int], None]
+
+
+_blob_store = None # Хранилище вложений по хешу (None - обычное копирование)
+
+
+def set_blob_store(blob_store):
+    """Включает копирование вложений через хранилище блобов (None - выключает)."""
+    global _blob_store
+    _blob_store = blob_store
+
+
+class CopyCancelled(Exception):
+    """Копирование отменено (бросается из обратного вызова прогресса)."""
+
+
+def _copy_file_data(source_file, target_file, size=None):
+    """Копирует файл с метаданными; большие файлы - блоками, без чтения целиком в память."""
+    # Одинаковое содержимое хранится один раз: файл становится жесткой ссылкой на блоб
+    if _blob_store is not None and _blob_store.store_file(source_file, target_file):
+        return
+    # Файл-ссылку нельзя переписывать на месте: изменились бы блоб и все его ссылки
+    try:
+        if os.stat(target_file).st_nlink > 1: os.unlink(target_file)
+    except FileNotFoundError:
+        pass
+    # Клон, copy_file_range или ссылка - без прокачки байтов через Python
+    if copy_with_strategy(source_file, target_file):
+        return
+    if size is None: size = os.path.getsize(source_file)
+    if size < COPY_STREAM_MIN_BYTES:
+        shutil.copy2(source_file, target_file) # Прямой вызов
+        return
+    with open(source_file, 'rb') as src, open(target_file, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+    shutil.copystat(source_file, target_file)
+
+
+def _copy_file(source_file, target_file, progress: Optional[ProgressCallback] = None):
+    """Копирует файл с метаданными и сообщает о нем в progress."""
+    _copy_file_data(source_file, target_file)
+    if progress is not None:
+        progress(Path(target_file), os.path.getsize(target_file))
+    return target_file
+
+
+def estimate_copy_size(paths: Iterable[Path]) -> int:
+    """Суммарный размер файлов (папки - рекурсивно, без исключенных) для индикатора прогресса."""
+    total = 0
+    for path in paths:
+        path = Path(path)
+        if path.is_file():
+            total += path.stat().st_size
+            continue
+        for root, dirs, files in os.walk(str(path)):
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            for file_name in files:
+                if file_name in EXCLUDED_FILES: continue
+                try:
+                    total += os.path.getsize(os.path.join(root, file_name))
+                except OSError:
+                    pass # Оценка: недоступный файл просто не учитывается
+    return total
+
 
 def generate_safe_foldername(name: str) -> str:
     """Генерирует 'безопасное' имя для папки."""
@@ -16,56 +88,259 @@ def generate_safe_foldername(name: str) -> str:
     if not safe_name: safe_name = "unnamed_folder"
     return safe_name[:50]
 
-def find_unique_path(base_target_path: Path) -> Optional[Path]:
-    """Находит уникальный путь, добавляя _1, _2 и т.д."""
-    if not base_target_path.exists(): return base_target_path
-    parent_dir = base_target_path.parent
-    original_stem = base_target_path.stem
-    suffix = base_target_path.suffix
-    counter = 1
-    while counter <= 100:
-        new_name = f"{original_stem}_{counter}{suffix}"
-        new_path = parent_dir / new_name
-        if not new_path.exists(): return new_path
-        counter += 1
-    return None # Не удалось найти уникальное имя
+# Занятые имена по папкам: папка -> [st_mtime_ns при чтении, имена (os.path.normcase), {(stem, suffix): следующий номер}]
+# Чужие изменения папки видны по смене mtime; свои записи отмечаются в note_created без перечитывания
+_names_cache = {}
+_names_lock = threading.Lock() # Вложения копируются и в фоновых потоках
+
+
+def _dir_names(parent: str):
+    """Запись кэша имен папки (перечитывается одним scandir, если папка менялась); None - папки нет."""
+    try:
+        mtime = os.stat(parent).st_mtime_ns
+    except FileNotFoundError:
+        _names_cache.pop(parent, None)
+        return None
+    entry = _names_cache.get(parent)
+    if entry is None or entry[0] != mtime:
+        entry = [mtime, _scan_names(parent), {}]
+        _names_cache[parent] = entry
+    return entry
+
+
+def _scan_names(parent: str):
+    with os.scandir(parent) as entries:
+        return {os.path.normcase(item.name) for item in entries}
+
+
+def note_created(path: Path):
+    """Отмечает собственную запись в папке: кэш имен остается верным без повторного чтения папки."""
+    parent = str(Path(path).parent)
+    with _names_lock:
+        entry = _names_cache.get(parent)
+        if entry is None: return
+        try:
+            entry[0] = os.stat(parent).st_mtime_ns
+        except FileNotFoundError:
+            _names_cache.pop(parent, None)
+            return
+        entry[1].add(os.path.normcase(Path(path).name))
+
+
+def forget_dir_names():
+    """Сбрасывает кэш имен (папка задач подменена целиком: mtime новых папок может совпасть со старыми)."""
+    with _names_lock:
+        _names_cache.clear()
+
+
+def find_unique_path(base_target_path: Path) -> Path:
+    """Находит уникальный путь, добавляя _1, _2 и т.д. (без верхней границы номера).
+
+    Имена папки читаются один раз и кэшируются; выданное имя сразу считается занятым,
+    поэтому два вызова подряд (и из разных потоков) не получат один и тот же путь.
+    Выбранное имя проверяется на диске: чужая запись в тот же тик mtime не видна по кэшу.
+    """
+    parent = str(base_target_path.parent)
+    with _names_lock:
+        entry = _dir_names(parent)
+        if entry is None: return base_target_path # Папки еще нет - любое имя свободно
+        next_counters = entry[2]
+        stem, suffix = base_target_path.stem, base_target_path.suffix
+        name = base_target_path.name
+        while True:
+            if os.path.normcase(name) in entry[1]:
+                # Номер продолжается с последнего выданного: тысячи одноименных команд не перебираются заново
+                counter = next_counters.get((stem, suffix), 1)
+                while os.path.normcase(f"{stem}_{counter}{suffix}") in entry[1]:
+                    counter += 1
+                next_counters[(stem, suffix)] = counter + 1
+                name = f"{stem}_{counter}{suffix}"
+            if not os.path.lexists(os.path.join(parent, name)): break
+            entry[1] = _scan_names(parent) # Кэш устарел - перечитываем папку и ищем дальше
+        entry[1].add(os.path.normcase(name))
+    return base_target_path.parent / name
+
+def _scan_tree(source_dir: str, target_dir: str, allowed_extensions: Optional[Set[str]]):
+    """Обход дерева через os.scandir: (папки для создания, файлы [(источник, цель, размер, отн. путь)]).
+
+    Исключенные папки и файлы пропускаются; папки-ссылки создаются, но не обходятся (как os.walk).
+    """
+    dirs_to_create = []
+    files_to_copy = []
+    stack = [(source_dir, target_dir, '')]
+    while stack:
+        current_source, current_target, rel_prefix = stack.pop()
+        subdirs = []
+        with os.scandir(current_source) as entries:
+            for entry in entries:
+                name = entry.name
+                if entry.is_dir():
+                    if name in EXCLUDED_DIRS: continue
+                    target_path = os.path.join(current_target, name)
+                    dirs_to_create.append(target_path)
+                    if not entry.is_symlink():
+                        subdirs.append((entry.path, target_path, rel_prefix + name + '/'))
+                    continue
+                if name in EXCLUDED_FILES: continue
+                if allowed_extensions is not None and os.path.splitext(name)[1].lower() not in allowed_extensions:
+                    continue
+                target_path = os.path.join(current_target, name)
+                if len(target_path) > MAX_PATH_LENGTH: continue # Слишком длинный путь - пропускаем
+                size = entry.stat().st_size
+                files_to_copy.append((entry.path, target_path, size, rel_prefix + name))
+        # В стек в обратном порядке: обход идет сверху вниз в порядке каталога
+        stack.extend(reversed(subdirs))
+    return dirs_to_create, files_to_copy
+
 
 def copy_folder_recursive_filtered(source_dir: Path, target_dir: Path,
                                    tasks_folder_root: Path,
-                                   allowed_extensions: Optional[Set[str]] = None) -> List[str]:
-    """Рекурсивно копирует папку с фильтрами."""
-    copied_files_rel_paths = []
+                                   allowed_extensions: Optional[Set[str]] = None,
+                                   progress: Optional[ProgressCallback] = None) -> List[str]:
+    """Рекурсивно копирует папку с фильтрами: сначала каркас папок, затем файлы пулом потоков."""
     if not source_dir.is_dir(): return []
 
     target_dir.mkdir(parents=True, exist_ok=True) # Прямой вызов
-    for root, dirs, files in os.walk(str(source_dir), topdown=True):
-        current_source_dir = Path(root)
-        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
-        files[:] = [f for f in files if f not in EXCLUDED_FILES]
-        relative_dir_path = current_source_dir.relative_to(source_dir)
-        current_target_dir = target_dir / relative_dir_path
-
-        for dir_name in dirs:
-            (current_target_dir / dir_name).mkdir(exist_ok=True) # Прямой вызов
-
-        for file_name in files:
-            source_file = current_source_dir / file_name
-            target_file = current_target_dir / file_name
-            should_copy = allowed_extensions is None or source_file.suffix.lower() in allowed_extensions
-
-            if should_copy and len(str(target_file)) <= MAX_PATH_LENGTH:
-                target_file.parent.mkdir(parents=True, exist_ok=True) # Прямой вызов
-                shutil.copy2(source_file, target_file) # Прямой вызов
-                relative_file_path = target_file.relative_to(tasks_folder_root)
-                copied_files_rel_paths.append(str(relative_file_path.as_posix()))
-            # else: Ошибки длины пути или расширения просто игнорируются
+    dirs_to_create, files_to_copy = _scan_tree(str(source_dir), str(target_dir), allowed_extensions)
+    for dir_path in dirs_to_create:
+        os.makedirs(dir_path, exist_ok=True) # Прямой вызов
 
+    rel_base = target_dir.relative_to(tasks_folder_root).as_posix()
+    rel_base = '' if rel_base == '.' else rel_base + '/'
+    copied_files_rel_paths = [rel_base + rel_path for _, _, _, rel_path in files_to_copy]
+    _copy_files(files_to_copy, progress)
     return copied_files_rel_paths
 
+
+def _copy_files(files_to_copy, progress: Optional[ProgressCallback] = None):
+    """Копирует файлы [(источник, цель, размер, отн. путь)] пулом потоков (папки уже созданы)."""
+    if not files_to_copy: return
+    # Мелкие файлы идут пачками: накладные расходы пула на файл иначе сравнимы с самим копированием
+    pending = deque(_copy_batches(files_to_copy))
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=min(COPY_WORKERS, len(pending))) as pool:
+        try:
+            # Ограниченное окно заданий: очередь пула не разрастается на больших деревьях,
+            # а progress вызывается только из этого потока
+            while pending or in_flight:
+                while pending and len(in_flight) < COPY_WORKERS * 2:
+                    batch = pending.popleft()
+                    in_flight[pool.submit(_copy_batch, batch)] = batch
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    future.result() # Ошибка копирования поднимается выше, как и раньше
+                    if progress is not None:
+                        for _, target_path, size, _ in batch: progress(Path(target_path), size)
+        finally:
+            for future in in_flight: future.cancel()
+
+
+def _copy_batches(files_to_copy, max_files=64, max_bytes=COPY_CHUNK_BYTES * 4):
+    """Делит файлы на пачки для пула; большой файл - отдельная пачка."""
+    batch, batch_bytes = [], 0
+    for item in files_to_copy:
+        if batch and (len(batch) >= max_files or batch_bytes + item[2] > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(item)
+        batch_bytes += item[2]
+    if batch: yield batch
+
+
+def _copy_batch(batch):
+    """Копирует пачку файлов (в потоке пула)."""
+    for source_path, target_path, size, _ in batch:
+        _copy_file_data(source_path, target_path, size)
+
+def new_sync_report():
+    """Пустой отчет об обновлении вложений: пути относительно папки задач."""
+    return {'added': [], 'updated': [], 'removed': [], 'unchanged': 0}
+
+
+def _needs_update(source_file, target_file, use_hash=False) -> Optional[bool]:
+    """None - цели нет, True - файл изменился (размер, время изменения или хеш), False - совпадает."""
+    try:
+        target_stat = os.stat(target_file)
+    except FileNotFoundError:
+        return None
+    source_stat = os.stat(source_file)
+    if source_stat.st_size != target_stat.st_size: return True
+    if use_hash: return _hash_file(source_file) != _hash_file(target_file)
+    return abs(source_stat.st_mtime - target_stat.st_mtime) >= SYNC_MTIME_WINDOW_S
+
+
+def _sync_files(files_to_sync, rel_base, report, use_hash=False, progress: Optional[ProgressCallback] = None):
+    """Копирует из [(источник, цель, размер, отн. путь)] только новые и измененные файлы."""
+    changed = []
+    for item in files_to_sync:
+        source_path, target_path, size, rel_path = item
+        state = _needs_update(source_path, target_path, use_hash)
+        if state is False:
+            report['unchanged'] += 1
+            # Совпавший файл тоже "обработан": индикатор прогресса доходит до конца, отмена срабатывает
+            if progress is not None: progress(Path(target_path), size)
+            continue
+        if state:
+            # Цель может быть жесткой ссылкой (блоб, режим hardlink) - пишем в новый файл, а не поверх
+            os.unlink(target_path)
+            report['updated'].append(rel_base + rel_path)
+        else:
+            report['added'].append(rel_base + rel_path)
+        changed.append(item)
+    _copy_files(changed, progress)
+
+
+def sync_file(source_file: Path, target_file: Path, tasks_folder_root: Path, report: dict,
+              use_hash: bool = False, progress: Optional[ProgressCallback] = None) -> dict:
+    """Обновляет копию одного файла, если она отличается от источника."""
+    rel_path = target_file.relative_to(tasks_folder_root).as_posix()
+    _sync_files([(str(source_file), str(target_file), source_file.stat().st_size, rel_path)],
+                '', report, use_hash, progress)
+    return report
+
+
+def sync_folder(source_dir: Path, target_dir: Path, tasks_folder_root: Path,
+                allowed_extensions: Optional[Set[str]] = None, use_hash: bool = False,
+                progress: Optional[ProgressCallback] = None, report: Optional[dict] = None) -> dict:
+    """Обновляет копию папки на месте (как rsync --delete): новые и измененные файлы копируются,
+    исчезнувшие из источника удаляются, остальные не трогаются. Возвращает отчет new_sync_report()."""
+    if report is None: report = new_sync_report()
+    if not source_dir.is_dir(): return report
+
+    target_dir.mkdir(parents=True, exist_ok=True) # Прямой вызов
+    dirs_to_create, files_to_sync = _scan_tree(str(source_dir), str(target_dir), allowed_extensions)
+    rel_base = target_dir.relative_to(tasks_folder_root).as_posix()
+    rel_base = '' if rel_base == '.' else rel_base + '/'
+
+    # Сначала удаление: файл в цели мог смениться папкой с тем же именем (и наоборот)
+    existing_dirs, existing_files = _scan_tree(str(target_dir), str(target_dir), None)
+    wanted_files = {target_path for _, target_path, _, _ in files_to_sync}
+    for _, target_path, _, rel_path in existing_files:
+        if target_path not in wanted_files:
+            os.unlink(target_path)
+            report['removed'].append(rel_base + rel_path)
+    wanted_dirs = set(dirs_to_create)
+    for dir_path in reversed(existing_dirs): # Вложенные раньше родительских
+        if dir_path not in wanted_dirs and os.path.isdir(dir_path):
+            shutil.rmtree(dir_path) # Прямой вызов
+            report['removed'].append(Path(dir_path).relative_to(tasks_folder_root).as_posix() + '/')
+    for dir_path in dirs_to_create:
+        os.makedirs(dir_path, exist_ok=True) # Прямой вызов
+
+    _sync_files(files_to_sync, rel_base, report, use_hash, progress)
+    return report
+
+
 def copy_resource(source_path_str: str, target_subfolder: Path, tasks_folder_root: Path,
                   is_folder: bool = False, allowed_extensions: Optional[Set[str]] = None,
-                  include_subdirs: bool = False, recursive_filter: bool = False) -> Tuple[Optional[str], List[str]]:
-    """Копирует один ресурс (файл или папку)."""
+                  include_subdirs: bool = False, recursive_filter: bool = False,
+                  progress: Optional[ProgressCallback] = None,
+                  sync_report: Optional[dict] = None, use_hash: bool = False) -> Tuple[Optional[str], List[str]]:
+    """Копирует один ресурс (файл или папку).
+
+    С sync_report уже прикрепленный ресурс с тем же именем обновляется на месте, а не копируется рядом.
+    """
     source_path = Path(source_path_str)
     copied_files_rel_paths = []
 
@@ -75,15 +350,26 @@ def copy_resource(source_path_str: str, target_subfolder: Path, tasks_folder_roo
         return None, [] # Не найден или неверный тип
 
     target_subfolder.mkdir(parents=True, exist_ok=True) # Прямой вызов
+    existing_target_abs = target_subfolder / source_path.name
+    if sync_report is not None and existing_target_abs.exists() and existing_target_abs.is_dir() == is_folder:
+        if not is_folder and allowed_extensions and source_path.suffix.lower() not in allowed_extensions:
+            return None, [] # Неподходящее расширение
+        added_before, updated_before = len(sync_report['added']), len(sync_report['updated'])
+        if is_folder:
+            sync_folder(source_path, existing_target_abs, tasks_folder_root, allowed_extensions,
+                        use_hash, progress, sync_report)
+        else:
+            sync_file(source_path, existing_target_abs, tasks_folder_root, sync_report, use_hash, progress)
+        return existing_target_abs.name, sync_report['added'][added_before:] + sync_report['updated'][updated_before:]
+
     target_resource_abs = find_unique_path(target_subfolder / source_path.name)
-    if target_resource_abs is None: return None, [] # Не удалось найти имя
     if len(str(target_resource_abs)) > MAX_PATH_LENGTH: return None, [] # Слишком длинный путь
 
     final_resource_name = target_resource_abs.name
     if is_folder:
         if recursive_filter:
             copied_files_rel_paths = copy_folder_recursive_filtered(
-                source_path, target_resource_abs, tasks_folder_root, allowed_extensions
+                source_path, target_resource_abs, tasks_folder_root, allowed_extensions, progress
             )
         else:
             target_resource_abs.mkdir() # Прямой вызов
@@ -93,11 +379,12 @@ def copy_resource(source_path_str: str, target_subfolder: Path, tasks_folder_roo
 
                 if src_item.is_file():
                     if allowed_extensions is None or src_item.suffix.lower() in allowed_extensions:
-                        shutil.copy2(src_item, dst_item) # Прямой вызов
+                        _copy_file(src_item, dst_item, progress)
                         relative_file_path = dst_item.relative_to(tasks_folder_root)
                         copied_files_rel_paths.append(str(relative_file_path.as_posix()))
                 elif src_item.is_dir() and include_subdirs:
-                    shutil.copytree(src_item, dst_item, dirs_exist_ok=True) # Прямой вызов
+                    shutil.copytree(src_item, dst_item, dirs_exist_ok=True, # Прямой вызов
+                                    copy_function=lambda s, d: _copy_file(s, d, progress))
                     for root, _, files in os.walk(str(dst_item)):
                         for file in files:
                             file_abs = Path(root) / file
@@ -106,10 +393,12 @@ def copy_resource(source_path_str: str, target_subfolder: Path, tasks_folder_roo
     else: # Файл
         if allowed_extensions and source_path.suffix.lower() not in allowed_extensions:
             return None, [] # Неподходящее расширение
-        shutil.copy2(source_path, target_resource_abs) # Прямой вызов
+        _copy_file(source_path, target_resource_abs, progress)
         relative_file_path = target_resource_abs.relative_to(tasks_folder_root)
         copied_files_rel_paths.append(str(relative_file_path.as_posix()))
 
+    note_created(target_resource_abs)
+    if sync_report is not None: sync_report['added'].extend(copied_files_rel_paths)
     return final_resource_name, copied_files_rel_paths
 
 def prepare_subfolder(tasks_folder_root: Path, command_name: str,
@@ -131,9 +420,9 @@ def prepare_subfolder(tasks_folder_root: Path, command_name: str,
     safe_name_base = generate_safe_foldername(command_name)
     base_target_path = physical_parent_folder_abs / safe_name_base
     final_subfolder_abs = find_unique_path(base_target_path)
-    if final_subfolder_abs is None: return None # Не нашли имя
 
     final_subfolder_abs.mkdir(parents=True, exist_ok=True) # Прямой вызов
+    note_created(final_subfolder_abs)
     relative_path = final_subfolder_abs.relative_to(tasks_folder_root)
     return str(relative_path.as_posix())
 
@@ -1,20 +1,61 @@
 # zadachi/cods/import_export_mixin.py
 
+import json
+import os
 import shutil
-import tempfile
+import threading
+import time
 import zipfile
 from pathlib import Path
 
 # Используем UI для сообщений пользователю
 from PySide6.QtWidgets import QMessageBox, QFileDialog
 
+from .blob_store import restore_links
+from .constants import (BACKUP_MANIFEST_NAME, IMPORT_STAGING_SUFFIX, IMPORT_PREVIOUS_SUFFIX, REFS_FOLDER_NAME,
+                        PENDING_PART, COMPLETED_PART, FOLDERS_PART)
+from .file_utils import forget_dir_names, find_unique_path
+from .records import Task, Command
+from .shard_store import command_part
+from .archive_writer import collect_archive_members, write_archive, get_archive_format, archive_path_for
+from .tar_archive import resolve_archive_format, detect_archive_format, extract_tar_stream
+from .backup_manifest import (read_archive_manifest, build_manifest, changed_members, new_manifest,
+                              parent_reference, materialize_backup)
+
 
 class ImportExportMixin:
     """Миксин для импорта/экспорта данных задачника."""
 
-    def export_tasks(self, archive_path="tasks_backup.zip"):
-        """Экспортирует папку задач в ZIP-архив."""
-        archive_path = Path(archive_path).with_suffix(".zip")
+    def archive_members(self, archive_path):
+        """Члены архива папки задач и служебные файлы из памяти: (members, {имя в архиве: данные}).
+
+        При SQLite и шардах tasks.json (переносимый формат) кладется в архив из памяти, не на диск.
+        """
+        snapshot = self.json_snapshot()
+        skip_paths = [archive_path] if snapshot is None else [archive_path, self.tasks_file] # Без старого снимка
+        members = collect_archive_members(self.tasks_folder, self.useful_commands, skip_paths=skip_paths)
+        return members, ({} if snapshot is None else {self.tasks_file.name: snapshot})
+
+    def export_tasks(self, archive_path="tasks_backup.zip", base_archive=None, archive_format=None):
+        """Экспортирует папку задач в архив ZIP или tar (с base_archive - только изменения после этой копии).
+
+        Расширение archive_path заменяется расширением формата; по умолчанию формат - из настроек.
+        """
+        # Восстановлению цепочки нужен выборочный доступ к файлам архивов - инкрементальные копии только ZIP
+        if base_archive is not None: archive_format = 'zip'
+        archive_format = resolve_archive_format(archive_format or get_archive_format())
+        archive_path = archive_path_for(archive_path, archive_format)
+        parent_manifest = None
+        if base_archive is not None:
+            if Path(base_archive).resolve() == archive_path.resolve():
+                QMessageBox.critical(None, "Ошибка экспорта", "Новая копия не может заменить свою предыдущую копию.")
+                return False
+            parent_manifest = read_archive_manifest(base_archive)
+            if parent_manifest is None:
+                QMessageBox.critical(None, "Ошибка экспорта",
+                                     f"Архив '{Path(base_archive).name}' создан без манифеста копии "
+                                     f"и не может быть основой инкрементальной копии.")
+                return False
         # Удаляем существующий архив напрямую
         archive_path.unlink(missing_ok=True)
 
@@ -22,21 +63,31 @@ class ImportExportMixin:
             QMessageBox.critical(None, "Ошибка экспорта", "Папка данных задачника не найдена или недоступна.")
             return False
 
-        # Запаковываем папку напрямую
-        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in self.tasks_folder.rglob("*"):
-                if file_path.resolve() == archive_path.resolve(): continue
-                is_empty_dir = file_path.is_dir() and not any(file_path.iterdir())
-                if file_path.is_file() or is_empty_dir:
-                    relative_path = file_path.relative_to(self.tasks_folder)
-                    zipf.write(file_path, relative_path)
+        # Отложенные изменения должны попасть в архив
+        if not self.flush():
+            QMessageBox.critical(None, "Ошибка экспорта", "Не удалось сохранить текущие данные перед экспортом.")
+            return False
+
+        # Запаковываем папку напрямую (сжатие - в пуле потоков)
+        members, extra_files = self.archive_members(archive_path)
+        # Манифест копии: размер, время и хеш каждого файла; хеши неизменных файлов берутся у родителя
+        files = build_manifest(members, parent_manifest['files'] if parent_manifest else None)
+        for name, data in extra_files.items(): # Снимок из памяти пишется в каждую копию заново
+            files[name] = [len(data), time.time_ns(), None]
+        parent_name = None
+        if parent_manifest is not None:
+            members = changed_members(members, files, parent_manifest['files'])
+            parent_name = parent_reference(base_archive, archive_path)
+        manifest = new_manifest(files, parent_manifest, parent_name)
+        extra_files[BACKUP_MANIFEST_NAME] = json.dumps(manifest, ensure_ascii=False)
+        write_archive(archive_path, members, extra_files=extra_files, archive_format=archive_format)
 
         QMessageBox.information(None, "Успех", f"Экспорт данных в {archive_path} завершен.")
         return True
 
 
     def import_tasks(self, path):
-        """Импортирует задачи из папки или ZIP-архива, заменяя текущие данные."""
+        """Импортирует задачи из папки или архива, заменяя текущие данные (подменой папки целиком)."""
         path = Path(path)
         if not path.exists():
             QMessageBox.critical(None, "Ошибка импорта", f"Выбранный путь не найден:\n{path}")
@@ -49,74 +100,233 @@ class ImportExportMixin:
         if reply == QMessageBox.No:
             return False
 
-        # Выполняем импорт напрямую
-        if path.is_dir():
-            self._import_from_folder(path, self.tasks_folder)
-        elif path.suffix.lower() == '.zip':
-            self._import_from_archive(path, self.tasks_folder)
-        else:
-            QMessageBox.critical(None, "Ошибка импорта", f"Неподдерживаемый тип источника:\n{path}")
+        # Новые данные собираются рядом с папкой задач; текущие не затрагиваются до подмены
+        try:
+            if path.is_dir():
+                staged_folder = self._stage_from_folder(path, self.tasks_folder)
+            elif path.is_file() and detect_archive_format(path) is not None: # ZIP, tar.zst или tar.gz
+                staged_folder = self._stage_from_archive(path, self.tasks_folder)
+            else:
+                QMessageBox.critical(None, "Ошибка импорта", f"Неподдерживаемый тип источника:\n{path}")
+                return False
+        except Exception as e:
+            QMessageBox.critical(None, "Ошибка импорта", f"Не удалось подготовить данные для импорта:\n{e}\n\n"
+                                                         f"Текущие данные не изменены.")
             return False
 
-        # Перезагрузка данных после импорта
-        if hasattr(self, 'load_tasks'):
-             self.load_tasks() # Прямой вызов
-             QMessageBox.information(None, "Успех", "Импорт успешно завершен.")
-             return True
-        else:
-             QMessageBox.critical(None, "Критическая ошибка", "Импорт завершен, но не удалось перезагрузить данные.")
-             return False
+        # Дописываем отложенные изменения, чтобы таймер не сработал посреди замены файлов
+        self.flush()
+        self.close_storage() # Файлы базы будут заменены
 
+        staging_root = _sibling_folder(self.tasks_folder, IMPORT_STAGING_SUFFIX)
+        previous_folder = _sibling_folder(self.tasks_folder, IMPORT_PREVIOUS_SUFFIX)
+        shutil.rmtree(previous_folder, ignore_errors=True) # Остаток прерванного импорта
+        try:
+            self._swap_in_folder(staged_folder, self.tasks_folder, previous_folder)
+        except OSError as e:
+            shutil.rmtree(staging_root, ignore_errors=True)
+            self.load_tasks() # Папка задач осталась прежней
+            QMessageBox.critical(None, "Ошибка импорта", f"Не удалось заменить папку задач:\n{e}\n\n"
+                                                         f"Текущие данные не изменены.")
+            return False
+        shutil.rmtree(staging_root, ignore_errors=True) # Остальное содержимое архива вокруг папки с tasks.json
 
-    def _import_from_archive(self, archive_path, target_root_folder):
-        """Распаковывает архив и импортирует из временной папки."""
-        with tempfile.TemporaryDirectory() as temp_dir:
-            with zipfile.ZipFile(archive_path, 'r') as archive:
-                archive.extractall(temp_dir) # Прямой вызов
+        try:
+            # Файлы, упакованные в архив один раз, восстанавливаются из манифеста ссылок (блобы - уже в новой папке)
+            restore_links(self.tasks_folder, getattr(self, 'blob_store', None))
+            (self.tasks_folder / BACKUP_MANIFEST_NAME).unlink(missing_ok=True) # Манифест нужен только в архиве
+            # Перезагрузка данных после импорта
+            self.load_tasks() # Прямой вызов
+        except Exception as e:
+            # Откат: прежняя папка возвращается на место, импортированная удаляется
+            self.close_storage() # Неудавшаяся загрузка могла открыть базу в импортированной папке
+            self._swap_in_folder(previous_folder, self.tasks_folder, staging_root)
+            shutil.rmtree(staging_root, ignore_errors=True)
+            self.load_tasks()
+            QMessageBox.critical(None, "Ошибка импорта", f"Импортированные данные не загрузились:\n{e}\n\n"
+                                                         f"Восстановлены прежние данные.")
+            return False
 
-            temp_path = Path(temp_dir)
-            tasks_json_path = temp_path / "tasks.json"
-            folder_to_import = None
+        # Прежние данные больше не нужны: удаление большой папки не задерживает интерфейс
+        threading.Thread(target=shutil.rmtree, args=(previous_folder,), kwargs={'ignore_errors': True},
+                         name="ImportCleanup", daemon=True).start()
+        QMessageBox.information(None, "Успех", "Импорт успешно завершен.")
+        return True
 
-            if tasks_json_path.is_file():
-                folder_to_import = temp_path
+
+    def _stage_from_archive(self, archive_path, target_root_folder):
+        """Распаковывает архив в папку рядом с target_root_folder; возвращает папку с tasks.json."""
+        staging_folder = _new_staging_folder(target_root_folder)
+        try:
+            archive_format = detect_archive_format(archive_path)
+            manifest = read_archive_manifest(archive_path) if archive_format == 'zip' else None
+            if archive_format != 'zip':
+                with open(archive_path, 'rb') as archive:
+                    extract_tar_stream(archive, staging_folder, archive_format) # Прямой вызов
+            elif manifest is not None and manifest['kind'] == 'incremental':
+                # Инкрементальная копия: файлы собираются из архивов цепочки до полной копии
+                materialize_backup(archive_path, staging_folder)
             else:
-                for item in temp_path.iterdir():
+                with zipfile.ZipFile(archive_path, 'r') as archive:
+                    archive.extractall(staging_folder) # Прямой вызов
+
+            folder_to_import = None
+            if (staging_folder / "tasks.json").is_file():
+                folder_to_import = staging_folder
+            else:
+                for item in staging_folder.iterdir():
                     if item.is_dir() and (item / "tasks.json").is_file():
                         folder_to_import = item
                         break
-
-            if folder_to_import:
-                self._import_from_folder(folder_to_import, target_root_folder) # Прямой вызов
-            else:
+            if folder_to_import is None:
                 # Прямое возбуждение исключения, если tasks.json не найден
                 raise FileNotFoundError(f"Файл 'tasks.json' не найден в архиве {archive_path}")
+            _check_tasks_json(folder_to_import)
+            return folder_to_import
+        except BaseException:
+            shutil.rmtree(staging_folder, ignore_errors=True)
+            raise
 
 
-    def _import_from_folder(self, source_folder, target_root_folder):
-        """Заменяет содержимое папки target_root_folder содержимым source_folder."""
+    def _stage_from_folder(self, source_folder, target_root_folder):
+        """Копирует source_folder в папку рядом с target_root_folder (на той же файловой системе)."""
         source_folder = Path(source_folder)
-        target_root_folder = Path(target_root_folder)
-
         if not (source_folder / "tasks.json").is_file():
              # Прямое возбуждение исключения
              raise FileNotFoundError(f"Файл 'tasks.json' не найден в исходной папке: {source_folder}")
+        _check_tasks_json(source_folder)
+
+        staging_folder = _new_staging_folder(target_root_folder)
+        try:
+            shutil.copytree(source_folder, staging_folder, dirs_exist_ok=True) # Прямой вызов
+        except BaseException:
+            shutil.rmtree(staging_folder, ignore_errors=True)
+            raise
+        return staging_folder
+
 
-        # Очистка папки назначения напрямую
-        if target_root_folder.exists():
-             for item in target_root_folder.iterdir():
-                  if item.is_dir():
-                      shutil.rmtree(item) # Прямой вызов
-                  else:
-                      item.unlink() # Прямой вызов
+    def _swap_in_folder(self, new_folder, target_root_folder, displaced_folder):
+        """Ставит new_folder на место target_root_folder переименованием; прежнее - в displaced_folder.
+
+        Если папку целиком переименовать нельзя (Windows: открыта в другой программе), переносятся
+        ее элементы. При ошибке все возвращается как было.
+        """
+        try:
+            os.replace(target_root_folder, displaced_folder)
+        except OSError:
+            displaced_folder.mkdir()
+            moved_out, moved_in = [], []
+            try:
+                for item in list(target_root_folder.iterdir()):
+                    os.replace(item, displaced_folder / item.name)
+                    moved_out.append(item.name)
+                for item in list(new_folder.iterdir()):
+                    os.replace(item, target_root_folder / item.name)
+                    moved_in.append(item.name)
+            except OSError:
+                for name in moved_in: os.replace(target_root_folder / name, new_folder / name)
+                for name in moved_out: os.replace(displaced_folder / name, target_root_folder / name)
+                displaced_folder.rmdir()
+                raise
+            new_folder.rmdir()
         else:
-             target_root_folder.mkdir(parents=True, exist_ok=True) # Прямой вызов
-
-        # Копирование напрямую
-        for item in source_folder.iterdir():
-            source_item = source_folder / item.name
-            dest_item = target_root_folder / item.name
-            if source_item.is_dir():
-                shutil.copytree(source_item, dest_item, dirs_exist_ok=True) # Прямой вызов
-            elif source_item.is_file():
-                shutil.copy2(source_item, dest_item) # Прямой вызов
\ No newline at end of file
+            try:
+                os.replace(new_folder, target_root_folder)
+            except OSError:
+                os.replace(displaced_folder, target_root_folder)
+                raise
+        forget_dir_names() # Кэш имен описывал прежние папки
+
+
+    # --- Частичное восстановление из копии (BackupArchive) ---
+
+    def restore_backup_tasks(self, backup, task_ids):
+        """Добавляет задачи копии в текущие данные (в тот же список: активные или выполненные)."""
+        parts = set()
+        for task_id in task_ids:
+            location = backup.task_location(task_id)
+            if location is None: continue
+            is_completed, task_idx = location
+            snapshot = (backup.completed_tasks if is_completed else backup.pending_tasks)[task_idx].snapshot()
+            if self.find_by_id(task_id) is not None:
+                # Задача еще есть в текущих данных: копия получает новые ID
+                snapshot['id'] = None
+                snapshot['subtasks'] = [dict(subtask, id=None) for subtask in snapshot.get('subtasks') or []]
+            (self.completed_tasks if is_completed else self.pending_tasks).append(Task(snapshot))
+            parts.add(COMPLETED_PART if is_completed else PENDING_PART)
+        return bool(parts) and self.save_tasks(parts=parts) # Прямой вызов
+
+    def restore_backup_command(self, backup, command_id):
+        """Восстанавливает команду копии (с подпапкой вложений) в ее прежнюю папку."""
+        location = backup.command_location(command_id)
+        if location is None: return False
+        folder_key, command_idx = location
+        return self._restore_backup_commands(backup, {folder_key: [backup.useful_commands[folder_key][command_idx]]})
+
+    def restore_backup_folder(self, backup, folder_key):
+        """Восстанавливает папку команд копии со всеми вложенными папками."""
+        commands_by_folder = {key: commands for key, commands in backup.useful_commands.items()
+                              if key == folder_key or key.startswith(folder_key + '/')}
+        if not commands_by_folder: return False
+        return self._restore_backup_commands(backup, commands_by_folder)
+
+    def _restore_backup_commands(self, backup, commands_by_folder):
+        """Распаковывает только подпапки и снимки ссылок команд, затем добавляет команды в их папки."""
+        prefixes, restored, created = {}, {}, []
+        for folder_key, commands in commands_by_folder.items():
+            restored[folder_key] = []
+            for command in commands:
+                snapshot = command.snapshot()
+                # Команда еще есть в текущих данных: копия получает новый ID
+                if self.find_by_id(command.id) is not None: snapshot['id'] = None
+                new_command = Command(snapshot)
+                subfolder_rel = command.get('subfolder')
+                if subfolder_rel:
+                    # Место занято - подпапка восстанавливается рядом (как из корзины)
+                    target = find_unique_path(self.tasks_folder / subfolder_rel.replace('/', os.sep))
+                    new_command['subfolder'] = target.relative_to(self.tasks_folder).as_posix()
+                    prefixes[f"{backup.prefix}{subfolder_rel}/"] = new_command['subfolder'] + '/'
+                    created.append(target)
+                prefixes[f"{backup.prefix}{REFS_FOLDER_NAME}/{command.id}/"] = f"{REFS_FOLDER_NAME}/{new_command.id}/"
+                created.append(self.tasks_folder / REFS_FOLDER_NAME / new_command.id)
+                restored[folder_key].append(new_command)
+
+        try:
+            backup.extract(prefixes, self.tasks_folder) # Прямой вызов
+        except BaseException:
+            for target in created: shutil.rmtree(target, ignore_errors=True)
+            raise
+
+        parts = set()
+        for folder_key, commands in restored.items():
+            if folder_key not in self.useful_commands:
+                self.useful_commands[folder_key] = []
+                parts.add(FOLDERS_PART)
+            self.useful_commands[folder_key].extend(commands)
+            parts.add(command_part(folder_key))
+        if not self.save_tasks(parts=parts): return False # Прямой вызов
+        if any(command.get('watch_source') for commands in restored.values() for command in commands):
+            self.source_watcher.refresh()
+        return True
+
+
+def _sibling_folder(folder, suffix):
+    """Папка рядом с folder (та же файловая система - переименование без копирования)."""
+    return folder.with_name(folder.name + suffix)
+
+
+def _new_staging_folder(target_root_folder):
+    """Пустая папка для сборки импорта рядом с папкой задач."""
+    target_root_folder.mkdir(parents=True, exist_ok=True) # Прямой вызов
+    staging_folder = _sibling_folder(target_root_folder, IMPORT_STAGING_SUFFIX)
+    shutil.rmtree(staging_folder, ignore_errors=True) # Остаток прерванного импорта
+    staging_folder.mkdir()
+    return staging_folder
+
+
+def _check_tasks_json(folder):
+    """Проверяет, что tasks.json читается как данные задачника, до замены текущих данных."""
+    with open(folder / "tasks.json", 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("Файл 'tasks.json' не содержит данных задачника")
\ No newline at end of file
@@ -0,0 +1,82 @@
+# zadachi/cods/journal.py
+
+import os
+from pathlib import Path
+
+from .json_utils import _encode_json, _decode_json
+
+
+class ChangeBatch:
+    """Изменения одной транзакции: копятся в памяти и фиксируются одной записью."""
+
+    def __init__(self):
+        self.records = []   # (op, поля) в порядке выполнения
+        self.parts = set()  # Затронутые части данных; None - все данные
+        self.ok = True      # Результат фиксации (заполняется при выходе из транзакции)
+
+    def add(self, op, parts, fields):
+        """Добавляет изменение в транзакцию."""
+        self.records.append((op, fields))
+        if parts is None or self.parts is None:
+            self.parts = None
+        else:
+            self.parts.update(parts)
+
+
+class TaskJournal:
+    """Журнал операций: одна JSON-строка на изменение, дописывается в конец файла."""
+
+    def __init__(self, journal_path):
+        self.path = Path(journal_path)
+
+    @staticmethod
+    def encode(record):
+        """Строка журнала для записи (кодируется сразу - запись может измениться позже)."""
+        return _encode_json(record, compact=True) + b'\n'
+
+    def append(self, record):
+        """Дописывает запись и сбрасывает ее на диск."""
+        return self.append_line(self.encode(record))
+
+    def append_line(self, line):
+        """Дописывает готовую строку журнала и сбрасывает ее на диск."""
+        # Прямая запись без try-except: ошибки ОС поднимаются выше
+        with self.path.open('ab') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def read_records(self, after_seq=0):
+        """Читает записи с номером больше after_seq; оборванный хвост отбрасывается."""
+        if not self.path.is_file():
+            return []
+
+        records = []
+        valid_end = 0
+        with self.path.open('rb') as f:
+            for raw_line in f:
+                # Строка без перевода строки - запись, прерванная сбоем
+                if not raw_line.endswith(b'\n'):
+                    break
+                try:
+                    record = _decode_json(raw_line)
+                except ValueError:
+                    break
+                valid_end += len(raw_line)
+                if isinstance(record, dict) and record.get('seq', 0) > after_seq:
+                    records.append(record)
+
+        # Обрезаем поврежденный хвост, чтобы новые записи не легли после мусора
+        if valid_end < self.path.stat().st_size:
+            with self.path.open('r+b') as f:
+                f.truncate(valid_end)
+        return records
+
+    def size(self):
+        """Размер журнала в байтах."""
+        return self.path.stat().st_size if self.path.is_file() else 0
+
+    def reset(self):
+        """Очищает журнал после записи полного снимка."""
+        self.path.unlink(missing_ok=True)
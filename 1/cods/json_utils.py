@@ -1,36 +1,182 @@
 # zadachi/cods/json_utils.py
+import codecs
+import hashlib
 import json
 import os
 from pathlib import Path
 
+# Быстрый нативный кодек (необязательная зависимость), иначе - стандартный json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Компактный вывод (без отступов) - меньше файл и быстрее запись
+_json_options = {'compact': False}
+
+
+def set_json_compact(compact):
+    """Включает/выключает компактный (без отступов) формат записи."""
+    _json_options['compact'] = bool(compact)
+
+
+def json_codec_name():
+    """Имя используемого кодека: 'orjson' или 'json'."""
+    return 'orjson' if orjson is not None else 'json'
+
+
+class RawJSON(bytes):
+    """Уже сериализованное значение ключа верхнего уровня: пишется в файл как есть, без разбора."""
+
+
+def _json_default(obj):
+    """Записи (Task, Command и т.п.) сериализуются через to_dict()."""
+    to_dict = getattr(obj, 'to_dict', None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return to_dict()
+
+
+def _encode_json(data, compact=None):
+    """Сериализует данные в UTF-8 байты."""
+    if compact is None:
+        compact = _json_options['compact']
+    if orjson is not None:
+        try:
+            # orjson умеет только отступ в 2 пробела - стандартный кодек пишет так же (файл не зависит от кодека)
+            return orjson.dumps(data, default=_json_default, option=0 if compact else orjson.OPT_INDENT_2)
+        except TypeError:
+            pass # Например, int больше 64 бит - пробуем стандартный кодек
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
+
+
+def _encode_document(data, compact=None):
+    """Сериализует файл данных: каждый ключ верхнего уровня - с новой строки, значения RawJSON - как есть.
+
+    Перевод строки внутри строк JSON экранируется, поэтому ключ верхнего уровня находится поиском
+    без разбора (_split_last_list) и в компактном виде, где у подзадач те же ключи.
+    """
+    if compact is None:
+        compact = _json_options['compact']
+    if not isinstance(data, dict):
+        return _encode_json(data, compact)
+    if compact:
+        return b'{' + b',\n'.join(_encode_json(str(key), True) + b':' +
+                                   (value if isinstance(value, RawJSON) else _encode_json(value, True))
+                                   for key, value in data.items()) + b'}'
+    raw_values = {key: value for key, value in data.items() if isinstance(value, RawJSON)}
+    if not raw_values:
+        return _encode_json(data, False) # Отступы и так ставят ключи верхнего уровня с новой строки
+    content = _encode_json({key: value for key, value in data.items() if key not in raw_values}, False)
+    for key, value in raw_values.items():
+        body = content.rstrip()[:-1].rstrip() # Без закрывающей скобки
+        separator = b'' if body.endswith(b'{') else b','
+        content = body + separator + b'\n  ' + _encode_json(str(key), True) + b': ' + value + b'\n}'
+    return content
+
+
+def _split_last_list(content, key):
+    """Отделяет последний ключ верхнего уровня со списком: (объект без него, байты списка) или None.
+
+    Неразобранный список ищется по тексту: ключ верхнего уровня (и только он) стоит в начале строки -
+    с отступом 2 или без отступа в компактном виде (_encode_document); ошибку найдет разбор остатка.
+    """
+    key_json = _encode_json(key, True)
+    for marker in (b',\n  ' + key_json + b': ', b',\n' + key_json + b':'):
+        pos = content.rfind(marker)
+        if pos < 0: continue
+        value = content[pos + len(marker):].rstrip()
+        if not value.endswith(b'}'): return None
+        value = value[:-1].rstrip()
+        if not (value.startswith(b'[') and value.endswith(b']')): return None
+        return content[:pos] + b'}', value
+    return None
+
+
+def _decode_json(raw):
+    """Разбирает JSON из байтов без промежуточной строки."""
+    if raw.startswith(codecs.BOM_UTF8):
+        raw = raw[len(codecs.BOM_UTF8):]
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass # NaN/Infinity и прочие расширения stdlib - пробуем стандартный кодек
+    # json.loads выбросит исключение при ошибке парсинга
+    return json.loads(raw)
+
+
+def _fingerprint(content):
+    """Отпечаток содержимого файла (blake2b, 128 бит)."""
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
 def _load_json(file_path, default=None):
     """Читает JSON-файл."""
+    return _load_json_fingerprinted(file_path, default)[0]
+
+
+def _load_json_fingerprinted(file_path, default=None, defer_key=None):
+    """Читает JSON-файл; возвращает (данные, отпечаток байтов или None, если файла нет).
+
+    defer_key - последний ключ со списком, который не разбирается: в данных он будет байтами RawJSON.
+    """
     file_path = Path(file_path)
     if not file_path.exists():
-        return default() if callable(default) else default if default is not None else {}
+        return (default() if callable(default) else default if default is not None else {}), None
+
+    # Прямое чтение байтов и парсинг без try-except
+    content = file_path.read_bytes()
+    if not content:
+        return (default() if callable(default) else default if default is not None else {}), None
+    if defer_key is not None:
+        split = _split_last_list(content, defer_key)
+        if split is not None:
+            try:
+                data = _decode_json(split[0])
+            except ValueError:
+                data = None # Вхождение оказалось вложенным - разбираем файл целиком
+            if isinstance(data, dict):
+                data[defer_key] = RawJSON(split[1])
+                return data, _fingerprint(content)
+    return _decode_json(content), _fingerprint(content)
+
+
+def _fsync_dir(folder):
+    """Сбрасывает на диск записи папки (созданные и переименованные файлы); в Windows - не нужно и невозможно."""
+    if os.name == 'nt': return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
-    # Прямое чтение и парсинг без try-except
-    with file_path.open('r', encoding='utf-8') as f:
-        content = f.read()
-        if not content:
-            return default() if callable(default) else default if default is not None else {}
-        # json.loads выбросит исключение при ошибке парсинга
-        return json.loads(content)
 
+def _save_json(file_path, data, compact=None):
+    """Сохраняет данные в JSON-файл (атомарно: через временный файл и замену)."""
+    return _save_json_fingerprinted(file_path, data, compact) is not None
 
-def _save_json(file_path, data):
-    """Сохраняет данные в JSON-файл."""
+
+def _save_json_fingerprinted(file_path, data, compact=None):
+    """Сохраняет JSON-файл; возвращает отпечаток записанных байтов (None - данные не сериализуемы)."""
     file_path = Path(file_path)
     # Прямое создание папок без try-except
     file_path.parent.mkdir(parents=True, exist_ok=True)
-    # Прямая запись без try-except (кроме TypeError при dump)
-    with file_path.open('w', encoding='utf-8') as f:
-        try:
-            # json.dump может вызвать TypeError, если данные не сериализуемы
-            json.dump(data, f, ensure_ascii=False, indent=4)
-            return True # Успех, если dump не вызвал TypeError
-        except TypeError:
-             # QMessageBox.critical(None, "Ошибка сохранения", f"Ошибка сериализации данных в JSON для файла:\n{file_path}")
-             # Вывод сообщения убран, но ошибка все равно произошла
-             return False # Возвращаем неуспех
-    # Ошибки ОС (права доступа, диск полон) приведут к падению программы раньше
\ No newline at end of file
+    try:
+        # Сериализация может вызвать TypeError, если данные не сериализуемы
+        content = _encode_document(data, compact)
+    except TypeError:
+        # Старый файл остается нетронутым
+        return None # Возвращаем неуспех
+
+    # Пишем во временный файл рядом и подменяем: сбой посреди записи не портит старый файл
+    tmp_path = file_path.with_name(file_path.name + '.tmp')
+    with tmp_path.open('wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+    return _fingerprint(content)
+    # Ошибки ОС (права доступа, диск полон) приведут к падению программы раньше
@@ -0,0 +1,261 @@
+# zadachi/cods/records.py
+import gc
+import sys
+import uuid
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager
+
+from .constants import STATUS_OPTIONS, PRIORITY_LEVELS, DEFAULT_TASK_FIELDS, DEFAULT_COMMAND_FIELDS
+
+# Коды статусов и приоритетов: в записи хранится маленькое число вместо строки
+_STATUS_CODES = {name: code for code, name in enumerate(STATUS_OPTIONS)}
+_PRIORITY_CODES = {name: code for code, name in enumerate(PRIORITY_LEVELS)}
+_STATUS_NAMES = tuple(STATUS_OPTIONS)
+_PRIORITY_NAMES = tuple(PRIORITY_LEVELS)
+
+
+def _encode_code(value, codes):
+    """Известное значение -> код; неизвестное хранится как есть."""
+    return codes.get(value, value) if isinstance(value, str) else value
+
+
+def _decode_code(value, names):
+    return names[value] if type(value) is int else value
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def new_record_id():
+    """Новый постоянный ID записи."""
+    return uuid.uuid4().hex
+
+
+def _layout(fields, defaults, converters):
+    """Раскладка полей: (ключ JSON, слот, преобразование, значение по умолчанию)."""
+    return tuple((key, '_' + key if key in converters else key, converters.get(key), defaults.get(key))
+                 for key in fields)
+
+
+class _Record(MutableMapping):
+    """Запись с фиксированными полями в __slots__ и словарным интерфейсом (как у JSON-объекта)."""
+    __slots__ = ('_extra', 'id')
+    _FIELDS = ()      # Ключи JSON в порядке записи
+    _FIELD_SET = frozenset()
+    _LAYOUT = ()
+
+    def __init__(self, data=None):
+        if data is None: data = {}
+        for key, slot, convert, default in self._LAYOUT:
+            value = data.get(key, default)
+            if value is default and isinstance(default, (list, dict)):
+                value = type(default)(default) # Общий список (словарь) из значений по умолчанию не разделяем
+            setattr(self, slot, convert(value) if convert is not None else value)
+        if not self.id:
+            self.id = new_record_id() # ID постоянный: сохраняется в файле и переживает сортировки
+        # Поля, неизвестные этой версии, сохраняются без потерь
+        if len(data) > len(self._FIELDS) or not self._FIELD_SET.issuperset(data):
+            self._extra = {key: value for key, value in data.items() if key not in self._FIELD_SET} or None
+        else:
+            self._extra = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Создает запись из словаря формата JSON."""
+        return cls(data)
+
+    def to_dict(self):
+        """Словарь формата JSON (для записи на диск)."""
+        result = {key: getattr(self, key) for key in self._FIELDS}
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    def snapshot(self):
+        """Словарь JSON без общих с записью списков (для записи в фоновом потоке)."""
+        result = self.to_dict()
+        for key, value in result.items():
+            if type(value) is list: result[key] = list(value)
+            elif type(value) is dict: result[key] = dict(value)
+        return result
+
+    def copy(self):
+        """Поверхностная копия записи."""
+        return type(self)(self)
+
+    # --- Словарный интерфейс ---
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None: self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELD_SET:
+            raise TypeError(f"Поле записи нельзя удалить: {key}")
+        if not self._extra or key not in self._extra:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __iter__(self):
+        yield from self._FIELDS
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return len(self._FIELDS) + (len(self._extra) if self._extra else 0)
+
+    def __contains__(self, key):
+        return key in self._FIELD_SET or bool(self._extra and key in self._extra)
+
+    def get(self, key, default=None):
+        if key in self._FIELD_SET:
+            return getattr(self, key)
+        if self._extra:
+            return self._extra.get(key, default)
+        return default
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            # Быстрое сравнение по значениям полей (без сборки словарей)
+            return all(getattr(self, key) == getattr(other, key) for key in self._FIELDS) \
+                and (self._extra or None) == (other._extra or None)
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Subtask(_Record):
+    """Подзадача."""
+    __slots__ = ('_name', 'completed')
+    _FIELDS = ('id', 'name', 'completed')
+    _FIELD_SET = frozenset(_FIELDS)
+    _LAYOUT = _layout(_FIELDS, {'id': None, 'name': 'Без имени', 'completed': False}, {'name': _intern})
+
+    name = property(lambda self: self._name, lambda self, value: setattr(self, '_name', _intern(value)))
+
+    def __init__(self, data=None):
+        # Развернутый вариант _Record.__init__: подзадач при загрузке больше всего
+        if type(data) is not dict or len(data) != 3 or not self._FIELD_SET.issuperset(data) or not data['id']:
+            return super().__init__(data)
+        self.id = data['id']
+        self._name = _intern(data['name'])
+        self.completed = data['completed']
+        self._extra = None
+
+
+def _as_subtask(item):
+    """Подзадача из записи, словаря или строки (старый формат)."""
+    if isinstance(item, Subtask): return item
+    if isinstance(item, str): return Subtask({'name': item})
+    return Subtask(item)
+
+
+class Task(_Record):
+    """Задача: статус и приоритет хранятся кодами, подзадачи - записями Subtask."""
+    __slots__ = ('_name', '_status', '_priority', 'description', 'created_time', 'started_time',
+                 'completed_time', '_subtasks')
+    _FIELDS = tuple(DEFAULT_TASK_FIELDS)
+    _FIELD_SET = frozenset(_FIELDS)
+
+    name = property(lambda self: self._name, lambda self, value: setattr(self, '_name', _intern(value)))
+    status = property(lambda self: _decode_code(self._status, _STATUS_NAMES),
+                      lambda self, value: setattr(self, '_status', _encode_code(value, _STATUS_CODES)))
+    priority = property(lambda self: _decode_code(self._priority, _PRIORITY_NAMES),
+                        lambda self, value: setattr(self, '_priority', _encode_code(value, _PRIORITY_CODES)))
+
+    @property
+    def subtasks(self):
+        return self._subtasks
+
+    @subtasks.setter
+    def subtasks(self, value):
+        self._subtasks = [_as_subtask(item) for item in value] if isinstance(value, list) else value
+
+    def __init__(self, data=None):
+        # Развернутый вариант _Record.__init__ для нормализованного словаря (основной путь загрузки)
+        if type(data) is not dict or len(data) != len(self._FIELDS) or not self._FIELD_SET.issuperset(data) \
+                or not data['id']:
+            return super().__init__(data)
+        self.id = data['id']
+        self._name = _intern(data['name'])
+        status = data['status']
+        self._status = _STATUS_CODES.get(status, status) if type(status) is str else status
+        priority = data['priority']
+        self._priority = _PRIORITY_CODES.get(priority, priority) if type(priority) is str else priority
+        self.description = data['description']
+        self.created_time = data['created_time']
+        self.started_time = data['started_time']
+        self.completed_time = data['completed_time']
+        subtasks = data['subtasks']
+        self._subtasks = [_as_subtask(item) for item in subtasks] if type(subtasks) is list else subtasks
+        self._extra = None
+
+    _LAYOUT = _layout(_FIELDS, DEFAULT_TASK_FIELDS, {
+        'name': _intern,
+        'status': lambda value: _encode_code(value, _STATUS_CODES),
+        'priority': lambda value: _encode_code(value, _PRIORITY_CODES),
+        'subtasks': lambda value: [_as_subtask(item) for item in value] if isinstance(value, list) else value,
+    })
+
+    def to_dict(self):
+        result = super().to_dict()
+        if isinstance(self._subtasks, list):
+            result['subtasks'] = [subtask.to_dict() for subtask in self._subtasks]
+        return result
+
+
+class Command(_Record):
+    """Полезная команда с путями вложений."""
+    __slots__ = ('_name', 'description', 'subfolder', 'ino_paths', 'py_paths', 'pdf_paths', 'img_paths',
+                 'ref_paths', 'source_folders', 'watch_source')
+    _FIELDS = tuple(DEFAULT_COMMAND_FIELDS)
+    _FIELD_SET = frozenset(_FIELDS)
+    _LAYOUT = _layout(_FIELDS, DEFAULT_COMMAND_FIELDS, {'name': _intern})
+
+    name = property(lambda self: self._name, lambda self, value: setattr(self, '_name', _intern(value)))
+
+
+@contextmanager
+def _gc_paused():
+    """Пауза сборщика циклов: массовое создание записей иначе запускает его тысячи раз."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled: gc.enable()
+
+
+def tasks_from_json(items):
+    """Список задач формата JSON (уже нормализованный) -> записи Task."""
+    with _gc_paused():
+        return [Task(item) for item in items]
+
+
+def snapshot_records(items):
+    """Снимок списка записей для фоновой записи (словари JSON оставляются как есть)."""
+    with _gc_paused():
+        return [item.snapshot() if isinstance(item, _Record) else item for item in items]
+
+
+def commands_from_json(commands_by_folder):
+    """Словарь папок с командами формата JSON (уже нормализованный) -> записи Command."""
+    with _gc_paused():
+        return {folder_key: [Command(item) for item in commands]
+                for folder_key, commands in commands_by_folder.items()}
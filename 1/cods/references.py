@@ -0,0 +1,51 @@
+# zadachi/cods/references.py
+"""Вложения-ссылки: команда хранит путь к внешнему файлу или папке, а не копию.
+
+Содержимое читается с исходного места только при экспорте и пакуется в архив как снимок
+(REFS_FOLDER_NAME/<ID команды>/<хеш пути>/<имя>). После импорта на другой машине ссылка
+разрешается в этот снимок, если исходного пути там нет.
+"""
+import hashlib
+import os
+from pathlib import Path, PurePosixPath
+
+from .constants import REFS_FOLDER_NAME
+
+
+def reference_snapshot_rel(command_id, ref_path):
+    """Путь снимка ссылки относительно папки задач (не зависит от порядка ссылок в команде)."""
+    path_hash = hashlib.blake2b(str(ref_path).encode('utf-8'), digest_size=6).hexdigest()
+    return PurePosixPath(REFS_FOLDER_NAME, command_id, path_hash, Path(ref_path).name or path_hash)
+
+
+def resolve_reference(tasks_folder, command_id, ref_path):
+    """Исходный путь ссылки, иначе ее снимок из архива; None - недоступно ни то, ни другое."""
+    source = Path(ref_path)
+    if source.exists(): return source
+    snapshot = Path(tasks_folder) / reference_snapshot_rel(command_id, ref_path)
+    return snapshot if snapshot.exists() else None
+
+
+def reference_archive_members(tasks_folder, useful_commands):
+    """Файлы ссылок всех команд для архива: [(путь на диске, имя в архиве)].
+
+    Файлы читаются при записи архива прямо с исходного места, временная копия не создается.
+    Исключения EXCLUDED_DIRS не применяются: ссылка - это снимок папки как есть (например, сборки).
+    """
+    members = []
+    for commands in useful_commands.values():
+        for command in commands:
+            for ref_path in command.get('ref_paths') or []:
+                source = resolve_reference(tasks_folder, command.id, ref_path)
+                if source is None: continue
+                arc_root = reference_snapshot_rel(command.id, ref_path)
+                if source.is_file():
+                    members.append((source, arc_root))
+                    continue
+                for root, dirs, files in os.walk(source):
+                    rel_root = Path(root).relative_to(source)
+                    if not dirs and not files: # Пустая папка тоже часть снимка
+                        members.append((Path(root), arc_root / rel_root.as_posix()))
+                    for file_name in files:
+                        members.append((Path(root) / file_name, arc_root / (rel_root / file_name).as_posix()))
+    return members
@@ -0,0 +1,88 @@
+# zadachi/cods/save_scheduler.py
+
+import time
+
+from PySide6.QtCore import QCoreApplication, QTimer
+
+from .constants import SAVE_DEBOUNCE_MS, SAVE_MAX_DELAY_MS
+
+
+class SaveScheduler:
+    """Склеивает серии изменений в одну запись после короткой паузы."""
+
+    def __init__(self, write_callback, delay_ms=SAVE_DEBOUNCE_MS, max_delay_ms=SAVE_MAX_DELAY_MS):
+        self._write_callback = write_callback # Запись: write_callback(parts) -> bool
+        self.delay_ms = delay_ms
+        self.max_delay_ms = max_delay_ms
+        self._dirty = False
+        self._dirty_parts = set() # Измененные части данных; None - все
+        self._dirty_since = None
+        self._timer = None
+
+    @property
+    def is_dirty(self):
+        """Есть ли изменения, еще не записанные на диск."""
+        return self._dirty
+
+    def mark_dirty(self, parts=None):
+        """Отмечает данные (или только части parts) измененными и планирует запись."""
+        if not self._dirty:
+            self._dirty = True
+            self._dirty_since = time.monotonic()
+        self._merge_parts(parts)
+
+        # Без цикла событий Qt таймер не сработает - пишем сразу
+        if self.delay_ms <= 0 or QCoreApplication.instance() is None:
+            return self.flush()
+
+        if self._timer is None:
+            self._timer = QTimer()
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self._on_timeout)
+
+        # Перезапуск таймера продлевает паузу, но не дольше max_delay_ms
+        elapsed_ms = (time.monotonic() - self._dirty_since) * 1000
+        remaining_ms = max(0, int(self.max_delay_ms - elapsed_ms))
+        self._timer.start(min(self.delay_ms, remaining_ms))
+        return True # Изменение принято и будет записано
+
+    def mark_pending(self, parts=None):
+        """Отмечает части неписанными без планирования записи (ее выполнит flush или следующее изменение)."""
+        if not self._dirty:
+            self._dirty = True
+            self._dirty_since = time.monotonic()
+        self._merge_parts(parts)
+
+    def flush(self):
+        """Немедленно записывает отложенные изменения."""
+        if self._timer is not None:
+            self._timer.stop()
+        if not self._dirty:
+            return True
+
+        parts = self._dirty_parts
+        self._dirty = False
+        self._dirty_parts = set()
+        written = False
+        try:
+            written = bool(self._write_callback(parts))
+        finally:
+            if not written:
+                # Запись не удалась - изменения остаются отложенными
+                self._dirty = True
+                self._merge_parts(parts)
+        if written:
+            self._dirty_since = None
+        return written
+
+    def _merge_parts(self, parts):
+        """Добавляет части к набору измененных (None поглощает все)."""
+        if parts is None or self._dirty_parts is None:
+            self._dirty_parts = None
+        else:
+            self._dirty_parts.update(parts)
+
+    def _on_timeout(self):
+        """Срабатывание таймера: запись с повтором при неудаче."""
+        if not self.flush() and self._timer is not None:
+            self._timer.start(self.delay_ms)
@@ -0,0 +1,78 @@
+# zadachi/cods/save_worker.py
+
+import logging
+import queue
+import threading
+
+from PySide6.QtCore import QCoreApplication, QObject, Signal
+
+
+class SaveWorker(QObject):
+    """Фоновая запись: задания выполняются по очереди в отдельном потоке, вне потока интерфейса."""
+    saved = Signal(object)        # parts записанного задания
+    failed = Signal(object, str)  # parts и текст ошибки
+
+    def __init__(self):
+        super().__init__()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._had_failure = False # Была ли ошибка после последнего wait()
+
+    def submit(self, job, parts=None):
+        """Ставит задание job() -> bool в очередь; без цикла событий Qt выполняет его сразу."""
+        if QCoreApplication.instance() is None:
+            return bool(job()) # Без цикла событий: результат и исключения сразу у вызывающего
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="TaskSaveWorker", daemon=True)
+            self._thread.start()
+        self._queue.put((job, parts))
+        return True # Задание принято; результат придет сигналом saved/failed
+
+    def is_idle(self):
+        """Нет заданий в очереди и в работе."""
+        with self._queue.mutex:
+            return self._queue.unfinished_tasks == 0
+
+    def wait(self):
+        """Дожидается выполнения всех заданий; False, если какое-то не удалось."""
+        self._queue.join()
+        with self._lock:
+            ok = not self._had_failure
+            self._had_failure = False
+        return ok
+
+    def stop(self):
+        """Дожидается заданий и завершает поток записи (менеджер задач больше не используется)."""
+        ok = self.wait()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put((None, None)) # Сигнал завершения потоку
+            thread.join()
+        self._thread = None
+        return ok
+
+    def _loop(self):
+        """Цикл потока записи: один поток - порядок записей сохраняется."""
+        while True:
+            job, parts = self._queue.get()
+            try:
+                if job is None: return
+                self._run(job, parts)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job, parts):
+        """Выполняет задание; ошибки потока записи превращаются в сигнал failed."""
+        error = ""
+        try:
+            ok = bool(job())
+        except Exception as e: # В фоновом потоке исключение некому поймать
+            logging.exception("Ошибка фоновой записи")
+            ok, error = False, str(e)
+        if not ok:
+            with self._lock:
+                self._had_failure = True
+        # Сигналы из потока записи доставляются в поток интерфейса через очередь событий
+        if ok: self.saved.emit(parts)
+        else: self.failed.emit(parts, error or "Запись не выполнена")
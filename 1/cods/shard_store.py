@@ -0,0 +1,108 @@
+# zadachi/cods/shard_store.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from .constants import (CURRENT_VERSION, PENDING_PART, COMPLETED_PART, FOLDERS_PART, COMMANDS_PART_PREFIX,
+                        MIGRATED_SUFFIX)
+from .json_utils import _load_json, _save_json, _fsync_dir
+
+
+def command_part(folder_key):
+    """Имя части данных (шарда) для логической папки команд."""
+    return COMMANDS_PART_PREFIX + folder_key
+
+
+class ShardedTaskStore:
+    """Раздельное хранение: pending.json, completed.json и по файлу на папку команд."""
+
+    def __init__(self, shards_folder):
+        self.folder = Path(shards_folder)
+        self.meta_file = self.folder / "meta.json"
+        self.commands_folder = self.folder / "commands"
+
+    def _task_file(self, part):
+        return self.folder / f"{part}.json" # pending.json / completed.json
+
+    def _command_file(self, folder_key):
+        # Ключ 'a/b' кодируется в одно имя файла: a%2Fb.json
+        return self.commands_folder / f"{quote(folder_key, safe='')}.json"
+
+    def has_data(self):
+        """Существует ли раздельная раскладка (meta.json пишется последним)."""
+        return self.meta_file.is_file()
+
+    def read(self, include_completed=True):
+        """Читает шарды параллельно и собирает словарь в формате tasks.json."""
+        meta = _load_json(self.meta_file, default={})
+        folder_keys = meta.get('folders')
+        if not isinstance(folder_keys, list):
+            # Без списка папок берем все файлы шардов
+            folder_keys = sorted(unquote(p.stem) for p in self.commands_folder.glob("*.json"))
+
+        task_parts = [PENDING_PART, COMPLETED_PART] if include_completed else [PENDING_PART]
+        jobs = [self._task_file(part) for part in task_parts]
+        jobs += [self._command_file(key) for key in folder_keys]
+        with ThreadPoolExecutor(max_workers=min(8, len(jobs))) as pool:
+            loaded = list(pool.map(lambda path: _load_json(path, default=list), jobs))
+
+        data = {'version': meta.get('version', '0.0'), 'schema': meta.get('schema', 0)}
+        data.update(zip(task_parts, loaded))
+        data['useful_commands'] = {key: commands for key, commands in zip(folder_keys, loaded[len(task_parts):])}
+        return data
+
+    def read_completed(self):
+        """Читает только шард выполненных задач."""
+        return _load_json(self._task_file(COMPLETED_PART), default=list)
+
+    def write(self, data, parts=None):
+        """Записывает только измененные шарды (parts=None - все)."""
+        commands = data.get('useful_commands', {})
+        write_all = parts is None
+        if write_all:
+            parts = {PENDING_PART, COMPLETED_PART, FOLDERS_PART} | {command_part(key) for key in commands}
+
+        for part in parts:
+            if part in (PENDING_PART, COMPLETED_PART):
+                if part not in data: continue # Список не загружался - шард на диске актуален
+                if not _save_json(self._task_file(part), data.get(part, [])): return False
+            elif part.startswith(COMMANDS_PART_PREFIX):
+                folder_key = part[len(COMMANDS_PART_PREFIX):]
+                if folder_key in commands:
+                    if not _save_json(self._command_file(folder_key), commands[folder_key]): return False
+                else:
+                    self._command_file(folder_key).unlink(missing_ok=True) # Папка удалена
+
+        if write_all:
+            # Удаляем шарды папок, которых больше нет
+            expected = {self._command_file(key).name for key in commands}
+            for shard_file in self.commands_folder.glob("*.json"):
+                if shard_file.name not in expected: shard_file.unlink()
+
+        if write_all or FOLDERS_PART in parts or not self.has_data():
+            meta = {'version': data.get('version', CURRENT_VERSION), 'schema': data.get('schema', 0),
+                    'folders': list(commands.keys())}
+            if not _save_json(self.meta_file, meta): return False
+        return True
+
+    def migrate_from_json(self, json_path):
+        """Переносит единый tasks.json в раздельную раскладку; сам файл становится tasks.json.migrated."""
+        json_path = Path(json_path)
+        if not json_path.is_file():
+            return None
+        data = _load_json(json_path, default={})
+        if not isinstance(data, dict):
+            return None
+        if isinstance(data.get('useful_commands'), list):
+            data['useful_commands'] = {'root': data['useful_commands']} # Старый формат - список команд
+        data.pop('schema', None) # Чужой файл сначала проходит полную нормализацию
+        if not self.write(data): return None
+        # Шарды (файлы сброшены при записи) и их записи в папках - на диске до переименования источника
+        if self.commands_folder.is_dir(): _fsync_dir(self.commands_folder)
+        _fsync_dir(self.folder)
+        # Устаревшая копия под прежним именем выглядела бы как актуальные данные
+        os.replace(json_path, json_path.with_name(json_path.name + MIGRATED_SUFFIX))
+        _fsync_dir(json_path.parent)
+        return data
@@ -0,0 +1,171 @@
+# zadachi/cods/source_watcher.py
+
+import itertools
+import logging
+import os
+import time
+
+from PySide6.QtCore import QCoreApplication, QFileSystemWatcher, QObject, QTimer, Signal
+
+from .constants import EXCLUDED_DIRS, WATCH_DEBOUNCE_MS, WATCH_MAX_DELAY_MS, WATCH_MAX_PATHS
+
+
+class SourceWatcher(QObject):
+    """Слежение за исходными папками вложений: изменения переносятся в подпапку команды обновлением (sync).
+
+    Сохранение в редакторе - это несколько записей и переименований; серия событий склеивается
+    паузой WATCH_DEBOUNCE_MS в одно обновление на команду.
+    """
+    synced = Signal(str, object) # ID команды, отчет об обновлении (None - ошибка или отмена)
+
+    def __init__(self, manager, delay_ms=WATCH_DEBOUNCE_MS, max_delay_ms=WATCH_MAX_DELAY_MS):
+        super().__init__()
+        self._manager = manager
+        self.delay_ms = delay_ms
+        self.max_delay_ms = max_delay_ms
+        self._watcher = None   # QFileSystemWatcher создается при первой наблюдаемой команде
+        self._owners = {}      # Путь -> ID команд, чьи источники его содержат
+        self._pending = set()  # ID команд, ждущих обновления
+        self._pending_since = None
+        self._timer = None
+
+    def refresh(self):
+        """Перестраивает список наблюдаемых путей по командам с watch_source."""
+        # Без цикла событий Qt сигналы наблюдателя не придут
+        if QCoreApplication.instance() is None: return
+        dirs, files = {}, {}
+        for command in self._watched_commands():
+            for root, recursive in self._source_roots(command):
+                self._scan(root, recursive, command.id, dirs, files)
+        # Папки важнее файлов: событие папки ловит создание, удаление и атомарное сохранение
+        owners = dict(list(dirs.items())[:WATCH_MAX_PATHS])
+        for path, command_ids in files.items():
+            if len(owners) >= WATCH_MAX_PATHS: break
+            owners[path] = command_ids
+        if len(dirs) + len(files) > WATCH_MAX_PATHS:
+            logging.warning(f"Слежение за источниками: путей {len(dirs) + len(files)}, "
+                            f"наблюдаются первые {WATCH_MAX_PATHS}")
+        self._watch(owners)
+
+    def refresh_command(self, command_id):
+        """Пересканирует источники одной команды; пути остальных команд не перечитываются."""
+        if QCoreApplication.instance() is None: return
+        owners = {}
+        for path, command_ids in self._owners.items():
+            command_ids = command_ids - {command_id}
+            if command_ids: owners[path] = command_ids
+        command = self._manager.find_by_id(command_id)
+        if command is not None and command.get('watch_source') and command.get('source_folders'):
+            dirs, files = {}, {}
+            for root, recursive in self._source_roots(command):
+                self._scan(root, recursive, command_id, dirs, files)
+            skipped = 0
+            for path, command_ids in itertools.chain(dirs.items(), files.items()): # Папки важнее файлов
+                if path in owners: owners[path] = owners[path] | command_ids
+                elif len(owners) < WATCH_MAX_PATHS: owners[path] = command_ids
+                else: skipped += 1
+            if skipped:
+                logging.warning(f"Слежение за источниками: достигнут предел {WATCH_MAX_PATHS} путей, "
+                                f"не наблюдаются {skipped}")
+        self._watch(owners)
+
+    def _watch(self, owners):
+        """Приводит наблюдаемые пути QFileSystemWatcher к owners: {путь: множество ID команд}."""
+        if owners and self._watcher is None:
+            self._watcher = QFileSystemWatcher()
+            self._watcher.directoryChanged.connect(self._on_path_changed)
+            self._watcher.fileChanged.connect(self._on_path_changed)
+        if self._watcher is not None:
+            watched = set(self._watcher.directories()) | set(self._watcher.files())
+            stale = watched - owners.keys()
+            if stale: self._watcher.removePaths(list(stale))
+            new = [path for path in owners if path not in watched]
+            if new: self._watcher.addPaths(new)
+        self._owners = owners
+
+    def stop(self):
+        """Прекращает слежение (перед заменой папки данных и при закрытии)."""
+        if self._timer is not None: self._timer.stop()
+        self._pending.clear()
+        self._owners = {}
+        if self._watcher is not None:
+            paths = self._watcher.directories() + self._watcher.files()
+            if paths: self._watcher.removePaths(paths)
+
+    def _watched_commands(self):
+        for commands in self._manager.useful_commands.values():
+            for command in commands:
+                if command.get('watch_source') and command.get('source_folders'):
+                    yield command
+
+    @staticmethod
+    def _source_roots(command):
+        """Наблюдаемые корни: (путь, рекурсивно). У папки .py копируются только корень и выбранные подпапки."""
+        sources = command.get('source_folders') or {}
+        if sources.get('ino_folder'):
+            yield sources['ino_folder'], True
+        if sources.get('py_folder'):
+            yield sources['py_folder'], False
+            for name in sources.get('additional_folders') or []:
+                yield os.path.join(sources['py_folder'], name), True
+
+    @staticmethod
+    def _scan(root, recursive, command_id, dirs, files):
+        """Добавляет папки и файлы источника в dirs/files: {путь: множество ID команд}."""
+        stack = [os.path.abspath(root)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    dirs.setdefault(current, set()).add(command_id)
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive and entry.name not in EXCLUDED_DIRS: stack.append(entry.path)
+                        elif entry.is_file():
+                            files.setdefault(entry.path, set()).add(command_id)
+            except OSError:
+                continue # Источник удален или недоступен - наблюдать нечего
+
+    def _on_path_changed(self, path):
+        """Событие файловой системы: команда ставится в очередь, таймер откладывает обновление."""
+        command_ids = self._owners.get(path)
+        if not command_ids: return
+        if not self._pending: self._pending_since = time.monotonic()
+        self._pending.update(command_ids)
+        self._schedule(self.delay_ms)
+
+    def _schedule(self, delay_ms):
+        if self._timer is None:
+            self._timer = QTimer(self)
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self._on_timeout)
+        # Перезапуск таймера продлевает паузу, но не дольше max_delay_ms
+        elapsed_ms = (time.monotonic() - self._pending_since) * 1000
+        self._timer.start(min(delay_ms, max(0, int(self.max_delay_ms - elapsed_ms))))
+
+    def _on_timeout(self):
+        """Одно фоновое обновление на каждую команду с накопленными изменениями."""
+        busy = set()
+        for command_id in self._pending:
+            command = self._manager.find_by_id(command_id)
+            if command is None or not command.get('watch_source'): continue
+            if command_id in self._manager._attachment_jobs:
+                busy.add(command_id) # Идет прикрепление - обновим после него
+                continue
+            job = self._manager.start_attachment_import(command_id, sync=True, **command.get('source_folders'))
+            if job is None: continue
+            job.finished.connect(lambda success, copied, job=job: self._on_synced(job))
+            job.start()
+        self._pending = busy
+        if busy:
+            self._pending_since = time.monotonic()
+            self._schedule(self.delay_ms)
+
+    def _on_synced(self, job):
+        """Обновление завершено: новые файлы и папки источника этой команды тоже нужно наблюдать."""
+        report = job.sync_report if job.success else None
+        if report is not None:
+            logging.info(f"Вложения команды {job.command_id} обновлены из источника: "
+                         f"+{len(report['added'])} ~{len(report['updated'])} -{len(report['removed'])}")
+        self.refresh_command(job.command_id)
+        self.synced.emit(job.command_id, report)
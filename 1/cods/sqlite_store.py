@@ -0,0 +1,401 @@
+# zadachi/cods/sqlite_store.py
+
+import itertools
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+from .constants import PRIORITY_LEVELS, CURRENT_VERSION
+from .json_utils import _load_json
+from .shard_store import command_part
+
+# Поля задачи/команды, хранящиеся отдельными столбцами (остальные - в JSON-столбце extra)
+TASK_COLUMNS = ('name', 'status', 'priority', 'description', 'created_time', 'started_time', 'completed_time')
+SUBTASK_COLUMNS = ('name', 'completed')
+COMMAND_COLUMNS = ('name', 'description', 'subfolder')
+COMMAND_PATH_KEYS = ('ino_paths', 'py_paths', 'pdf_paths', 'img_paths')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    list TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT, status TEXT, priority TEXT, description TEXT,
+    created_time TEXT, started_time TEXT, completed_time TEXT,
+    priority_rank INTEGER NOT NULL DEFAULT 99,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS subtasks (
+    task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT, completed INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS command_folders (
+    folder_key TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    folder_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT, description TEXT, subfolder TEXT,
+    ino_paths TEXT, py_paths TEXT, pdf_paths TEXT, img_paths TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_list_position ON tasks(list, position);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks(list, priority_rank, position);
+CREATE INDEX IF NOT EXISTS idx_tasks_created_time ON tasks(list, created_time);
+CREATE INDEX IF NOT EXISTS idx_subtasks_task ON subtasks(task_id, position);
+CREATE INDEX IF NOT EXISTS idx_commands_folder ON commands(folder_key, position);
+"""
+
+_SCALAR_TYPES = (str, int, float, type(None))
+
+
+def _split_fields(item, columns, skip=()):
+    """Делит словарь на значения столбцов и JSON с остальными полями."""
+    values = []
+    extra = {}
+    for column in columns:
+        value = item.get(column)
+        if isinstance(value, _SCALAR_TYPES):
+            values.append(value)
+        else:
+            values.append(None)
+            extra[column] = value # Нестандартный тип сохраняем без потерь
+    for key, value in item.items():
+        if key not in columns and key not in skip:
+            extra[key] = value
+    return values, (json.dumps(extra, ensure_ascii=False) if extra else None)
+
+
+def _as_record(item):
+    """Запись старого формата (строка) приводит к словарю; прочие типы - None."""
+    if isinstance(item, Mapping): return item # Словарь или запись Task/Command
+    if isinstance(item, str): return {'name': item}
+    return None
+
+
+def _merge_fields(columns, values, extra_json):
+    """Собирает словарь из значений столбцов и JSON с остальными полями."""
+    item = dict(zip(columns, values))
+    if extra_json:
+        item.update(json.loads(extra_json))
+    return item
+
+
+def _record_uid(value):
+    """Постоянный ID записи (строка) или None."""
+    return value if isinstance(value, str) and value else None
+
+
+def _stored_uid(row_id, extra_json):
+    """Ключ строки из базы: ID записи из extra, иначе id строки (такая строка заменяется при записи)."""
+    uid = _record_uid(json.loads(extra_json).get('id')) if extra_json else None
+    return uid if uid is not None else ('row', row_id)
+
+
+_placeholders = lambda count: ", ".join("?" * count)
+_TASK_INSERT = ("INSERT INTO tasks (id, list, position, " + ", ".join(TASK_COLUMNS) + ", priority_rank, extra) "
+                "VALUES (" + _placeholders(len(TASK_COLUMNS) + 5) + ")")
+_TASK_UPDATE = ("UPDATE tasks SET list = ?, position = ?, " + ", ".join(f"{c} = ?" for c in TASK_COLUMNS) +
+                ", priority_rank = ?, extra = ? WHERE id = ?")
+_SUBTASK_INSERT = "INSERT INTO subtasks (task_id, position, name, completed, extra) VALUES (?, ?, ?, ?, ?)"
+_COMMAND_INSERT = ("INSERT INTO commands (id, folder_key, position, " + ", ".join(COMMAND_COLUMNS + COMMAND_PATH_KEYS) +
+                   ", extra) VALUES (" + _placeholders(len(COMMAND_COLUMNS) + len(COMMAND_PATH_KEYS) + 4) + ")")
+_COMMAND_UPDATE = ("UPDATE commands SET folder_key = ?, position = ?, " +
+                   ", ".join(f"{c} = ?" for c in COMMAND_COLUMNS + COMMAND_PATH_KEYS) + ", extra = ? WHERE id = ?")
+
+
+class SqliteTaskStore:
+    """Хранилище задач и команд в SQLite с индексами для сортировки и поиска; запись - построчная."""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = None
+        # Строки последней записи по спискам и папкам: запись сравнивает с ними и меняет только разницу
+        self._written = {}
+
+    # --- Соединение ---
+
+    def _connection(self):
+        """Открывает соединение и создает схему при первом обращении."""
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            # Регистронезависимый поиск с кириллицей (встроенный lower() понимает только ASCII)
+            conn.create_function("casefold", 1, lambda s: s.casefold() if isinstance(s, str) else '',
+                                 deterministic=True)
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Закрывает соединение (перед заменой папки данных при импорте)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._written.clear() # Базу могут заменить (импорт)
+
+    def _get_meta(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def has_data(self):
+        """Были ли данные записаны в базу (миграция или сохранение)."""
+        if not self.db_path.is_file():
+            return False
+        with self._lock:
+            return self._get_meta(self._connection(), 'version') is not None
+
+    # --- Чтение/запись в формате tasks.json ---
+
+    def _read_task_list(self, conn, list_name):
+        """Читает один список задач вместе с подзадачами."""
+        subtasks_by_task = {}
+        for row in conn.execute("SELECT s.task_id, s.name, s.completed, s.extra FROM subtasks s "
+                                "JOIN tasks t ON t.id = s.task_id WHERE t.list = ? "
+                                "ORDER BY s.task_id, s.position", (list_name,)):
+            subtask = _merge_fields(SUBTASK_COLUMNS, row[1:3], row[3])
+            subtask['completed'] = bool(subtask.get('completed'))
+            subtasks_by_task.setdefault(row[0], []).append(subtask)
+
+        tasks = []
+        task_select = ("SELECT id, " + ", ".join(TASK_COLUMNS) + ", extra FROM tasks "
+                       "WHERE list = ? ORDER BY position")
+        for row in conn.execute(task_select, (list_name,)):
+            task = _merge_fields(TASK_COLUMNS, row[1:-1], row[-1])
+            task['subtasks'] = subtasks_by_task.get(row[0], [])
+            tasks.append(task)
+        return tasks
+
+    def read(self, include_completed=True):
+        """Читает данные в формате словаря tasks.json (выполненные - по запросу)."""
+        with self._lock:
+            conn = self._connection()
+            data = {
+                'version': self._get_meta(conn, 'version', '0.0'),
+                'journal_seq': int(self._get_meta(conn, 'journal_seq', 0)),
+                'schema': int(self._get_meta(conn, 'schema', 0)),
+                'pending': self._read_task_list(conn, 'pending'),
+                'useful_commands': {},
+            }
+            if include_completed:
+                data['completed'] = self._read_task_list(conn, 'completed')
+
+            for (folder_key,) in conn.execute("SELECT folder_key FROM command_folders ORDER BY position"):
+                data['useful_commands'][folder_key] = []
+            command_select = ("SELECT folder_key, " + ", ".join(COMMAND_COLUMNS + COMMAND_PATH_KEYS) +
+                              ", extra FROM commands ORDER BY folder_key, position")
+            for row in conn.execute(command_select):
+                command = _merge_fields(COMMAND_COLUMNS, row[1:1 + len(COMMAND_COLUMNS)], row[-1])
+                for key, raw_paths in zip(COMMAND_PATH_KEYS, row[1 + len(COMMAND_COLUMNS):-1]):
+                    command[key] = json.loads(raw_paths) if raw_paths else []
+                data['useful_commands'].setdefault(row[0], []).append(command)
+            return data
+
+    def read_completed(self):
+        """Читает только выполненные задачи."""
+        with self._lock:
+            return self._read_task_list(self._connection(), 'completed')
+
+    def write(self, data, parts=None):
+        """Записывает данные (формат tasks.json) одной транзакцией, меняя только изменившиеся строки.
+
+        Список задач, отсутствующий в data (не загружался), остается в базе как есть; папки команд
+        вне parts (если parts задан) не сравниваются.
+        """
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn: # Одна транзакция: либо все, либо ничего
+                    written = self._write_changes(conn, data, parts)
+                    conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                        ('version', data.get('version', CURRENT_VERSION)),
+                        ('journal_seq', str(data.get('journal_seq', 0))),
+                        ('schema', str(data.get('schema', 0))),
+                    ])
+            except Exception:
+                self._written.clear() # Транзакция откатилась: строки перечитаются из базы
+                raise
+            self._written.update(written)
+        return True
+
+    def _write_changes(self, conn, data, parts):
+        """Сравнивает данные со строками последней записи и пишет разницу; новые строки для self._written."""
+        priority_rank = {level: i for i, level in enumerate(PRIORITY_LEVELS)}
+        written = {}
+        task_ids = itertools.count(conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0] + 1)
+        for list_name in ('pending', 'completed'):
+            if list_name not in data: continue
+            old_rows = self._task_rows(conn, list_name)
+            new_rows = {}
+            for position, task in enumerate(task for task in map(_as_record, data[list_name]) if task is not None):
+                values, extra = _split_fields(task, TASK_COLUMNS, skip=('subtasks',))
+                row = (list_name, position, *values, priority_rank.get(task.get('priority'), 99), extra)
+                subtasks = task.get('subtasks') if isinstance(task.get('subtasks'), list) else []
+                subtask_rows = tuple((sub_position, *sub_values, sub_extra) for sub_position, (sub_values, sub_extra)
+                                     in enumerate(_split_fields(subtask, SUBTASK_COLUMNS)
+                                                  for subtask in map(_as_record, subtasks) if subtask is not None))
+                uid = _record_uid(task.get('id'))
+                old = old_rows.pop(uid, None) if uid is not None and uid not in new_rows else None
+                if old is None:
+                    task_id = next(task_ids)
+                    conn.execute(_TASK_INSERT, (task_id, *row))
+                    conn.executemany(_SUBTASK_INSERT, [(task_id, *sub_row) for sub_row in subtask_rows])
+                else:
+                    task_id = old[0]
+                    if old[1] != row: conn.execute(_TASK_UPDATE, (*row, task_id))
+                    if old[2] != subtask_rows:
+                        conn.execute("DELETE FROM subtasks WHERE task_id = ?", (task_id,))
+                        conn.executemany(_SUBTASK_INSERT, [(task_id, *sub_row) for sub_row in subtask_rows])
+                new_rows[uid if uid is not None and uid not in new_rows else ('row', task_id)] = \
+                    (task_id, row, subtask_rows)
+            removed = [(old[0],) for old in old_rows.values()] # Удаленные и перенесенные в другой список
+            conn.executemany("DELETE FROM subtasks WHERE task_id = ?", removed)
+            conn.executemany("DELETE FROM tasks WHERE id = ?", removed)
+            written[('tasks', list_name)] = new_rows
+
+        commands_by_folder = data.get('useful_commands', {})
+        if not isinstance(commands_by_folder, dict): commands_by_folder = {}
+        old_folders = self._folder_rows(conn)
+        new_folders = {folder_key: position for position, folder_key in enumerate(commands_by_folder)}
+        for folder_key in old_folders.keys() - new_folders.keys():
+            conn.execute("DELETE FROM commands WHERE folder_key = ?", (folder_key,))
+            conn.execute("DELETE FROM command_folders WHERE folder_key = ?", (folder_key,))
+            written[('commands', folder_key)] = {}
+        conn.executemany("INSERT INTO command_folders (folder_key, position) VALUES (?, ?) "
+                         "ON CONFLICT(folder_key) DO UPDATE SET position = excluded.position",
+                         [item for item in new_folders.items() if old_folders.get(item[0]) != item[1]])
+        written['folders'] = new_folders
+
+        command_ids = itertools.count(conn.execute("SELECT COALESCE(MAX(id), 0) FROM commands").fetchone()[0] + 1)
+        for folder_key, commands in commands_by_folder.items():
+            if parts is not None and command_part(folder_key) not in parts and folder_key in old_folders: continue
+            old_rows = self._command_rows(conn, folder_key)
+            new_rows = {}
+            commands = commands if isinstance(commands, list) else []
+            for position, command in enumerate(command for command in map(_as_record, commands) if command is not None):
+                values, extra = _split_fields(command, COMMAND_COLUMNS, skip=COMMAND_PATH_KEYS)
+                paths = [json.dumps(command.get(key) or [], ensure_ascii=False) for key in COMMAND_PATH_KEYS]
+                row = (folder_key, position, *values, *paths, extra)
+                uid = _record_uid(command.get('id'))
+                old = old_rows.pop(uid, None) if uid is not None and uid not in new_rows else None
+                if old is None:
+                    command_id = next(command_ids)
+                    conn.execute(_COMMAND_INSERT, (command_id, *row))
+                else:
+                    command_id = old[0]
+                    if old[1] != row: conn.execute(_COMMAND_UPDATE, (*row, command_id))
+                new_rows[uid if uid is not None and uid not in new_rows else ('row', command_id)] = (command_id, row)
+            conn.executemany("DELETE FROM commands WHERE id = ?", [(old[0],) for old in old_rows.values()])
+            written[('commands', folder_key)] = new_rows
+        return written
+
+    # --- Строки последней записи (с ними сравнивается следующая запись) ---
+
+    def _task_rows(self, conn, list_name):
+        """{ID записи: (id строки, строка, строки подзадач)} списка задач; из базы - при первом обращении."""
+        key = ('tasks', list_name)
+        if key not in self._written:
+            subtasks = {}
+            for row in conn.execute("SELECT s.task_id, s.position, s.name, s.completed, s.extra FROM subtasks s "
+                                    "JOIN tasks t ON t.id = s.task_id WHERE t.list = ? "
+                                    "ORDER BY s.task_id, s.position", (list_name,)):
+                subtasks.setdefault(row[0], []).append(row[1:])
+            rows = {}
+            for row in conn.execute("SELECT id, list, position, " + ", ".join(TASK_COLUMNS) +
+                                    ", priority_rank, extra FROM tasks WHERE list = ?", (list_name,)):
+                rows[_stored_uid(row[0], row[-1])] = (row[0], row[1:], tuple(subtasks.get(row[0], ())))
+            self._written[key] = rows
+        return dict(self._written[key]) # Копия: при откате транзакции сохраненные строки не испорчены
+
+    def _command_rows(self, conn, folder_key):
+        """{ID записи: (id строки, строка)} папки команд; из базы - при первом обращении."""
+        key = ('commands', folder_key)
+        if key not in self._written:
+            self._written[key] = {
+                _stored_uid(row[0], row[-1]): (row[0], row[1:])
+                for row in conn.execute("SELECT id, folder_key, position, " +
+                                        ", ".join(COMMAND_COLUMNS + COMMAND_PATH_KEYS) +
+                                        ", extra FROM commands WHERE folder_key = ?", (folder_key,))}
+        return dict(self._written[key])
+
+    def _folder_rows(self, conn):
+        """{ключ папки команд: позиция}; из базы - при первом обращении."""
+        if 'folders' not in self._written:
+            self._written['folders'] = dict(conn.execute("SELECT folder_key, position FROM command_folders"))
+        return self._written['folders']
+
+    # --- Миграция и экспорт ---
+
+    def migrate_from_json(self, json_path):
+        """Однократный перенос данных из tasks.json в базу."""
+        json_path = Path(json_path)
+        if not json_path.is_file():
+            return False
+        data = _load_json(json_path, default={})
+        if not isinstance(data, dict):
+            return False
+        if isinstance(data.get('useful_commands'), list):
+            data['useful_commands'] = {'root': data['useful_commands']} # Старый формат - список команд
+        data.pop('schema', None) # Чужой файл сначала проходит полную нормализацию
+        return self.write(data)
+
+    # --- Индексные запросы ---
+
+    def task_positions(self, list_name, order_by='name'):
+        """Позиции задач списка в порядке сортировки."""
+        order_clause = {
+            'name': "casefold(name), position",
+            'created_time': "created_time DESC, position", # Новые вверху
+            'priority': "priority_rank, position",         # Высокий вверху
+        }.get(order_by, "position")
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT position FROM tasks WHERE list = ? ORDER BY {order_clause}", (list_name,))
+            return [row[0] for row in rows]
+
+    def search_task_positions(self, list_name, text):
+        """Позиции задач, в имени или описании которых встречается text."""
+        needle = text.casefold()
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT position FROM tasks WHERE list = ? AND "
+                "(instr(casefold(name), ?) > 0 OR instr(casefold(description), ?) > 0) ORDER BY position",
+                (list_name, needle, needle))
+            return [row[0] for row in rows]
+
+    def count_tasks_by_status(self):
+        """Количество задач по статусам."""
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+            return dict(rows.fetchall())
+
+    def child_folder_keys(self, folder_key):
+        """Ключи прямых подпапок логической папки команд (диапазонный запрос по индексу)."""
+        with self._lock:
+            conn = self._connection()
+            if folder_key == 'root':
+                rows = conn.execute("SELECT folder_key FROM command_folders "
+                                    "WHERE folder_key != 'root' AND instr(folder_key, '/') = 0")
+            else:
+                prefix = folder_key + '/'
+                # '0' - следующий символ после '/', диапазон [prefix, prefix_end) использует индекс
+                rows = conn.execute("SELECT folder_key FROM command_folders "
+                                    "WHERE folder_key >= ? AND folder_key < ? AND instr(substr(folder_key, ?), '/') = 0",
+                                    (prefix, folder_key + '0', len(prefix) + 1))
+            return [row[0] for row in rows]
@@ -0,0 +1,149 @@
+# zadachi/cods/tar_archive.py
+"""Архивы tar с потоковым сжатием (zstd или gzip): пишутся и читаются последовательно, без каталога в конце.
+
+Поэтому распаковка начинается, пока архив еще скачивается (StreamingTarExtractor). Zstandard -
+необязательная зависимость: без нее новые архивы пишутся в tar.gz, а tar.zst не распаковываются.
+"""
+import gzip
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from pathlib import Path, PurePosixPath
+
+from .constants import LINKS_MANIFEST_NAME, COPY_CHUNK_BYTES
+from .blob_store import dedup_archive_members
+
+# Быстрое многопоточное сжатие (необязательная зависимость), иначе - gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZIP_MAGICS = (b'PK\x03\x04', b'PK\x05\x06')
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+# Фильтр 'data' (Python 3.12, 3.11.4+): без абсолютных путей, выхода из папки, устройств и опасных прав
+_DATA_FILTER = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else None
+
+
+def resolve_archive_format(archive_format):
+    """Формат, которым архив будет записан: tar.zst без пакета zstandard заменяется на tar.gz."""
+    if archive_format == 'tar.zst' and zstandard is None: return 'tar.gz'
+    return archive_format
+
+
+def detect_archive_format(path):
+    """Формат архива по первым байтам: 'zip', 'tar.zst', 'tar.gz' или None."""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith(ZIP_MAGICS): return 'zip'
+    if head == ZSTD_MAGIC: return 'tar.zst'
+    if head.startswith(GZIP_MAGIC): return 'tar.gz'
+    return None
+
+
+def _zstd_level(level):
+    """Уровень zlib (0-9) -> уровень zstd: 6 (обычное) -> 3 (по умолчанию у zstd), 9 -> 19."""
+    return {0: 1, 1: 1, 9: 19}.get(level, max(1, level // 2))
+
+
+def write_tar_archive(archive_path, members, level, archive_format, extra_files=None):
+    """Пишет члены [(путь, имя в архиве)] и служебные файлы {имя: данные} в tar.zst или tar.gz.
+
+    Жесткие ссылки на один блоб пакуются один раз (манифест ссылок - как в ZIP).
+    """
+    archive_path = Path(archive_path)
+    members, links = dedup_archive_members(members)
+    extra_files = dict(extra_files or {})
+    if links: extra_files[LINKS_MANIFEST_NAME] = json.dumps(links, ensure_ascii=False, indent=1)
+    try:
+        with open(archive_path, 'wb') as raw:
+            if archive_format == 'tar.zst':
+                # threads=-1: сжатие во всех ядрах
+                stream = zstandard.ZstdCompressor(level=_zstd_level(level), threads=-1).stream_writer(raw, closefd=False)
+            else:
+                stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=level)
+            # dereference: ссылки на файлы пакуются содержимым (как в ZIP)
+            with stream, tarfile.open(fileobj=stream, mode='w|', format=tarfile.PAX_FORMAT, dereference=True) as tar:
+                for path, arcname in members:
+                    arcname = arcname if isinstance(arcname, str) else arcname.as_posix()
+                    tar.add(path, arcname=arcname, recursive=False)
+                for name, data in extra_files.items():
+                    if isinstance(data, str): data = data.encode('utf-8')
+                    info = tarfile.TarInfo(name)
+                    info.size, info.mtime, info.mode = len(data), int(time.time()), 0o600
+                    tar.addfile(info, io.BytesIO(data))
+    except BaseException:
+        archive_path.unlink(missing_ok=True)
+        raise
+
+
+def _safe_members(tar):
+    """Для Python без фильтра 'data': только обычные файлы и папки внутри папки назначения."""
+    for member in tar:
+        path = PurePosixPath(member.name)
+        if path.is_absolute() or '..' in path.parts or not (member.isfile() or member.isdir()): continue
+        member.mode = 0o755 if member.isdir() else 0o644
+        yield member
+
+
+def extract_tar_stream(fileobj, target_folder, archive_format):
+    """Распаковывает tar.zst/tar.gz из потока (читается один раз, по порядку) в target_folder."""
+    if archive_format == 'tar.zst':
+        if zstandard is None:
+            raise RuntimeError("Для распаковки архива .tar.zst нужен пакет zstandard (pip install zstandard)")
+        stream = zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+    else:
+        stream = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    with stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+        if _DATA_FILTER is not None: tar.extractall(target_folder, **_DATA_FILTER)
+        else: tar.extractall(target_folder, members=_safe_members(tar))
+        # tar молча останавливается на испорченном заголовке: поток дочитывается до конца,
+        # чтобы gzip/zstd проверили контрольную сумму и повреждение стало ошибкой
+        while stream.read(COPY_CHUNK_BYTES): pass
+
+
+class StreamingTarExtractor:
+    """Файлоподобный приемник: записанные байты архива распаковываются в фоновом потоке сразу.
+
+    Между загрузкой и распаковкой - канал ОС: его буфер ограничивает память, а запись ждет распаковку.
+    """
+
+    def __init__(self, target_folder, archive_format):
+        read_fd, write_fd = os.pipe()
+        self._reader = os.fdopen(read_fd, 'rb')
+        self._writer = os.fdopen(write_fd, 'wb')
+        self._error = None
+        self._thread = threading.Thread(target=self._extract, args=(target_folder, archive_format),
+                                        name="TarExtractor", daemon=True)
+        self._thread.start()
+
+    def _extract(self, target_folder, archive_format):
+        try:
+            extract_tar_stream(self._reader, target_folder, archive_format)
+            # Хвост после конца tar (выравнивание) дочитывается, иначе запись в канал зависнет
+            while self._reader.read(COPY_CHUNK_BYTES): pass
+        except BaseException as e: # Передается в close() потока загрузки
+            self._error = e
+        finally:
+            self._reader.close() # Запись в канал после ошибки сразу завершится BrokenPipeError
+
+    def write(self, data):
+        try:
+            return self._writer.write(data)
+        except OSError: # BrokenPipeError (в Windows - EINVAL)
+            # Распаковка прервалась - причина важнее ошибки канала
+            self._thread.join()
+            raise self._error or BrokenPipeError("Распаковка архива прервана")
+
+    def close(self):
+        """Завершает поток байтов и ждет распаковку; ошибка распаковки поднимается здесь."""
+        try:
+            self._writer.close()
+        except OSError:
+            pass # Распаковка уже завершилась ошибкой - она и поднимается ниже
+        self._thread.join()
+        if self._error is not None: raise self._error
@@ -1,19 +1,45 @@
 # zadachi/cods/task_manager.py
 
+import atexit
+import logging
 import os
+from collections.abc import Mapping
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional, List, Tuple
 
 # Импортируем необходимые константы
 from .constants import (
-    SETTINGS_FOLDER, SETTINGS_FILE, CURRENT_VERSION,
-    DEFAULT_TASK_FIELDS, DEFAULT_COMMAND_FIELDS
+    SETTINGS_FOLDER, SETTINGS_FILE, CURRENT_VERSION, SCHEMA_VERSION,
+    DEFAULT_TASK_FIELDS, DEFAULT_COMMAND_FIELDS,
+    JOURNAL_SUFFIX, FINGERPRINT_SUFFIX, JOURNAL_COMPACT_BYTES, STORAGE_BACKENDS, SQLITE_DB_NAME,
+    SHARDS_FOLDER_NAME, PENDING_PART, COMPLETED_PART, BLOBS_FOLDER_NAME,
+    TRASH_FOLDER_NAME, TRASH_RETENTION_HOURS, ARCHIVE_COMPRESSION_LEVEL, SAVE_DEBOUNCE_MS,
+    SAVE_RETRY_LIMIT, SAVE_RETRY_MAX_MS
 )
 # Импортируем утилиты JSON
-from .json_utils import _load_json, _save_json
+from .json_utils import (_load_json, _save_json, _load_json_fingerprinted, _save_json_fingerprinted,
+                         _encode_json, _decode_json, set_json_compact, RawJSON)
 # Импортируем утилиты Файлов (только нужную здесь)
-from .file_utils import check_file_exists
+from .file_utils import check_file_exists, set_blob_store
+from .copy_strategies import set_copy_strategy
+from .archive_writer import set_archive_level, set_archive_format
+from .source_watcher import SourceWatcher
+from .trash import Trash
+# Хранилище вложений по хешу
+from .blob_store import BlobStore
+# Планировщик отложенной записи
+from .save_scheduler import SaveScheduler
+from .save_worker import SaveWorker
+# Журнал операций
+from .journal import TaskJournal, ChangeBatch
+# Хранилище SQLite
+from .sqlite_store import SqliteTaskStore
+# Раздельное хранение (шарды)
+from .shard_store import ShardedTaskStore, command_part
+# Компактные записи задач и команд
+from .records import Task, Command, tasks_from_json, commands_from_json, snapshot_records
 
 # Импортируем Миксины
 from .import_export_mixin import ImportExportMixin
@@ -21,9 +47,15 @@ from .command_mixin import CommandMixin
 from .task_mixin import TaskMixin
 
 # Импорты UI только для функции выбора папки
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QFileDialog, QMessageBox
 
 
+def load_app_settings():
+    """Читает settings.json (пустой словарь, если файла нет)."""
+    return _load_json(SETTINGS_FILE, default={})
+
+
 # --- Функция определения папки задач ---
 # (Остается здесь, т.к. она вызывается до создания TaskManager)
 def load_or_set_tasks_folder():
@@ -85,64 +117,507 @@ def load_or_set_tasks_folder():
 # --- Основной класс TaskManager ---
 class TaskManager(ImportExportMixin, CommandMixin, TaskMixin): # Наследование миксинов
 
-    def __init__(self, tasks_file):
+    def __init__(self, tasks_file, journal_mode=None, storage_backend=None):
         """Инициализация менеджера задач."""
         self.tasks_file = Path(tasks_file)
         self.tasks_folder = self.tasks_file.parent
         self.pending_tasks = []
-        self.completed_tasks = []
+        self.completed_tasks = [] # Через свойство: выполненные загружаются лениво
         self.useful_commands = {'root': []}
+        settings = load_app_settings()
+        # Формат файлов данных: компактный JSON заметно меньше и быстрее пишется
+        set_json_compact(settings.get('json_compact', False))
+        # Одинаковые вложения хранятся один раз (жесткие ссылки на .blobs)
+        self.blob_store = BlobStore(self.tasks_folder / BLOBS_FOLDER_NAME) \
+            if settings.get('dedupe_attachments', False) else None
+        set_blob_store(self.blob_store)
+        set_copy_strategy(settings.get('copy_strategy', 'auto'))
+        set_archive_level(settings.get('archive_compression_level', ARCHIVE_COMPRESSION_LEVEL))
+        set_archive_format(settings.get('archive_format', 'zip'))
+
+        # Хранилище: tasks.json (по умолчанию) или база SQLite рядом с ним
+        if storage_backend is None:
+            storage_backend = settings.get('storage_backend', 'json')
+        if storage_backend not in STORAGE_BACKENDS: storage_backend = 'json'
+        self.storage_backend = storage_backend
+        self._sqlite_store = SqliteTaskStore(self.tasks_folder / SQLITE_DB_NAME) if storage_backend == 'sqlite' else None
+        self._shard_store = ShardedTaskStore(self.tasks_folder / SHARDS_FOLDER_NAME) if storage_backend == 'sharded' else None
+
+        # Журнал: изменения дописываются в tasks.journal вместо перезаписи tasks.json
+        if journal_mode is None:
+            journal_mode = bool(settings.get('journal_mode', False))
+        # Журнал только поверх единого tasks.json: SQLite и шарды и так пишут не весь объем
+        self.journal_mode = journal_mode and storage_backend == 'json'
+        self.journal = TaskJournal(self.tasks_file.with_suffix(JOURNAL_SUFFIX))
+        self._journal_seq = 0 # Номер последней примененной записи журнала
+        self._batch = None # Открытая транзакция (ChangeBatch) или None
+        # Схема и отпечаток последнего снимка tasks.json: совпали - нормализация не нужна
+        self.fingerprint_file = self.tasks_file.with_suffix(FINGERPRINT_SUFFIX)
+        self._snapshot_fingerprint = None
+        self._snapshot_trusted = False
+        self.normalize_fixes = 0 # Сколько записей исправил нормализатор при последней загрузке
+        # Индекс ID -> положение записи; проверяется при каждом обращении, поэтому не сбрасывается
+        self._id_index = {}
+        self._attachment_jobs = {} # ID команды -> выполняющееся фоновое прикрепление
+        # Запись на диск идет в фоновом потоке; интерфейс узнает о результате по сигналам saved/failed
+        self.save_worker = SaveWorker()
+        self.save_worker.failed.connect(self._on_background_write_failed)
+        self.save_worker.saved.connect(self._on_background_write_saved)
+        # Отложенная запись: серии изменений склеиваются в одну запись файла
+        self._save_scheduler = SaveScheduler(self._write_tasks)
+        # Повтор неудавшейся фоновой записи - с растущей паузой, не чаще SAVE_RETRY_LIMIT раз подряд
+        self._write_failures = 0
+        self._retry_timer = QTimer()
+        self._retry_timer.setSingleShot(True)
+        self._retry_timer.timeout.connect(self._save_scheduler.flush)
+        atexit.register(self.flush) # Отложенные изменения не теряются при выходе
+        # Изменения исходных папок команд с watch_source переносятся во вложения
+        self.source_watcher = SourceWatcher(self)
+        # Удаленные команды и папки: восстановимы до срока хранения, место освобождает фоновый поток
+        self.trash = Trash(self.tasks_folder / TRASH_FOLDER_NAME, self.tasks_folder,
+                           settings.get('trash_retention_hours', TRASH_RETENTION_HOURS))
+        self.trash.purged.connect(lambda count: self.collect_unused_blobs())
+        if self.trash.root.is_dir(): self.trash.start() # Дочистка записей, оставшихся с прошлого запуска
         self.load_tasks() # Загрузка данных при старте
 
+    # --- Ленивая загрузка выполненных задач ---
+
+    @property
+    def completed_tasks(self):
+        """Выполненные задачи: загружаются и нормализуются при первом обращении."""
+        if not self._completed_loaded:
+            self._load_completed()
+        return self._completed_tasks
+
+    @completed_tasks.setter
+    def completed_tasks(self, tasks):
+        self._completed_tasks = tasks
+        self._completed_loaded = True
+        self._raw_completed = None
+
+    def is_completed_loaded(self):
+        """Загружены ли уже выполненные задачи."""
+        return self._completed_loaded
+
+    def _load_completed(self):
+        """Загружает выполненные задачи из хранилища (или из отложенных байтов списка tasks.json)."""
+        raw_completed = self._raw_completed
+        if isinstance(raw_completed, RawJSON):
+            raw_completed = _decode_json(raw_completed) # Список из tasks.json разбирается только сейчас
+        elif raw_completed is None:
+            # Прямой вызов без try-except
+            if self._shard_store is not None:
+                raw_completed = self._shard_store.read_completed()
+            elif self._sqlite_store is not None:
+                raw_completed = self._sqlite_store.read_completed()
+            else:
+                raw_completed = _load_json(self.tasks_file, default={}).get('completed', [])
+        if self._snapshot_trusted:
+            self.completed_tasks = tasks_from_json(raw_completed) # Записано этой версией - уже в нужном формате
+        else:
+            self.completed_tasks = self._normalize_task_list(raw_completed, is_completed=True)
+
+    def _completed_for_write(self):
+        """Выполненные задачи для записи; None - список не загружался и на диске актуален."""
+        if self._completed_loaded:
+            return self._completed_tasks
+        return self._raw_completed # Для tasks.json - неразобранные байты списка как есть
+
     # --- Базовые методы Load/Save/Normalize/Migrate ---
 
     def load_tasks(self):
         """Загружает и нормализует данные из JSON файла."""
         default_data = {'version': '0.0', 'pending': [], 'completed': [], 'useful_commands': {'root': []}}
-        # Прямой вызов _load_json без try-except
-        data = _load_json(self.tasks_file, default=default_data)
-
-        file_version = data.get('version', '0.0')
+        self.save_worker.wait() # Чтение не должно обогнать еще не выполненные фоновые записи
+        # Прямой вызов без try-except
+        data = self._read_data(default_data)
+        self._snapshot_trusted = self._is_snapshot_trusted(data)
+
+        # Выполненные не нормализуются до первого обращения; SQLite и шарды их даже не читают
+        self._completed_tasks = []
+        self._completed_loaded = False
+        self._raw_completed = data.get('completed') if isinstance(data.get('completed'), (list, RawJSON)) else None
+        if self._raw_completed is None and self._sqlite_store is None and self._shard_store is None:
+            self._raw_completed = [] # В tasks.json списка нет - читать нечего
+
+        if self._snapshot_trusted:
+            # Быстрый путь: снимок записан этой схемой и не менялся - данные уже нормализованы
+            self.pending_tasks = tasks_from_json(data.get('pending', []))
+            self.useful_commands = commands_from_json(data.get('useful_commands', {'root': []}))
+        else:
+            self._normalize_loaded_data(data, persist=data is not default_data)
+        # Накат журнала поверх снимка
+        self._journal_seq = data.get('journal_seq', 0)
+        self._replay_journal()
+        self.source_watcher.refresh()
+
+    def _normalize_loaded_data(self, data, persist):
+        """Полная нормализация и миграция (старые или чужие файлы)."""
+        self.normalize_fixes = 0
         # Нормализация данных (внутренние методы)
         self.pending_tasks = self._normalize_task_list(data.get('pending', []), is_completed=False)
-        self.completed_tasks = self._normalize_task_list(data.get('completed', []), is_completed=True)
         loaded_commands_data = data.get('useful_commands', {'root': []})
         if isinstance(loaded_commands_data, list):
             self.useful_commands = {'root': self._normalize_commands(loaded_commands_data, 'root')}
+            self.normalize_fixes += 1
         elif isinstance(loaded_commands_data, dict):
             self.useful_commands = self._normalize_useful_commands(loaded_commands_data)
         else:
             self.useful_commands = {'root': []}
+            self.normalize_fixes += 1
         # Миграция данных (внутренний метод)
         self._migrate_paths()
-
-    def save_tasks(self):
-        """Сохраняет текущие данные в JSON файл."""
+        # Выполненные тоже приводятся сразу: снимок ниже пометится как нормализованный
+        self._load_completed()
+        logging.info(f"Нормализация данных: исправлено записей: {self.normalize_fixes}")
+
+        if persist:
+            # Новый снимок со схемой и отпечатком - следующий запуск пойдет быстрым путем
+            self.save_tasks()
+
+    def _is_snapshot_trusted(self, data):
+        """Записан ли снимок текущей схемой и не менялся ли он с тех пор."""
+        if data.get('schema') != SCHEMA_VERSION:
+            return False
+        if self._sqlite_store is not None or self._shard_store is not None:
+            return True # Базу и шарды пишет только приложение (миграция схему не переносит)
+        if self._snapshot_fingerprint is None:
+            return False
+        sidecar = _load_json(self.fingerprint_file, default={})
+        return (isinstance(sidecar, dict) and sidecar.get('schema') == SCHEMA_VERSION
+                and sidecar.get('fingerprint') == self._snapshot_fingerprint)
+
+    def save_tasks(self, parts=None):
+        """Отмечает данные (или части parts) измененными; запись выполнится после короткой паузы."""
+        return self._save_scheduler.mark_dirty(parts)
+
+    def mark_tasks_changed(self, is_completed=False):
+        """Сохраняет после прямого изменения задачи из UI (пишется только ее список)."""
+        return self.save_tasks(parts={COMPLETED_PART if is_completed else PENDING_PART})
+
+    def mark_commands_changed(self, folder_key):
+        """Сохраняет после прямого изменения команды из UI (пишется только ее папка)."""
+        return self.save_tasks(parts={command_part(folder_key)})
+
+    def flush(self):
+        """Немедленно записывает отложенные изменения и дожидается фоновых записей (закрытие, экспорт, выгрузка)."""
+        scheduled = self._save_scheduler.flush()
+        return self.save_worker.wait() and scheduled
+
+    def close(self):
+        """Записывает изменения и останавливает фоновые потоки (менеджер заменяется другим или закрывается)."""
+        ok = self.flush()
+        self._retry_timer.stop()
+        atexit.unregister(self.flush) # Иначе при выходе запись пошла бы в прежнюю папку
+        self.close_storage()
+        self.save_worker.stop()
+        self.trash.stop()
+        return ok
+
+    def _query_store(self):
+        """SQLite для индексных запросов, если база совпадает с памятью; иначе None - запрос по спискам."""
+        # Без ожидания записи: запрос не должен задерживать интерфейс (поиск идет на каждое нажатие клавиши)
+        if self._sqlite_store is None or self._save_scheduler.is_dirty or not self.save_worker.is_idle():
+            return None
+        return self._sqlite_store
+
+    def has_unsaved_changes(self):
+        """Есть ли изменения, еще не записанные на диск."""
+        return self._save_scheduler.is_dirty
+
+    def _write_tasks(self, parts=None):
+        """Снимает копию данных и передает ее на запись в фоновый поток (для шардов - только части parts)."""
+        # Копия снимается в потоке интерфейса: дальнейшие изменения записей не попадут в запись
         data_to_save = {
             'version': CURRENT_VERSION,
-            'pending': self.pending_tasks,
-            'completed': self.completed_tasks,
-            'useful_commands': self.useful_commands
+            'journal_seq': self._journal_seq,
+            'schema': SCHEMA_VERSION,
+            'useful_commands': {key: snapshot_records(commands) for key, commands in self.useful_commands.items()}
         }
-        # Прямой вызов _save_json без try-except
-        return _save_json(self.tasks_file, data_to_save)
+        # Единый tasks.json пишется целиком; шарды и SQLite пропускают списки, которых нет в данных
+        whole_file = self._shard_store is None and self._sqlite_store is None
+        if whole_file or parts is None or PENDING_PART in parts:
+            data_to_save['pending'] = snapshot_records(self.pending_tasks)
+        completed = self._completed_for_write()
+        if completed is not None and (whole_file or parts is None or COMPLETED_PART in parts):
+            # Иначе хранилище оставляет свой список; неразобранный список tasks.json пишется теми же байтами
+            data_to_save['completed'] = completed if isinstance(completed, RawJSON) else snapshot_records(completed)
+        return self.save_worker.submit(lambda: self._write_snapshot(data_to_save, parts), parts)
+
+    def _write_snapshot(self, data, parts):
+        """Записывает снимок в хранилище (выполняется в потоке записи)."""
+        # Прямой вызов без try-except
+        if not self._write_data(data, parts):
+            return False
+        # Снимок содержит все записи журнала - журнал больше не нужен
+        self.journal.reset()
+        return True
+
+    def _on_background_write_failed(self, parts, error):
+        """Фоновая запись не удалась: данные в памяти целы - повтор с растущей паузой, затем сообщение."""
+        self._save_scheduler.mark_pending(parts) # Части остаются неписанными до повтора или следующего изменения
+        self._write_failures += 1
+        if self._write_failures <= SAVE_RETRY_LIMIT:
+            delay_ms = min(SAVE_DEBOUNCE_MS * 2 ** self._write_failures, SAVE_RETRY_MAX_MS)
+            logging.warning(f"Фоновая запись не удалась ({error}), повтор через {delay_ms} мс")
+            self._retry_timer.start(delay_ms)
+            return
+        self._write_failures = 0 # Следующее изменение снова получит повторы
+        QMessageBox.critical(None, "Ошибка сохранения",
+                             f"Не удалось сохранить изменения после {SAVE_RETRY_LIMIT} повторов:\n{error}\n\n"
+                             f"Данные остаются в памяти; запись повторится при следующем изменении.")
+
+    def _on_background_write_saved(self, parts):
+        self._write_failures = 0 # Запись прошла - счетчик повторов сначала
+
+    # --- Хранилище ---
+
+    def _read_data(self, default_data):
+        """Читает данные из выбранного хранилища в формате tasks.json."""
+        if self._shard_store is not None:
+            if self._shard_store.has_data():
+                return self._shard_store.read(include_completed=False) # Шарды читаются параллельно
+            # Миграция единого tasks.json в раздельную раскладку
+            return self._shard_store.migrate_from_json(self.tasks_file) or default_data
+        if self._sqlite_store is None:
+            # Выполненные (последний ключ) не разбираются до первого обращения
+            data, self._snapshot_fingerprint = _load_json_fingerprinted(self.tasks_file, default=default_data,
+                                                                        defer_key='completed')
+            return data
+        if not self._sqlite_store.has_data():
+            # Однократная миграция существующего tasks.json в базу
+            self._sqlite_store.migrate_from_json(self.tasks_file)
+        return self._sqlite_store.read(include_completed=False) if self._sqlite_store.has_data() else default_data
+
+    def _write_data(self, data, parts=None):
+        """Записывает данные в выбранное хранилище."""
+        if self._shard_store is not None:
+            return self._shard_store.write(data, parts)
+        if self._sqlite_store is None:
+            fingerprint = _save_json_fingerprinted(self.tasks_file, data)
+            if fingerprint is None:
+                return False
+            # Отпечаток пишется после снимка: сбой между записями лишь включит полную нормализацию
+            return _save_json(self.fingerprint_file, {'schema': data.get('schema', 0), 'fingerprint': fingerprint})
+        return self._sqlite_store.write(data, parts)
+
+    def json_snapshot(self):
+        """Байты tasks.json (переносимый формат) для архива при SQLite и шардах; None - tasks.json и есть хранилище.
+
+        Снимок попадает только в архив: рядом с базой или шардами устаревшая копия выглядела бы как данные.
+        """
+        if self._sqlite_store is not None:
+            return _encode_json(self._sqlite_store.read())
+        if self._shard_store is not None:
+            return _encode_json({
+                'version': CURRENT_VERSION,
+                'pending': self.pending_tasks,
+                'completed': self.completed_tasks,
+                'useful_commands': self.useful_commands
+            })
+        return None # tasks.json и так актуален после flush()
+
+    def collect_unused_blobs(self):
+        """Удаляет блобы вложений, на которые больше не ссылается ни одна команда."""
+        if self.blob_store is None: return 0, 0
+        removed, freed = self.blob_store.collect() # Прямой вызов
+        if removed: logging.info(f"Удалено неиспользуемых блобов: {removed} ({freed} байт)")
+        return removed, freed
+
+    def detach_attachment(self, path):
+        """Перед открытием вложения для правки: файлы-ссылки на блобы становятся отдельными копиями."""
+        path = Path(path)
+        files = [path] if path.is_file() else [p for p in path.rglob('*') if p.is_file() and not p.is_symlink()]
+        detached = 0
+        for file_path in files:
+            try:
+                if BlobStore.detach(file_path): detached += 1
+            except OSError as e:
+                logging.warning(f"Не удалось отделить '{file_path}' от общего содержимого: {e}")
+        return detached
+
+    def close_storage(self):
+        """Освобождает файлы хранилища (перед заменой папки данных)."""
+        self.source_watcher.stop()
+        self.save_worker.wait()
+        if self._sqlite_store is not None:
+            self._sqlite_store.close()
+
+    # --- Журнал операций ---
+
+    def _record_change(self, op, parts=None, **fields):
+        """Фиксирует изменение: запись в журнал или (без журнала) отложенное сохранение частей parts."""
+        # Внутри транзакции изменение только копится - фиксация одна на всю транзакцию
+        if self._batch is not None:
+            self._batch.add(op, parts, fields)
+            return True
+
+        # Если есть незаписанные изменения вне журнала, запись в журнал легла бы
+        # поверх устаревшего снимка - сохраняем снимок целиком
+        if not self.journal_mode or self.has_unsaved_changes():
+            return self.save_tasks(parts)
+
+        self._journal_seq += 1
+        record = {'seq': self._journal_seq, 'op': op}
+        record.update(fields)
+        # Запись кодируется сразу (объекты в ней еще будут меняться), а дописывается в потоке записи
+        # в общей очереди со снимками - порядок журнала и снимков сохраняется
+        line = self.journal.encode(record)
+        # Потерянная запись журнала восполняется полным снимком (parts=None)
+        self.save_worker.submit(lambda: self.journal.append_line(line))
+
+        # Сжатие: журнал сворачивается в новый снимок при превышении порога
+        if self.journal.size() > JOURNAL_COMPACT_BYTES:
+            return self.save_tasks()
+        return True
+
+    @contextmanager
+    def transaction(self):
+        """Группирует изменения: одна запись журнала (или одно сохранение) на всю группу."""
+        if self._batch is not None: # Вложенная транзакция входит во внешнюю
+            yield self._batch
+            return
+        batch = self._batch = ChangeBatch()
+        try:
+            yield batch
+        finally:
+            # Фиксируем и при исключении: уже сделанные в памяти изменения не должны пропасть
+            self._batch = None
+            batch.ok = self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        """Фиксирует накопленные изменения транзакции."""
+        if not batch.records: return True
+        if len(batch.records) == 1:
+            op, fields = batch.records[0]
+            return self._record_change(op, parts=batch.parts, **fields)
+        records = [dict(fields, op=op) for op, fields in batch.records]
+        return self._record_change('batch', parts=batch.parts, records=records)
+
+    def compact_journal(self):
+        """Немедленно сворачивает журнал в новый снимок tasks.json."""
+        self.save_tasks()
+        return self.flush()
+
+    def _replay_journal(self):
+        """Применяет записи журнала, сделанные после последнего снимка."""
+        records = self.journal.read_records(after_seq=self._journal_seq)
+        for record in records:
+            replay_method = getattr(self, f"_replay_{record.get('op')}", None)
+            if replay_method is None: continue # Неизвестная операция (более новая версия)
+            replay_method(record)
+            self._journal_seq = record['seq']
+
+        # Без режима журнала (или при большом журнале) сразу сворачиваем его в снимок
+        if records and (not self.journal_mode or self.journal.size() > JOURNAL_COMPACT_BYTES):
+            self.save_tasks()
+
+    def _task_list(self, is_completed):
+        """Возвращает список выполненных или невыполненных задач."""
+        return self.completed_tasks if is_completed else self.pending_tasks
+
+    def _task_part(self, is_completed):
+        """Часть данных (шард) списка задач."""
+        return COMPLETED_PART if is_completed else PENDING_PART
+
+    # --- Индекс постоянных ID ---
+
+    def _rebuild_id_index(self):
+        """Перестраивает индекс ID -> положение по текущим спискам."""
+        index = {}
+        task_lists = [(False, self.pending_tasks)]
+        if self.is_completed_loaded(): # Индекс не должен сам загружать архив
+            task_lists.append((True, self.completed_tasks))
+        for is_completed, task_list in task_lists:
+            for pos, task in enumerate(task_list):
+                index[task.id] = ('task', is_completed, pos)
+                for sub_pos, subtask in enumerate(task.subtasks):
+                    index[subtask.id] = ('subtask', task.id, sub_pos)
+        for folder_key, commands in self.useful_commands.items():
+            for pos, command in enumerate(commands):
+                index[command.id] = ('command', folder_key, pos)
+        self._id_index = index
+
+    def _lookup_id(self, record_id):
+        """Положение записи по индексу, если оно еще верно (иначе None)."""
+        entry = self._id_index.get(record_id)
+        if entry is None: return None
+        kind, container, pos = entry
+        if kind == 'task':
+            records = self._task_list(container)
+        elif kind == 'subtask':
+            parent = self._lookup_id(container)
+            if parent is None: return None
+            records = self._task_list(parent[1])[parent[2]].subtasks
+        else:
+            records = self.useful_commands.get(container, [])
+        # Списки меняются по месту - устаревшую запись индекса видно по несовпадению ID
+        if pos < len(records) and records[pos].id == record_id:
+            return entry
+        return None
+
+    def _resolve_id(self, record_id):
+        """Положение записи с перестройкой индекса при промахе."""
+        if not record_id: return None
+        entry = self._lookup_id(record_id)
+        if entry is None:
+            self._rebuild_id_index()
+            entry = self._lookup_id(record_id)
+        if entry is None and not self.is_completed_loaded():
+            self._load_completed() # ID может принадлежать записи из архива выполненных
+            self._rebuild_id_index()
+            entry = self._lookup_id(record_id)
+        return entry
+
+    def find_by_id(self, record_id):
+        """Запись (Task, Subtask или Command) по ID или None."""
+        entry = self._resolve_id(record_id)
+        if entry is None: return None
+        kind, container, pos = entry
+        if kind == 'task':
+            return self._task_list(container)[pos]
+        if kind == 'subtask':
+            return self.find_by_id(container).subtasks[pos]
+        return self.useful_commands[container][pos]
+
+    def task_location(self, task_id):
+        """(is_completed, индекс) задачи по ID или None."""
+        entry = self._resolve_id(task_id)
+        if entry is None or entry[0] != 'task': return None
+        return entry[1], entry[2]
+
+    def subtask_location(self, subtask_id):
+        """(is_completed, индекс задачи, индекс подзадачи) по ID подзадачи или None."""
+        entry = self._resolve_id(subtask_id)
+        if entry is None or entry[0] != 'subtask': return None
+        parent = self.task_location(entry[1])
+        if parent is None: return None
+        return parent[0], parent[1], entry[2]
+
+    def command_location(self, command_id):
+        """(ключ папки, индекс) команды по ID или None."""
+        entry = self._resolve_id(command_id)
+        if entry is None or entry[0] != 'command': return None
+        return entry[1], entry[2]
 
     def _normalize_task_list(self, tasks_input, is_completed):
-        """Приводит список задач к стандартному формату."""
+        """Приводит список задач к стандартному формату (записи Task)."""
         normalized_list = []
         if not isinstance(tasks_input, list): return [] # Возвращаем пустой, если не список
 
         default_status = 'Выполнено' if is_completed else 'Не выполнено'
+        current_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S') # Один раз на всю загрузку
         for i, task_data in enumerate(tasks_input):
             normalized_task = {}
-            if isinstance(task_data, dict): normalized_task = task_data.copy()
+            if isinstance(task_data, Mapping): normalized_task = dict(task_data)
             elif isinstance(task_data, str): normalized_task = {'name': task_data}
-            else: continue # Пропускаем неверный формат
+            else:
+                self.normalize_fixes += 1
+                continue # Пропускаем неверный формат
 
             task_with_defaults = DEFAULT_TASK_FIELDS.copy()
             task_with_defaults.update(normalized_task)
             if 'status' not in normalized_task: task_with_defaults['status'] = default_status
-            current_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             task_with_defaults.setdefault('created_time', current_time_str)
             if is_completed and task_with_defaults['status'] == 'Выполнено':
                  task_with_defaults.setdefault('completed_time', current_time_str)
@@ -153,15 +628,16 @@ class TaskManager(ImportExportMixin, CommandMixin, TaskMixin): # Наследо
             else:
                 normalized_subtasks = []
                 for j, subtask_data in enumerate(subtasks_input):
-                    if isinstance(subtask_data, dict):
-                        subtask_copy = subtask_data.copy()
+                    if isinstance(subtask_data, Mapping):
+                        subtask_copy = dict(subtask_data)
                         subtask_copy.setdefault('name', f'Подзадача_{j}')
                         subtask_copy.setdefault('completed', False)
                         normalized_subtasks.append(subtask_copy)
                     elif isinstance(subtask_data, str):
                         normalized_subtasks.append({'name': subtask_data, 'completed': False})
                 task_with_defaults['subtasks'] = normalized_subtasks
-            normalized_list.append(task_with_defaults)
+            if task_with_defaults != task_data: self.normalize_fixes += 1
+            normalized_list.append(Task(task_with_defaults))
         return normalized_list
 
     def _normalize_useful_commands(self, useful_commands_dict):
@@ -175,20 +651,23 @@ class TaskManager(ImportExportMixin, CommandMixin, TaskMixin): # Наследо
         return normalized_dict
 
     def _normalize_commands(self, commands_list, folder_key='?'):
-        """Нормализует список команд в одной папке."""
+        """Нормализует список команд в одной папке (записи Command)."""
         if not isinstance(commands_list, list): return []
         normalized_list = []
         for i, cmd_data in enumerate(commands_list):
             normalized_cmd = {}
-            if isinstance(cmd_data, dict): normalized_cmd = cmd_data.copy()
+            if isinstance(cmd_data, Mapping): normalized_cmd = dict(cmd_data)
             elif isinstance(cmd_data, str): normalized_cmd = {'name': cmd_data}
-            else: continue
+            else:
+                self.normalize_fixes += 1
+                continue
 
             cmd_with_defaults = DEFAULT_COMMAND_FIELDS.copy()
             cmd_with_defaults.update(normalized_cmd)
             for key in ['ino_paths', 'py_paths', 'pdf_paths', 'img_paths']:
                 if not isinstance(cmd_with_defaults.get(key), list): cmd_with_defaults[key] = []
-            normalized_list.append(cmd_with_defaults)
+            if cmd_with_defaults != cmd_data: self.normalize_fixes += 1
+            normalized_list.append(Command(cmd_with_defaults))
         return normalized_list
 
     def _migrate_paths(self):
@@ -209,7 +688,7 @@ class TaskManager(ImportExportMixin, CommandMixin, TaskMixin): # Наследо
 
             folder_changed = False
             for command in commands: # Проходим по командам в папке
-                if not isinstance(command, dict): continue # Пропускаем некорректные
+                if not isinstance(command, Mapping): continue # Пропускаем некорректные
                 cmd_copy = command.copy() # Работаем с копией для сравнения
                 cmd_changed_internally = False
 
@@ -237,6 +716,7 @@ class TaskManager(ImportExportMixin, CommandMixin, TaskMixin): # Наследо
                 if cmd_changed_internally:
                     command.update(cmd_copy)
                     folder_changed = True
+                    self.normalize_fixes += 1
 
             if folder_changed: changed = True # Отмечаем, что были изменения в целом
 
@@ -245,6 +725,8 @@ class TaskManager(ImportExportMixin, CommandMixin, TaskMixin): # Наследо
 
     # --- Утилитарный метод ---
     def check_tasks_file_exists(self):
-        """Проверяет существование файла tasks.json."""
+        """Проверяет, есть ли сохраненные данные в выбранном хранилище (tasks.json, база или шарды)."""
+        if self._sqlite_store is not None: return self._sqlite_store.has_data()
+        if self._shard_store is not None: return self._shard_store.has_data()
         # Используем импортированную утилиту
         return check_file_exists(self.tasks_file)
@@ -4,7 +4,9 @@ from datetime import datetime
 from typing import Dict, Any, Optional, List, Tuple
 
 # Импортируем константы, относящиеся к задачам
-from .constants import PRIORITY_LEVELS, DEFAULT_TASK_FIELDS
+from .constants import PRIORITY_LEVELS, PENDING_PART, COMPLETED_PART
+from .shard_store import command_part
+from .records import Task, Subtask
 
 class TaskMixin:
     """Миксин для управления задачами и подзадачами."""
@@ -13,9 +15,8 @@ class TaskMixin:
         """Добавляет новую задачу."""
         if not name: return False # Просто возвращаем неуспех
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        # Используем дефолтные поля из констант
-        new_task = DEFAULT_TASK_FIELDS.copy()
-        new_task.update({
+        # Остальные поля - значения по умолчанию из констант
+        new_task = Task({
             'name': name,
             'status': 'Не выполнено', # Явно ставим статус
             'created_time': current_time,
@@ -23,8 +24,8 @@ class TaskMixin:
         })
         # Прямое добавление в список
         self.pending_tasks.append(new_task)
-        # Прямой вызов сохранения
-        return self.save_tasks()
+        # Фиксация изменения (журнал или сохранение)
+        return self._record_change('add_task', parts={PENDING_PART}, task=new_task)
 
     def add_subtask(self, task_idx, subtask_name, is_completed=False):
         """Добавляет подзадачу к существующей задаче."""
@@ -33,8 +34,10 @@ class TaskMixin:
         # Прямой доступ к задаче (может вызвать IndexError)
         task = task_list[task_idx]
         # Прямое добавление подзадачи (может вызвать KeyError или TypeError)
-        task.setdefault('subtasks', []).append({'name': subtask_name, 'completed': False})
-        return self.save_tasks() # Прямой вызов
+        new_subtask = Subtask({'name': subtask_name, 'completed': False})
+        task.setdefault('subtasks', []).append(new_subtask)
+        return self._record_change('add_subtask', parts={self._task_part(is_completed)},
+                                   completed=is_completed, task=task_idx, subtask=new_subtask)
 
     def toggle_subtask(self, task_idx, subtask_original_idx, is_completed=False):
         """Переключает статус выполнения подзадачи."""
@@ -42,7 +45,10 @@ class TaskMixin:
         # Прямой доступ к подзадаче (может вызвать IndexError/KeyError)
         subtask = task_list[task_idx]['subtasks'][subtask_original_idx]
         subtask['completed'] = not subtask['completed']
-        return self.save_tasks() # Прямой вызов
+        # В журнал пишем итоговое значение, а не факт переключения
+        return self._record_change('set_subtask', parts={self._task_part(is_completed)},
+                                   completed=is_completed, task=task_idx,
+                                   subtask=subtask_original_idx, value=subtask['completed'])
 
     def change_status(self, task_idx, new_status, is_completed=False):
         """Изменяет статус задачи и перемещает между списками."""
@@ -66,14 +72,18 @@ class TaskMixin:
             task['completed_time'] = None
 
         target_list.append(task) # Добавляем в целевой список
-        return self.save_tasks() # Прямой вызов
+        # Временные метки записываются в журнал, чтобы накат дал тот же результат
+        fields = {key: task.get(key) for key in ('status', 'started_time', 'completed_time')}
+        return self._record_change('change_status', parts={PENDING_PART, COMPLETED_PART},
+                                   completed=is_completed, task=task_idx, fields=fields)
 
     def change_priority(self, task_idx, priority, is_completed=False):
         """Изменяет приоритет задачи."""
         task_list = self.completed_tasks if is_completed else self.pending_tasks
         # Прямой доступ (может вызвать IndexError)
         task_list[task_idx]['priority'] = priority
-        return self.save_tasks() # Прямой вызов
+        return self._record_change('change_priority', parts={self._task_part(is_completed)},
+                                   completed=is_completed, task=task_idx, priority=priority)
 
     def delete_task(self, task_idx, is_completed=False):
         """Удаляет задачу."""
@@ -81,7 +91,8 @@ class TaskMixin:
         # Прямое удаление (может вызвать IndexError)
         task = task_list.pop(task_idx)
         # Возвращаем статус сохранения
-        return self.save_tasks() # Прямой вызов
+        return self._record_change('delete_task', parts={self._task_part(is_completed)},
+                                   completed=is_completed, task=task_idx)
 
     def sort_tasks(self, by='name'):
         """Сортирует списки задач."""
@@ -98,10 +109,26 @@ class TaskMixin:
             key_func = lambda x: priority_map.get(x.get('priority', 'Средний'), 99)
             reverse = False # Высокий (0) вверху
 
-        # Прямая сортировка списков
-        self.pending_tasks.sort(key=key_func, reverse=reverse)
-        self.completed_tasks.sort(key=key_func, reverse=reverse)
-        return self.save_tasks() # Прямой вызов
+        store = self._query_store()
+        if store is not None:
+            # Индексный запрос к базе вместо сортировки списков в Python
+            self.pending_tasks[:] = [self.pending_tasks[p] for p in store.task_positions('pending', by)]
+            self.completed_tasks[:] = [self.completed_tasks[p] for p in store.task_positions('completed', by)]
+        else:
+            # Прямая сортировка списков
+            self.pending_tasks.sort(key=key_func, reverse=reverse)
+            self.completed_tasks.sort(key=key_func, reverse=reverse)
+        return self.save_tasks(parts={PENDING_PART, COMPLETED_PART}) # Прямой вызов
+
+    def find_task_indices(self, text, is_completed=False):
+        """Индексы задач, в имени или описании которых встречается text."""
+        store = self._query_store()
+        if store is not None:
+            return store.search_task_positions('completed' if is_completed else 'pending', text)
+        needle = text.lower()
+        task_list = self.completed_tasks if is_completed else self.pending_tasks
+        return [idx for idx, t in enumerate(task_list)
+                if needle in t.get('name', '').lower() or needle in (t.get('description') or '').lower()]
 
     def update_description(self, item_manager_idx, description, is_task=True, is_completed=False, folder_key=None):
         """Обновляет описание задачи или команды."""
@@ -116,6 +143,140 @@ class TaskMixin:
         if isinstance(target_list, list) and 0 <= item_manager_idx < len(target_list):
              # Прямой доступ (может вызвать IndexError или KeyError, если элемент не словарь)
              target_list[item_manager_idx]['description'] = description
-             return self.save_tasks() # Прямой вызов
+             parts = {self._task_part(is_completed)} if is_task else {command_part(folder_key or 'root')}
+             return self._record_change('update_description', parts=parts, is_task=is_task, completed=is_completed,
+                                        folder=folder_key or 'root', index=item_manager_idx,
+                                        description=description)
+        else:
+             return False # Не нашли список или индекс неверен
+
+    # --- Варианты по постоянному ID (не зависят от сортировки списков) ---
+
+    def add_subtask_by_id(self, task_id, subtask_name):
+        """Добавляет подзадачу к задаче с данным ID."""
+        location = self.task_location(task_id)
+        if location is None: return False
+        is_completed, task_idx = location
+        return self.add_subtask(task_idx, subtask_name, is_completed)
+
+    def toggle_subtask_by_id(self, subtask_id):
+        """Переключает подзадачу с данным ID."""
+        location = self.subtask_location(subtask_id)
+        if location is None: return False
+        is_completed, task_idx, subtask_idx = location
+        return self.toggle_subtask(task_idx, subtask_idx, is_completed)
+
+    def change_status_by_id(self, task_id, new_status):
+        """Изменяет статус задачи с данным ID."""
+        location = self.task_location(task_id)
+        if location is None: return False
+        is_completed, task_idx = location
+        return self.change_status(task_idx, new_status, is_completed)
+
+    def change_priority_by_id(self, task_id, priority):
+        """Изменяет приоритет задачи с данным ID."""
+        location = self.task_location(task_id)
+        if location is None: return False
+        is_completed, task_idx = location
+        return self.change_priority(task_idx, priority, is_completed)
+
+    def delete_task_by_id(self, task_id):
+        """Удаляет задачу с данным ID."""
+        location = self.task_location(task_id)
+        if location is None: return False
+        is_completed, task_idx = location
+        return self.delete_task(task_idx, is_completed)
+
+    def update_description_by_id(self, record_id, description):
+        """Обновляет описание задачи или команды с данным ID."""
+        task_location = self.task_location(record_id)
+        if task_location is not None:
+            is_completed, task_idx = task_location
+            return self.update_description(task_idx, description, is_task=True, is_completed=is_completed)
+        command_location = self.command_location(record_id)
+        if command_location is not None:
+            folder_key, command_idx = command_location
+            return self.update_description(command_idx, description, is_task=False, folder_key=folder_key)
+        return False
+
+    # --- Пакетные операции (одна транзакция - одно сохранение) ---
+
+    def _task_locations(self, task_ids):
+        """Положения задач по ID: {is_completed: [индексы по возрастанию]}."""
+        locations = {False: [], True: []}
+        for task_id in task_ids:
+            location = self.task_location(task_id)
+            if location is not None: locations[location[0]].append(location[1])
+        return {is_completed: sorted(set(positions)) for is_completed, positions in locations.items()}
+
+    def add_tasks(self, names, priority="Средний"):
+        """Добавляет несколько задач одной транзакцией."""
+        names = [name for name in names if name]
+        if not names: return False
+        with self.transaction() as batch:
+            for name in names:
+                self.add_task(name, priority)
+        return batch.ok
+
+    def delete_tasks(self, task_ids):
+        """Удаляет задачи с данными ID одной транзакцией."""
+        with self.transaction() as batch:
+            for is_completed, positions in self._task_locations(task_ids).items():
+                # С конца списка: удаление не сдвигает еще не удаленные индексы
+                for task_idx in reversed(positions):
+                    self.delete_task(task_idx, is_completed)
+        return batch.ok
+
+    def change_priority_many(self, task_ids, priority):
+        """Изменяет приоритет задач с данными ID одной транзакцией."""
+        with self.transaction() as batch:
+            for is_completed, positions in self._task_locations(task_ids).items():
+                for task_idx in positions:
+                    self.change_priority(task_idx, priority, is_completed)
+        return batch.ok
+
+    def change_status_many(self, task_ids, new_status):
+        """Изменяет статус задач с данными ID одной транзакцией (порядок задач сохраняется)."""
+        with self.transaction() as batch:
+            for is_completed, positions in self._task_locations(task_ids).items():
+                # Каждая снятая задача сдвигает следующие на 1 влево (добавление идет в конец),
+                # а в целевой список задачи попадают в исходном порядке
+                for shift, task_idx in enumerate(positions):
+                    self.change_status(task_idx - shift, new_status, is_completed)
+        return batch.ok
+
+    # --- Накат записей журнала (без повторной фиксации) ---
+
+    def _replay_batch(self, record):
+        for sub_record in record['records']:
+            replay_method = getattr(self, f"_replay_{sub_record.get('op')}", None)
+            if replay_method is not None: replay_method(sub_record)
+
+    def _replay_add_task(self, record):
+        self.pending_tasks.append(Task(record['task']))
+
+    def _replay_add_subtask(self, record):
+        task = self._task_list(record['completed'])[record['task']]
+        task.setdefault('subtasks', []).append(Subtask(record['subtask']))
+
+    def _replay_set_subtask(self, record):
+        task = self._task_list(record['completed'])[record['task']]
+        task['subtasks'][record['subtask']]['completed'] = record['value']
+
+    def _replay_change_status(self, record):
+        task = self._task_list(record['completed']).pop(record['task'])
+        task.update(record['fields'])
+        self._task_list(task['status'] == "Выполнено").append(task)
+
+    def _replay_change_priority(self, record):
+        self._task_list(record['completed'])[record['task']]['priority'] = record['priority']
+
+    def _replay_delete_task(self, record):
+        self._task_list(record['completed']).pop(record['task'])
+
+    def _replay_update_description(self, record):
+        if record['is_task']:
+            target_list = self._task_list(record['completed'])
         else:
-             return False # Не нашли список или индекс неверен
\ No newline at end of file
+            target_list = self.useful_commands.get(record['folder'], [])
+        target_list[record['index']]['description'] = record['description']
\ No newline at end of file
@@ -0,0 +1,210 @@
+# zadachi/cods/trash.py
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from PySide6.QtCore import QObject, Signal
+
+from .constants import TRASH_RETENTION_HOURS, TRASH_PURGE_INTERVAL_S
+from .file_utils import find_unique_path, note_created
+
+ENTRY_FILE = "entry.json"
+PURGE_PREFIX = ".purge-" # Уже не восстанавливается: ждет удаления фоновым потоком
+NEW_PREFIX = ".new-"     # Запись собирается: появляется под своим ID одним переименованием вместе с entry.json
+
+
+class Trash(QObject):
+    """Корзина в папке задач: удаление - переименование (O(1)), место освобождает фоновый поток.
+
+    Запись корзины - папка <ID>/ с entry.json (что удалено и откуда) и перенесенными путями p0, p1, ...
+    Пока запись не старше retention_hours, ее можно мгновенно восстановить обратным переименованием.
+    """
+    purged = Signal(int) # Сколько записей удалено фоновым потоком (для сборки неиспользуемых блобов)
+
+    def __init__(self, root, tasks_folder, retention_hours=TRASH_RETENTION_HOURS):
+        super().__init__()
+        self.root = Path(root)
+        self.tasks_folder = Path(tasks_folder)
+        self.retention_s = retention_hours * 3600
+        self._retry_paths = set() # Пути вне корзины, которые не удалось удалить сразу (заняты)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    # --- Удаление и восстановление ---
+
+    def move_to_trash(self, paths, meta):
+        """Переносит пути (внутри папки задач) в новую запись корзины; meta - данные для восстановления.
+
+        Возвращает ID записи. Путь, который нельзя переименовать (занят или на другом диске), удаляется сразу.
+        """
+        entry_id = uuid.uuid4().hex
+        entry_dir = self.root / f"{NEW_PREFIX}{entry_id}"
+        entry_dir.mkdir(parents=True)
+        moved = []
+        # Вложенный путь переезжает вместе с родителем
+        paths = sorted({Path(path) for path in paths if Path(path).exists()}, key=lambda p: len(p.parts))
+        top_level = [path for path in paths if not any(parent in path.parents for parent in paths)]
+        for index, path in enumerate(top_level):
+            trash_name = f"p{index}"
+            try:
+                os.replace(path, entry_dir / trash_name)
+            except OSError as e:
+                logging.warning(f"Не удалось перенести '{path}' в корзину, удаление на месте: {e}")
+                self._remove_now(path)
+                continue
+            moved.append({'trash_name': trash_name, 'original': path.relative_to(self.tasks_folder).as_posix()})
+        meta = dict(meta, deleted_at=time.time(), paths=moved)
+        (entry_dir / ENTRY_FILE).write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        os.replace(entry_dir, self.root / entry_id)
+        self.start()
+        return entry_id
+
+    def restore(self, entry_id):
+        """Возвращает пути записи на место и удаляет запись; meta (фактический путь - в 'restored') или None."""
+        entry_dir = self.root / entry_id
+        meta = self._read_entry(entry_dir)
+        if meta is None: return None
+        for item in meta['paths']:
+            target = self.tasks_folder / item['original']
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists(): # Место заняли после удаления - рядом под свободным именем
+                target = find_unique_path(target)
+            item['restored'] = target.relative_to(self.tasks_folder).as_posix()
+            os.replace(entry_dir / item['trash_name'], target)
+            note_created(target)
+        shutil.rmtree(entry_dir, ignore_errors=True) # Остался только entry.json
+        return meta
+
+    def entries(self):
+        """Записи, которые еще можно восстановить: [(ID, meta)], новые первыми."""
+        if not self.root.is_dir(): return []
+        result = []
+        with os.scandir(self.root) as items:
+            for item in items:
+                if item.name.startswith((PURGE_PREFIX, NEW_PREFIX)) or not item.is_dir(follow_symlinks=False): continue
+                meta = self._read_entry(Path(item.path))
+                if meta is not None: result.append((item.name, meta))
+        return sorted(result, key=lambda pair: pair[1].get('deleted_at', 0), reverse=True)
+
+    def discard(self, path):
+        """Удаляет путь без ожидания: файл - сразу, папку - переименованием в корзину.
+
+        Если путь занят, повторные попытки идут в фоновом потоке. Возвращает, освободилось ли место пути.
+        """
+        path = Path(path)
+        if not path.exists(): return True
+        try:
+            if path.is_dir() and not path.is_symlink():
+                self.root.mkdir(parents=True, exist_ok=True)
+                os.replace(path, self.root / f"{PURGE_PREFIX}{uuid.uuid4().hex}")
+            else:
+                path.unlink()
+            self.start()
+            return True
+        except OSError as e:
+            logging.warning(f"'{path}' занят, удаление продолжится в фоне: {e}")
+            with self._lock:
+                self._retry_paths.add(path)
+            self.start()
+            return False
+
+    @staticmethod
+    def _read_entry(entry_dir):
+        try:
+            return json.loads((entry_dir / ENTRY_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _remove_now(path):
+        if path.is_dir() and not path.is_symlink(): shutil.rmtree(path)
+        else: path.unlink()
+
+    # --- Фоновая очистка ---
+
+    def start(self):
+        """Запускает фоновый поток очистки (если еще не запущен) и будит его."""
+        with self._lock:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._loop, name="TrashPurger", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self):
+        """Останавливает фоновую очистку (текущий проход дорабатывает); записи ждут следующего запуска."""
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None: thread.join()
+
+    def _loop(self):
+        while True:
+            self._wake.clear()
+            if self._stopped:
+                with self._lock:
+                    self._thread = None
+                return
+            try:
+                purged = self.purge()
+                if purged: self.purged.emit(purged)
+            except Exception: # В фоновом потоке исключение некому поймать
+                logging.exception("Ошибка очистки корзины")
+            if self._wake.wait(TRASH_PURGE_INTERVAL_S): continue
+            # Пока есть что дочищать - просыпаемся периодически, иначе поток завершается до нового удаления
+            with self._lock:
+                if not self._wake.is_set() and not self._has_work():
+                    self._thread = None
+                    return
+
+    def _has_work(self):
+        return bool(self._retry_paths) or (self.root.is_dir() and any(os.scandir(self.root)))
+
+    def purge(self, expired_only=True):
+        """Удаляет записи старше срока хранения (все - при expired_only=False); число удаленных записей."""
+        with self._lock:
+            retry_paths, self._retry_paths = self._retry_paths, set()
+        for path in retry_paths:
+            try:
+                if path.exists(): self._remove_now(path)
+            except OSError:
+                with self._lock:
+                    self._retry_paths.add(path) # Все еще занят - в следующий раз
+        if not self.root.is_dir(): return 0
+        now = time.time()
+        purged = 0
+        with os.scandir(self.root) as items:
+            items = list(items)
+        for item in items:
+            path = Path(item.path)
+            if item.name.startswith(NEW_PREFIX):
+                # Собирается сейчас; остаток прерванного удаления - после паузы очистки
+                try:
+                    if now - item.stat(follow_symlinks=False).st_mtime < TRASH_PURGE_INTERVAL_S: continue
+                except OSError:
+                    continue # Уже переименована в запись
+            elif not item.name.startswith(PURGE_PREFIX):
+                meta = self._read_entry(path)
+                if expired_only and meta is not None and now - meta.get('deleted_at', 0) < self.retention_s:
+                    continue
+                # Сначала переименование: восстановление не увидит наполовину удаленную запись
+                doomed = self.root / f"{PURGE_PREFIX}{item.name}"
+                try:
+                    os.replace(path, doomed)
+                except OSError:
+                    continue
+                path = doomed
+            try:
+                self._remove_now(path)
+                purged += 1
+            except OSError as e:
+                logging.warning(f"Не удалось очистить '{path.name}' из корзины, повтор позже: {e}")
+        return purged
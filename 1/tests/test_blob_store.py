@@ -0,0 +1,53 @@
+# zadachi/tests/test_blob_store.py
+"""Вложения-ссылки на блобы: правка одной команды не меняет одинаковое вложение другой.
+
+Запуск из папки проекта: python -m pytest tests
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cods.blob_store import BlobStore
+from cods import file_utils
+
+
+def linked_pair(tmp_path):
+    """Хранилище и одинаковое вложение двух команд (одна жесткая ссылка на блоб)."""
+    store = BlobStore(tmp_path / ".blobs")
+    source = tmp_path / "source.txt"
+    source.write_text("общее содержимое", encoding='utf-8')
+    first, second = tmp_path / "cmd1" / "note.txt", tmp_path / "cmd2" / "note.txt"
+    for target in (first, second):
+        target.parent.mkdir()
+        assert store.store_file(source, target)
+    assert os.stat(first).st_ino == os.stat(second).st_ino
+    return store, source, first, second
+
+
+def test_edit_after_detach_keeps_other_copy(tmp_path):
+    store, _, first, second = linked_pair(tmp_path)
+    assert store.detach(first)
+    first.write_text("правка первой команды", encoding='utf-8')
+    assert second.read_text(encoding='utf-8') == "общее содержимое"
+
+
+def test_sync_overwrite_keeps_other_copy(tmp_path):
+    _, _, first, second = linked_pair(tmp_path)
+    updated = tmp_path / "updated.txt"
+    updated.write_text("новая версия", encoding='utf-8')
+    file_utils.set_blob_store(None) # Обычное копирование поверх файла-ссылки
+    file_utils._copy_file_data(updated, first)
+    assert first.read_text(encoding='utf-8') == "новая версия"
+    assert second.read_text(encoding='utf-8') == "общее содержимое"
+
+
+def test_blob_edited_in_place_is_not_linked_again(tmp_path):
+    store, source, first, second = linked_pair(tmp_path)
+    first.write_text("правка в обход detach", encoding='utf-8') # Меняет блоб и вторую ссылку
+    third = tmp_path / "cmd3" / "note.txt"
+    third.parent.mkdir()
+    assert store.store_file(source, third)
+    assert third.read_text(encoding='utf-8') == "общее содержимое"
+    assert os.stat(third).st_ino != os.stat(first).st_ino
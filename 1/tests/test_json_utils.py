@@ -0,0 +1,52 @@
+# zadachi/tests/test_json_utils.py
+"""Отложенный список выполненных в tasks.json: находится без разбора в обоих форматах записи.
+
+Запуск из папки проекта: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cods import json_utils
+from cods.json_utils import RawJSON, _decode_json, _load_json_fingerprinted, _save_json
+
+
+def tasks_data():
+    """Выполненные задачи с подзадачами: у подзадач тот же ключ 'completed'."""
+    subtasks = [{'id': 's1', 'name': 'шаг "completed":[1]', 'completed': True},
+                {'id': 's2', 'name': 'шаг 2', 'completed': False}]
+    return {
+        'version': '1.1',
+        'pending': [{'id': 'p1', 'name': 'открытая', 'subtasks': [dict(subtasks[1], id='s3')]}],
+        'completed': [{'id': 'c1', 'name': 'готовая', 'subtasks': subtasks},
+                      {'id': 'c2', 'name': 'без подзадач', 'subtasks': []}],
+    }
+
+
+@pytest.fixture(params=[False, True], ids=['indent', 'compact'])
+def json_format(request):
+    json_utils.set_json_compact(request.param)
+    yield request.param
+    json_utils.set_json_compact(False)
+
+
+def test_completed_is_deferred_and_round_trips(tmp_path, json_format):
+    path = tmp_path / "tasks.json"
+    data = tasks_data()
+    assert _save_json(path, data)
+
+    loaded, _ = _load_json_fingerprinted(path, defer_key='completed')
+    assert isinstance(loaded['completed'], RawJSON) # Не разобран при загрузке
+    assert _decode_json(loaded['completed']) == data['completed']
+    assert loaded['pending'] == data['pending']
+
+    # Неразобранный список записывается теми же байтами и снова находится при чтении
+    loaded['pending'].append({'id': 'p2', 'name': 'новая', 'subtasks': []})
+    assert _save_json(path, loaded)
+    reloaded, _ = _load_json_fingerprinted(path, defer_key='completed')
+    assert isinstance(reloaded['completed'], RawJSON)
+    assert _decode_json(reloaded['completed']) == data['completed']
+    assert _decode_json(path.read_bytes())['pending'] == loaded['pending']